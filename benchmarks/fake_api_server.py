@@ -0,0 +1,312 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import yaml
+
+# In-memory stand-in for the parts of the Kubernetes API the scripts use:
+# profiles, namespaces (with a Terminating phase), the Dex ConfigMap and the
+# Dex Deployment (with a rollout that becomes Ready after a delay). With
+# --throttle-rate a share of requests is answered 429, like an overloaded
+# API server. With --workloads every profile gets a notebook, statefulset, pod
+# and volume claim, and a namespace stays Terminating while any are left.
+
+store = {}
+store_lock = threading.Lock()
+resource_version = 0
+# (resource version, event type, path, object) for every change, so watches
+# can start from the resourceVersion a client listed at
+events = []
+options = None
+
+def next_resource_version():
+    global resource_version
+    resource_version += 1
+    return str(resource_version)
+
+def merge(target, patch):
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+def parent(path):
+    return path.rsplit('/', 1)[0]
+
+def is_namespace(path):
+    return path.startswith('/api/v1/namespaces/') and path.count('/') == 4
+
+def set_object(path, obj):
+    obj.setdefault('metadata', {})['resourceVersion'] = next_resource_version()
+    event_type = 'MODIFIED' if path in store else 'ADDED'
+    store[path] = obj
+    events.append((int(resource_version), event_type, path, json.dumps(obj)))
+
+def touch_object(path):
+    obj = store[path]
+    obj['metadata']['resourceVersion'] = next_resource_version()
+    events.append((int(resource_version), 'MODIFIED', path, json.dumps(obj)))
+
+def remove_object(path):
+    obj = store.pop(path, None)
+    if obj is not None:
+        next_resource_version()
+        events.append((int(resource_version), 'DELETED', path, json.dumps(obj)))
+    return obj
+
+def finish_rollout(path):
+    with store_lock:
+        deployment = store.get(path)
+        if deployment is not None:
+            deployment['status'] = dict(deployment['status'], updatedReplicas=1, availableReplicas=1)
+            touch_object(path)
+
+def namespace_contents(path):
+    marker = f"/namespaces/{path.rsplit('/', 1)[1]}/"
+    return [key for key in store if marker in key]
+
+def finish_termination(path):
+    with store_lock:
+        if path in store and namespace_contents(path):
+            # Held by the finalizers of what is still inside
+            threading.Timer(options.terminate_delay, finish_termination, (path,)).start()
+            return
+        remove_object(path)
+
+def finish_deletion(path):
+    with store_lock:
+        remove_object(path)
+
+def seed_workloads(namespace):
+    notebook = f'{namespace}-notebook'
+    objects = {
+        f'/apis/kubeflow.org/v1/namespaces/{namespace}/notebooks/{notebook}': {'kind': 'Notebook'},
+        f'/apis/apps/v1/namespaces/{namespace}/statefulsets/{notebook}': {'kind': 'StatefulSet'},
+        f'/api/v1/namespaces/{namespace}/pods/{notebook}-0': {'kind': 'Pod'},
+        f'/api/v1/namespaces/{namespace}/persistentvolumeclaims/{notebook}-workspace': {
+            'kind': 'PersistentVolumeClaim', 'spec': {'volumeName': f'pvc-{random.getrandbits(64):016x}'}},
+    }
+    for path, obj in objects.items():
+        obj['metadata'] = {'name': path.rsplit('/', 1)[1], 'namespace': namespace}
+        set_object(path, obj)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, obj):
+        data = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self):
+        self.send(404, {'kind': 'Status', 'reason': 'NotFound', 'message': f'{self.path} not found'})
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def route(self):
+        # Returns (path, query), or None once a 429 has been sent instead
+        parts = urlsplit(self.path)
+        if options.latency:
+            time.sleep(options.latency)
+        if options.throttle_rate and random.random() < options.throttle_rate:
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            data = json.dumps({'kind': 'Status', 'code': 429, 'reason': 'TooManyRequests',
+                               'message': 'the server has received too many requests and has asked us to try again later'}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(data)
+            return None
+        return parts.path, parse_qs(parts.query)
+
+    def write_event(self, event_type, obj):
+        event = json.dumps({'type': event_type, 'object': json.loads(obj)}).encode('utf-8') + b'\n'
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(event), event))
+        self.wfile.flush()
+
+    def watch(self, path, query):
+        name = query.get('fieldSelector', ['metadata.name='])[0].split('=', 1)[1]
+        deadline = time.monotonic() + int(query.get('timeoutSeconds', ['60'])[0])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        with store_lock:
+            if 'resourceVersion' in query:
+                since = int(query['resourceVersion'][0])
+                position = next((i for i, event in enumerate(events) if event[0] > since), len(events))
+            else:
+                # Without a resourceVersion a watch starts with the current objects
+                position = len(events)
+                initial = [json.dumps(obj) for key, obj in store.items()
+                           if parent(key) == path and (not name or key.rsplit('/', 1)[1] == name)]
+        try:
+            if 'resourceVersion' not in query:
+                for obj in initial:
+                    self.write_event('ADDED', obj)
+            while time.monotonic() < deadline:
+                with store_lock:
+                    pending = events[position:]
+                    position = len(events)
+                for _, event_type, key, obj in pending:
+                    if parent(key) == path and (not name or key.rsplit('/', 1)[1] == name):
+                        self.write_event(event_type, obj)
+                time.sleep(0.02)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped watching
+            self.close_connection = True
+
+    def do_GET(self):
+        route = self.route()
+        if route is None:
+            return
+        path, query = route
+        if query.get('watch') == ['1']:
+            return self.watch(path, query)
+
+        with store_lock:
+            if path in store:
+                return self.send(200, store[path])
+            items = [obj for key, obj in store.items() if parent(key) == path]
+        if items or path.endswith('s'):
+            return self.send(200, {'metadata': {'resourceVersion': str(resource_version)}, 'items': items})
+        self.not_found()
+
+    def do_POST(self):
+        route = self.route()
+        if route is None:
+            return
+        path, _ = route
+        obj = self.read_body()
+        name = obj['metadata']['name']
+        with store_lock:
+            if f'{path}/{name}' in store:
+                return self.send(409, {'kind': 'Status', 'reason': 'AlreadyExists', 'message': f'{name} already exists'})
+            set_object(f'{path}/{name}', obj)
+            if obj.get('kind') == 'Profile':
+                # The profile controller creates the user's namespace
+                set_object(f'/api/v1/namespaces/{name}', {'kind': 'Namespace', 'metadata': {'name': name}})
+                if options.workloads:
+                    seed_workloads(name)
+        self.send(201, obj)
+
+    def do_PUT(self):
+        route = self.route()
+        if route is None:
+            return
+        path, _ = route
+        obj = self.read_body()
+        with store_lock:
+            set_object(path, obj)
+        self.send(200, obj)
+
+    def do_PATCH(self):
+        route = self.route()
+        if route is None:
+            return
+        path, _ = route
+        patch = self.read_body()
+        with store_lock:
+            if path not in store:
+                return self.not_found()
+            obj = store[path]
+            merge(obj, patch)
+            if is_namespace(path) and obj.get('status', {}).get('phase') == 'Terminating' and not obj['metadata'].get('finalizers'):
+                # Removing the finalizers of a Terminating namespace lets it go
+                remove_object(path)
+                return self.send(200, obj)
+            if '/deployments/' in path:
+                generation = obj['metadata'].get('generation', 1) + 1
+                obj['metadata']['generation'] = generation
+                obj['status'] = {'observedGeneration': generation, 'replicas': 1, 'updatedReplicas': 0, 'availableReplicas': 0}
+                threading.Timer(options.rollout_delay, finish_rollout, (path,)).start()
+            touch_object(path)
+        self.send(200, obj)
+
+    def do_DELETE(self):
+        route = self.route()
+        if route is None:
+            return
+        path, _ = route
+        self.read_body()
+        with store_lock:
+            children = [key for key in store if parent(key) == path]
+            if path not in store and children:
+                # deletecollection: every object goes after its grace period
+                for key in children:
+                    store[key]['metadata']['deletionTimestamp'] = '1970-01-01T00:00:00Z'
+                    touch_object(key)
+                    delay = random.uniform(options.terminate_delay / 2, options.terminate_delay * 1.5)
+                    threading.Timer(delay, finish_deletion, (key,)).start()
+                return self.send(200, {'kind': 'List', 'items': [store[key] for key in children]})
+            if path not in store:
+                return self.not_found()
+            if is_namespace(path):
+                obj = store[path]
+                if obj.get('status', {}).get('phase') == 'Terminating':
+                    return self.send(200, obj)
+                obj.setdefault('status', {})['phase'] = 'Terminating'
+                touch_object(path)
+                delay = random.uniform(options.terminate_delay / 2, options.terminate_delay * 1.5)
+                threading.Timer(delay, finish_termination, (path,)).start()
+                return self.send(200, obj)
+            obj = remove_object(path)
+        self.send(200, obj)
+
+def seed(dex_config_path):
+    with open(dex_config_path, 'r') as file:
+        set_object('/api/v1/namespaces/auth/configmaps/dex', yaml.safe_load(file))
+    set_object('/apis/apps/v1/namespaces/auth/deployments/dex', {
+        'kind': 'Deployment',
+        'metadata': {'name': 'dex', 'namespace': 'auth', 'generation': 1},
+        'spec': {'replicas': 1, 'template': {'metadata': {}}},
+        'status': {'observedGeneration': 1, 'replicas': 1, 'updatedReplicas': 1, 'availableReplicas': 1}
+    })
+
+def main():
+    global options
+    parser = argparse.ArgumentParser(description="Fake Kubernetes API server for benchmarks.")
+    parser.add_argument('--port', type=int, default=0, help="port to listen on (default: any free port)")
+    parser.add_argument('--dex-config', required=True, help="Dex ConfigMap YAML to serve as auth/dex")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--terminate-delay', type=float, default=0.2,
+                        help="average seconds a deleted namespace stays Terminating")
+    parser.add_argument('--rollout-delay', type=float, default=0.2,
+                        help="seconds a Dex restart takes to become Ready")
+    parser.add_argument('--workloads', action='store_true',
+                        help="give every profile a notebook, statefulset, pod and volume claim that hold its namespace")
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="share of requests answered with 429 Too Many Requests (default: 0)")
+    options = parser.parse_args()
+
+    seed(options.dex_config)
+    server = ThreadingHTTPServer(('127.0.0.1', options.port), Handler)
+    server.daemon_threads = True
+    # The harness reads the chosen port from the first line of output
+    print(server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
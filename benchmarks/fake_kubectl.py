@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import fcntl
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+
+# Stand-in for `kubectl` covering the commands the scripts run. Each call
+# sleeps FAKE_KUBECTL_LATENCY seconds to model the API round trip; the Dex
+# ConfigMap, Dex Password objects and applied profiles (with the namespace
+# the profile controller would create) are kept in FAKE_KUBECTL_STATE so
+# applied changes are read back. FAKE_KUBECTL_THROTTLE is the share of calls
+# that fail the way kubectl reports a 429. `--context=X` gives each context
+# its own state under contexts/X, starting from the shared Dex ConfigMap.
+
+PASSWORDS = 'passwords.dex.coreos.com'
+PROFILES = 'profiles.kubeflow.org'
+NAMESPACES = ('namespace', 'namespaces', 'ns')
+
+context = None
+
+def state_path(name):
+    state = os.environ['FAKE_KUBECTL_STATE']
+    if context is None:
+        return os.path.join(state, name)
+    context_state = os.path.join(state, 'contexts', context)
+    if not os.path.isdir(context_state):
+        os.makedirs(context_state, exist_ok=True)
+        shutil.copy(os.path.join(state, 'dex-configmap.yaml'), context_state)
+    return os.path.join(context_state, name)
+
+def load_passwords():
+    try:
+        with open(state_path('passwords.json'), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def save_passwords(passwords):
+    with open(state_path('passwords.json'), 'w') as file:
+        json.dump(passwords, file)
+
+def update_objects(change):
+    # Parallel kubectl processes share objects.json, so updates are locked
+    with open(state_path('objects.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(state_path('objects.json'), 'r') as file:
+                objects = json.load(file)
+        except FileNotFoundError:
+            objects = {'profiles': {}, 'namespaces': {}}
+        result = change(objects)
+        with open(state_path('objects.json'), 'w') as file:
+            json.dump(objects, file)
+    return result
+
+def load_objects():
+    return update_objects(lambda objects: objects)
+
+def apply_profiles(data):
+    import yaml
+    def change(objects):
+        names = []
+        for profile in yaml.safe_load_all(data):
+            if not profile:
+                continue
+            name = profile['metadata']['name']
+            objects['profiles'][name] = profile
+            objects['namespaces'][name] = {'kind': 'Namespace', 'metadata': {'name': name}, 'status': {'phase': 'Active'}}
+            names.append(name)
+        return names
+    return update_objects(change)
+
+def merge(target, patch):
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+def patch_profile(name, patch):
+    def change(objects):
+        if name not in objects['profiles']:
+            return False
+        merge(objects['profiles'][name], patch)
+        return True
+    return update_objects(change)
+
+def delete_objects(kind, names):
+    return update_objects(lambda objects: [name for name in names if objects[kind].pop(name, None) is not None])
+
+def apply(args):
+    path = args[args.index('-f') + 1]
+    data = sys.stdin.read() if path == '-' else open(path, 'r').read()
+    if data.startswith('{'):
+        passwords = load_passwords()
+        for item in json.loads(data)['items']:
+            passwords[item['metadata']['name']] = item
+            print(f"password.dex.coreos.com/{item['metadata']['name']} configured")
+        save_passwords(passwords)
+        return 0
+    if re.search(r'^kind: ConfigMap', data, re.M):
+        with open(state_path('dex-configmap.yaml'), 'w') as file:
+            file.write(data)
+        print('configmap/dex configured')
+        return 0
+
+    for name in apply_profiles(data):
+        print(f'profile.kubeflow.org/{name} created')
+    return 0
+
+def get(args):
+    if args[1] == 'configmap':
+        with open(state_path('dex-configmap.yaml'), 'r') as file:
+            sys.stdout.write(file.read())
+        return 0
+    if args[1] == PASSWORDS:
+        print(json.dumps({'items': list(load_passwords().values())}))
+        return 0
+    kind = 'profiles' if args[1] == PROFILES else 'namespaces' if args[1] in NAMESPACES else None
+    if kind is not None:
+        objects = load_objects()[kind]
+        output = args[args.index('-o') + 1] if '-o' in args else None
+        names = [arg for arg in args[2:] if not arg.startswith('-') and arg not in ('json', 'name')]
+        if output == 'json' and not names:
+            print(json.dumps({'items': list(objects.values())}))
+        elif output == 'name':
+            for name in names:
+                if name in objects:
+                    print(f"{args[1]}/{name}")
+        return 0
+    return 0
+
+def main():
+    global context
+    time.sleep(float(os.environ.get('FAKE_KUBECTL_LATENCY', '0')))
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--context=')]
+    context = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--context=')), None)
+    if not args:
+        return 1
+    if args[0] != 'wait' and random.random() < float(os.environ.get('FAKE_KUBECTL_THROTTLE', '0')):
+        sys.stderr.write("Error from server (TooManyRequests): the server has received too many requests "
+                         "and has asked us to try again later\n")
+        return 1
+    if args[0] == 'apply':
+        return apply(args)
+    if args[0] == 'get':
+        return get(args)
+    if args[0] == 'rollout' and args[1] == 'restart':
+        print('deployment.apps/dex restarted')
+    elif args[0] == 'rollout' and args[1] == 'status':
+        print('deployment "dex" successfully rolled out')
+    elif args[0] == 'patch' and args[1] == PROFILES:
+        if not patch_profile(args[2], json.loads(args[args.index('-p') + 1])):
+            sys.stderr.write(f'Error from server (NotFound): profiles.kubeflow.org "{args[2]}" not found\n')
+            return 1
+        print(f'profile.kubeflow.org/{args[2]} patched')
+    elif args[0] == 'delete' and args[1] == PASSWORDS:
+        passwords = load_passwords()
+        for name in args[2:]:
+            if not name.startswith('-') and passwords.pop(name, None) is not None:
+                print(f'password.dex.coreos.com "{name}" deleted')
+        save_passwords(passwords)
+    elif args[0] == 'delete' and (args[1] == PROFILES or args[1] in NAMESPACES):
+        kind = 'profiles' if args[1] == PROFILES else 'namespaces'
+        # Deleted resources are gone by the time they are looked up again
+        for name in delete_objects(kind, [arg for arg in args[2:] if not arg.startswith('-')]):
+            print(f'{args[1]} "{name}" deleted')
+    elif args[0] == 'delete':
+        print(f'{args[1]} "{args[2]}" deleted')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BULK_DIR = os.path.join(REPO_DIR, 'Bulk-user-creation-deletion')
+
+DEX_CONFIGMAP = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: dex
+  namespace: auth
+data:
+  config.yaml: |
+    issuer: http://dex.auth.svc.cluster.local:5556/dex
+    storage:
+      type: kubernetes
+      config:
+        inCluster: true
+    enablePasswordDB: true
+    staticPasswords: []
+"""
+
+# Answers to the bulk command's prompts: name, tag, count, cpu, memory, GPU memory, GPU count, storage
+CLASS_ANSWERS = "Benchmark\n{tag}\n{users}\n2\n4\n1\n1\n10\n"
+
+def parse_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def make_sandbox():
+    # Each run gets a private data directory with an empty registry and Dex config
+    sandbox = tempfile.mkdtemp(prefix='kubeflow-bench-')
+    os.makedirs(os.path.join(sandbox, 'manifests'))
+    shutil.copy(os.path.join(BULK_DIR, 'manifests', 'create-user-template.yaml'), os.path.join(sandbox, 'manifests'))
+    os.makedirs(os.path.join(sandbox, 'users'))
+    os.makedirs(os.path.join(sandbox, 'state'))
+    os.makedirs(os.path.join(sandbox, 'bin'))
+    with open(os.path.join(sandbox, 'state', 'dex-configmap.yaml'), 'w') as file:
+        file.write(DEX_CONFIGMAP)
+
+    kubectl = os.path.join(sandbox, 'bin', 'kubectl')
+    with open(kubectl, 'w') as file:
+        file.write(f"#!/bin/sh\nexec {sys.executable} {os.path.join(BENCH_DIR, 'fake_kubectl.py')} \"$@\"\n")
+    os.chmod(kubectl, 0o755)
+    return sandbox
+
+def start_api_server(sandbox, args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_api_server.py'),
+         '--dex-config', os.path.join(sandbox, 'state', 'dex-configmap.yaml'),
+         '--latency', str(args.latency), '--terminate-delay', str(args.terminate_delay),
+         '--rollout-delay', str(args.rollout_delay), '--throttle-rate', str(args.throttle_rate)]
+        + (['--workloads'] if args.workloads else []),
+        stdout=subprocess.PIPE, text=True
+    )
+    port = int(process.stdout.readline())
+    return process, f'http://127.0.0.1:{port}'
+
+def script_env(sandbox, backend, server, args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    env['PATH'] = os.path.join(sandbox, 'bin') + os.pathsep + env.get('PATH', '')
+    env['FAKE_KUBECTL_STATE'] = os.path.join(sandbox, 'state')
+    env['FAKE_KUBECTL_LATENCY'] = str(args.latency)
+    env['FAKE_KUBECTL_THROTTLE'] = str(args.throttle_rate)
+    env.pop('KUBE_API_SERVER', None)
+    if backend == 'api':
+        env['KUBE_API_SERVER'] = server
+        env.pop('KUBE_CLIENT', None)
+    else:
+        env['KUBE_CLIENT'] = 'kubectl'
+    return env
+
+def run_script(sandbox, env, command, answers, timeout):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-m', 'kubeflow_users', '--data-dir', sandbox] + command, cwd=sandbox,
+                            env=env, input=answers, capture_output=True, text=True, timeout=timeout)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.stderr.write(result.stdout[-2000:] + result.stderr[-2000:])
+    return elapsed, result
+
+def record(output, benchmark, **fields):
+    entry = dict({'benchmark': benchmark}, **fields)
+    output.write(json.dumps(entry) + '\n')
+    output.flush()
+    summary = ', '.join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}" for key, value in fields.items())
+    print(f"{benchmark}: {summary}", file=sys.stderr)
+
+def bench_end_to_end(args, output):
+    for backend in args.backends:
+        for users in args.users:
+            sandbox = make_sandbox()
+            server_process, server = (start_api_server(sandbox, args) if backend == 'api' else (None, None))
+            try:
+                env = script_env(sandbox, backend, server, args)
+                tag = f'bench{users}'
+
+                create = ['bulk', '--restart-window', '0', '--bcrypt-rounds', str(args.e2e_bcrypt_rounds)]
+                create += ['--batch'] if args.batch else ['--concurrency', str(args.concurrency)]
+                create += ['--dex-backend', args.dex_backend]
+                elapsed, result = run_script(sandbox, env, create, CLASS_ANSWERS.format(tag=tag, users=users), args.timeout)
+                record(output, 'bulk_create', backend=backend, dex_backend=args.dex_backend, throttle_rate=args.throttle_rate,
+                       users=users, seconds=elapsed,
+                       users_per_second=users / elapsed, ok=result.returncode == 0 and 'completed successfully' in result.stdout)
+
+                delete = ['delete', '--class', tag, '--restart-window', '0', '--parallel', str(args.parallel),
+                          '--dex-backend', args.dex_backend]
+                elapsed, result = run_script(sandbox, env, delete, 'yes\n', args.timeout)
+                record(output, 'bulk_delete', backend=backend, dex_backend=args.dex_backend, throttle_rate=args.throttle_rate,
+                       workloads=args.workloads, users=users, seconds=elapsed,
+                       users_per_second=users / elapsed, ok=result.returncode == 0)
+            finally:
+                if server_process is not None:
+                    server_process.terminate()
+                    server_process.wait()
+                shutil.rmtree(sandbox, ignore_errors=True)
+
+def run_worker(args, worker, extra):
+    # Micro-benchmarks run in a fresh interpreter so module-level state
+    # (registry paths, cached SQLite connections) starts clean each time
+    sandbox = make_sandbox()
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), worker, '--sandbox', sandbox] + extra,
+                                capture_output=True, text=True, timeout=args.timeout)
+        if result.returncode != 0:
+            sys.stderr.write(result.stderr[-2000:])
+            return []
+        return [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+    finally:
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+def bench_dex(args, output):
+    for rounds in args.bcrypt_rounds:
+        for users in args.dex_users:
+            for entry in run_worker(args, 'dex-worker', ['--rounds', str(rounds), '--users', str(users)]):
+                record(output, 'update_dex_config', **entry)
+
+def bench_registry(args, output):
+    for backend in ('json', 'sqlite'):
+        for size in args.registry_sizes:
+            for entry in run_worker(args, 'registry-worker', ['--backend', backend, '--size', str(size),
+                                                               '--ops', str(args.registry_ops)]):
+                record(output, 'user_registry', **entry)
+
+def enter_sandbox(sandbox):
+    sys.path.insert(0, REPO_DIR)
+    from kubeflow_users import paths
+    paths.set_data_dir(sandbox)
+
+def dex_worker(worker_args):
+    enter_sandbox(worker_args.sandbox)
+    from kubeflow_users.bulk import generate_password
+    from kubeflow_users.dex import update_dex_config
+    users_data = [{'username': f'bench-{i}', 'user_email': f'bench-{i}@example.com', 'password': generate_password()}
+                  for i in range(1, worker_args.users + 1)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        updated = update_dex_config(DEX_CONFIGMAP, users_data, worker_args.rounds)
+        elapsed = time.perf_counter() - start
+    print(json.dumps({'users': worker_args.users, 'bcrypt_rounds': worker_args.rounds, 'seconds': elapsed,
+                      'users_per_second': worker_args.users / elapsed, 'ok': updated is not None}))
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def add_users_batch(user_registry, count):
+    with user_registry.batch():
+        for i in range(count):
+            user_registry.add_user(f'batch-{i}', f'batch-{i}@example.com', 'x', 'bench')
+
+def registry_worker(worker_args):
+    enter_sandbox(worker_args.sandbox)
+    # Build the starting registry directly, then time the module's own operations
+    now = datetime.now().isoformat()
+    existing = [{'username': f'old{i // 100}-{i}', 'email': f'old-{i}@example.com', 'password': 'x',
+                 'class_tag': f'old{i // 100}', 'creation_time': now, 'deletion_time': None}
+                for i in range(worker_args.size)]
+    from kubeflow_users import paths, registry_db
+    from kubeflow_users import registry as user_registry
+    with open(paths.registry_file(), 'w') as file:
+        json.dump({'classes': {}, 'users': existing}, file)
+
+    if worker_args.backend == 'sqlite':
+        registry_db.import_json_registry(paths.registry_file(), paths.registry_db_file())
+
+    ops = worker_args.ops
+    timings = {
+        'add_class': timed(user_registry.add_class, 'Benchmark', 'bench', ops, '2', '4Gi', '1', '1', '10Gi'),
+        'add_user': sum(timed(user_registry.add_user, f'bench-{i}', f'bench-{i}@example.com', 'x', 'bench')
+                        for i in range(ops)) / ops,
+        'get_class_info': timed(user_registry.get_class_info, 'bench'),
+        'get_active_users': timed(user_registry.get_active_users, 'bench'),
+        'get_users_by_class': timed(user_registry.get_users_by_class, 'bench'),
+        'mark_user_deleted': sum(timed(user_registry.mark_user_deleted, f'bench-{i}') for i in range(ops)) / ops,
+        # Per user, with every add in one batch() as bulk does for a chunk
+        'add_user_batch': timed(add_users_batch, user_registry, ops) / ops,
+    }
+    for operation, seconds in timings.items():
+        print(json.dumps({'backend': worker_args.backend, 'registry_users': worker_args.size,
+                          'operation': operation, 'seconds': seconds}))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk commands against a fake kubectl and a fake API server.")
+    parser.add_argument('--output', default='-', help="JSON-lines results file (default: stdout)")
+    parser.add_argument('--suites', default='e2e,dex,registry', help="comma-separated suites to run (default: e2e,dex,registry)")
+    parser.add_argument('--backends', default='kubectl,api', help="backends for end-to-end runs (default: kubectl,api)")
+    parser.add_argument('--users', type=parse_list, default=[10, 100, 1000],
+                        help="class sizes for end-to-end runs (default: 10,100,1000)")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds added to every kubectl call and API request (default: 0.05)")
+    parser.add_argument('--terminate-delay', type=float, default=0.2,
+                        help="average seconds a namespace stays Terminating on the fake API server (default: 0.2)")
+    parser.add_argument('--rollout-delay', type=float, default=0.2,
+                        help="seconds a Dex restart takes on the fake API server (default: 0.2)")
+    parser.add_argument('--workloads', action='store_true',
+                        help="give every user a notebook, statefulset, pod and volume claim on the fake API server")
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="share of fake API calls answered with 429 Too Many Requests (default: 0)")
+    parser.add_argument('--concurrency', type=int, default=8, help="bulk --concurrency (default: 8)")
+    parser.add_argument('--batch', action='store_true', help="run bulk with --batch instead of --concurrency")
+    parser.add_argument('--parallel', type=int, default=8, help="delete --parallel (default: 8)")
+    parser.add_argument('--dex-backend', choices=('configmap', 'crd'), default='configmap',
+                        help="where end-to-end runs store Dex logins (default: configmap)")
+    parser.add_argument('--e2e-bcrypt-rounds', type=int, default=10,
+                        help="bcrypt cost for end-to-end runs, kept low so hashing does not dominate (default: 10)")
+    parser.add_argument('--bcrypt-rounds', type=parse_list, default=[10, 12],
+                        help="bcrypt costs for the update_dex_config suite (default: 10,12)")
+    parser.add_argument('--dex-users', type=parse_list, default=[10, 100],
+                        help="users per update_dex_config run (default: 10,100)")
+    parser.add_argument('--registry-sizes', type=parse_list, default=[100, 1000, 10000],
+                        help="existing registry sizes for the user_registry suite (default: 100,1000,10000)")
+    parser.add_argument('--registry-ops', type=int, default=20,
+                        help="writes averaged per registry operation (default: 20)")
+    parser.add_argument('--timeout', type=int, default=3600, help="seconds allowed per script run (default: 3600)")
+    args = parser.parse_args()
+    args.suites = args.suites.split(',')
+    args.backends = args.backends.split(',')
+    return args
+
+def parse_worker_args(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('worker')
+    parser.add_argument('--sandbox', required=True)
+    parser.add_argument('--rounds', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--backend')
+    parser.add_argument('--size', type=int)
+    parser.add_argument('--ops', type=int)
+    return parser.parse_args(argv)
+
+WORKERS = {'dex-worker': dex_worker, 'registry-worker': registry_worker}
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in WORKERS:
+        worker_args = parse_worker_args(sys.argv[1:])
+        WORKERS[worker_args.worker](worker_args)
+        return
+
+    args = parse_args()
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    # The first line describes the run so results from different releases can be compared
+    output.write(json.dumps({
+        'benchmark': 'run',
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'latency': args.latency,
+        'time': datetime.now(timezone.utc).isoformat(),
+    }) + '\n')
+
+    suites = {'e2e': bench_end_to_end, 'dex': bench_dex, 'registry': bench_registry}
+    for suite in args.suites:
+        suites[suite](args, output)
+
+    if output is not sys.stdout:
+        output.close()
+
+if __name__ == "__main__":
+    main()
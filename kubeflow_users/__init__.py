@@ -0,0 +1,2 @@
+# Shared code behind the user creation and deletion scripts. Modules only pull
+# in PyYAML, bcrypt and Jinja2 when they actually need them; see cli.py.
@@ -0,0 +1,4 @@
+from kubeflow_users.cli import main
+
+if __name__ == "__main__":
+    main()
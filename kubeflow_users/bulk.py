@@ -0,0 +1,519 @@
+import argparse
+import csv
+import os
+import random
+import string
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from kubeflow_users import dex_rollout, fanout, paths, throttle, timing
+from kubeflow_users.dex import (add_backend_argument, apply_dex_config, get_dex_config, restart_dex, static_passwords,
+                                update_dex_config)
+from kubeflow_users.dex_passwords import DEFAULT_BCRYPT_ROUNDS, bcrypt_rounds
+from kubeflow_users.dex_rollout import dex_config_changed, utc_now
+from kubeflow_users.dex_storage import upsert_passwords
+from kubeflow_users.kube_client import cluster_name, current_context, set_context
+from kubeflow_users.profiles import apply_user_manifest, apply_users_batch, load_template, render_user_yaml, write_manifest
+from kubeflow_users.registry import add_class, add_user, batch, record_dex_logins
+from kubeflow_users.roster import QUOTA_FIELDS, ROSTER_FIELDS, normalize_quota, read_roster, validate_row
+from kubeflow_users.run_journal import RunJournal, new_run_id
+from kubeflow_users.snapshot import add_arguments as add_snapshot_arguments, get_snapshot
+
+def get_class_input():
+    class_name = input("Enter class name for class registry: ")
+    class_tag = input("Enter class tag: ")
+    num_users = int(input("Enter number of users to create: "))
+    cpu_limit = input("Enter CPU limit for all users (e.g., '5'): ")
+    memory_limit = input("Enter memory limit for all users (available options:2-128): ")
+    gpu_mem = input("Enter GPU memory limit for all users (available options:1,2): ")
+    gpu_count = input("Enter GPU count for all users (available options: 1-2): ")
+    storage_limit = input("Enter storage limit for all users (available options: 1Gi-1000Gi): ")
+    
+    return {
+        'class_name': class_name,
+        'class_tag': class_tag,
+        'num_users': num_users,
+        'cpu_limit': cpu_limit,
+        'memory_limit': f"{memory_limit}Gi" if not memory_limit.endswith('Gi') else memory_limit,
+        'gpu_mem': gpu_mem,
+        'gpu_count': gpu_count,
+        'storage_limit': storage_limit if storage_limit.endswith('Gi') else f"{storage_limit}Gi"
+    }
+
+def generate_password():
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=5))
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Create Kubeflow profiles for a whole class.")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="number of users to provision in parallel (default: 1)")
+    parser.add_argument('--batch', action='store_true',
+                        help="apply every profile in the class with a single kubectl call")
+    parser.add_argument('--bcrypt-rounds', type=bcrypt_rounds, default=DEFAULT_BCRYPT_ROUNDS,
+                        help=f"bcrypt cost for Dex password hashes (default: {DEFAULT_BCRYPT_ROUNDS})")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="show the profiles and Dex staticPasswords changes without applying anything")
+    dex_rollout.add_arguments(parser)
+    parser.add_argument('--strict-template', action='store_true',
+                        help="fail up front if the profile template uses variables that are not provided")
+    parser.add_argument('--emit-manifests', metavar='DIR',
+                        help="also write each rendered profile manifest to DIR for auditing")
+    parser.add_argument('--resume', metavar='RUN_ID',
+                        help="resume an interrupted run, skipping completed steps and reusing its credentials")
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help="users read and provisioned at a time (default: 500)")
+    add_backend_argument(parser)
+    parser.add_argument('--store-passwords', action='store_true',
+                        help="also keep plaintext passwords in the registry (by default only the Dex hash is kept)")
+    add_snapshot_arguments(parser)
+    fanout.add_arguments(parser)
+
+    # Non-interactive mode: the class comes from flags instead of prompts
+    class_group = parser.add_argument_group('non-interactive class options')
+    class_group.add_argument('--roster', metavar='FILE',
+                             help="CSV or YAML roster with per-user username, email, password and quota overrides")
+    class_group.add_argument('--class-name', help="class name for the registry (default: the class tag)")
+    class_group.add_argument('--class-tag', help="class tag; skips the prompts")
+    class_group.add_argument('--num-users', type=int, help="number of <tag>-N users to create when there is no roster")
+    for field in QUOTA_FIELDS:
+        class_group.add_argument(f"--{field.replace('_', '-')}", dest=field,
+                                 help=f"default {field.replace('_', ' ')} for every user; roster rows may override it")
+    throttle.add_arguments(parser)
+    timing.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.resume and args.dry_run:
+        parser.error("--dry-run cannot be combined with --resume")
+    if args.resume and args.contexts:
+        parser.error("--resume continues one cluster's run; use --context with the run ID printed for that cluster")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.roster and not args.class_tag:
+        parser.error("--roster needs --class-tag")
+    if args.class_tag and not args.roster:
+        missing = [f"--{field.replace('_', '-')}" for field in ['num_users'] + QUOTA_FIELDS if getattr(args, field) is None]
+        if missing:
+            parser.error(f"without --roster, --class-tag also needs {', '.join(missing)}")
+    for field in QUOTA_FIELDS:
+        if getattr(args, field) is not None:
+            try:
+                setattr(args, field, normalize_quota(field, getattr(args, field)))
+            except ValueError as e:
+                parser.error(str(e))
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+def build_user_data(class_data, index):
+    username = f"{class_data['class_tag']}-{index}"
+    return {
+        'profile_name': username,
+        'user_email': f"{username}@paf-iast",
+        'username': username,
+        'password': generate_password(),
+        'cpu_limit': class_data['cpu_limit'],
+        'memory_limit': class_data['memory_limit'],
+        'gpu_mem': class_data['gpu_mem'],
+        'gpu_count': class_data['gpu_count'],
+        'storage_limit': class_data['storage_limit']
+    }
+
+def class_data_from_args(args):
+    class_data = {
+        'class_name': args.class_name or args.class_tag,
+        'class_tag': args.class_tag,
+        'num_users': args.num_users,
+        # Kept in the journal so --resume can stream the same roster again
+        'roster': os.path.abspath(args.roster) if args.roster else None,
+    }
+    class_data.update({field: getattr(args, field) for field in QUOTA_FIELDS})
+    return class_data
+
+def roster_users(class_data, rejected):
+    # Streams validated users from the roster; unusable rows go to `rejected`
+    usernames = set()
+    emails = set()
+    for index, (line, row) in enumerate(read_roster(class_data['roster']), start=1):
+        label = row.get('username') or f"line {line}"
+        try:
+            row = validate_row(row, class_data)
+        except ValueError as e:
+            rejected.append(({'username': label}, f"line {line}: {e}"))
+            continue
+
+        user_data = build_user_data(dict(class_data, **row), index)
+        if row['username']:
+            user_data['username'] = user_data['profile_name'] = row['username']
+        user_data['user_email'] = row['email'] or f"{user_data['username']}@paf-iast"
+        if row['password']:
+            user_data['password'] = row['password']
+
+        if user_data['username'] in usernames or user_data['user_email'].lower() in emails:
+            rejected.append(({'username': user_data['username']}, f"line {line}: duplicate username or email"))
+            continue
+        usernames.add(user_data['username'])
+        emails.add(user_data['user_email'].lower())
+        yield user_data
+
+def class_users(class_data, rejected):
+    if class_data.get('roster'):
+        return roster_users(class_data, rejected)
+    return (build_user_data(class_data, i) for i in range(1, class_data['num_users'] + 1))
+
+def journaled(users, journal):
+    # Users already in the journal keep the credentials they were given
+    for user_data in users:
+        known = journal.users.get(user_data['username'])
+        if known is None:
+            journal.record_user(user_data)
+            yield user_data
+        else:
+            yield known
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def preflight(users_data, dex_backend, ttl, failed, resumed=()):
+    # Users that would collide with what is already in the cluster are
+    # reported and left out before anything is written. Only users in
+    # `resumed`, the journal of the run being resumed, may find their own
+    # profile and Dex entry already there.
+    snapshot = get_snapshot(dex_backend, ttl)
+    if snapshot is None:
+        print("Warning: could not read the cluster state; skipping preflight checks.")
+        return users_data
+
+    ready = []
+    for user_data in users_data:
+        conflict = snapshot.create_conflict(user_data, resuming=user_data['username'] in resumed)
+        if conflict is None:
+            ready.append(user_data)
+        else:
+            print(f"Preflight: skipping {user_data['username']}: {conflict}")
+            failed.append((user_data, conflict))
+    return ready
+
+def provision_user(user_data, journal, emit_dir=None):
+    username = user_data['username']
+
+    if not journal.completed('profile', username):
+        with timing.span('render', user=username) as span:
+            rendered = render_user_yaml(user_data)
+            span.ok = rendered is not None
+        if rendered is None:
+            return False, "failed to render YAML"
+        if emit_dir:
+            write_manifest(emit_dir, username, rendered)
+
+        with timing.span('apply', user=username) as span:
+            result = apply_user_manifest(username, rendered)
+            span.ok = result is not None
+        if result is None:
+            return False, "failed to apply YAML"
+        journal.record_step('profile', username)
+
+    return True, None
+
+def register_users(users_data, class_tag, journal):
+    # One registry write for the whole chunk; the steps are journaled only
+    # once it is done, so a resume re-adds users whose write was lost, which
+    # updates their record if it was written after all
+    pending = [user_data for user_data in users_data if not journal.completed('registry', user_data['username'])]
+    if not pending:
+        return
+    store_passwords = journal.class_data.get('store_passwords')
+    with timing.span('registry', users=len(pending)), batch():
+        for user_data in pending:
+            add_user(user_data['username'], user_data['user_email'], user_data['password'] if store_passwords else None,
+                     class_tag, cluster=cluster_name())
+    for user_data in pending:
+        journal.record_step('registry', user_data['username'])
+
+def provision_users(users_data, class_tag, concurrency, journal, emit_dir=None):
+    succeeded = []
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(provision_user, user_data, journal, emit_dir): user_data for user_data in users_data}
+        for future in as_completed(futures):
+            user_data = futures[future]
+            try:
+                ok, reason = future.result()
+            except Exception as e:
+                ok, reason = False, str(e)
+
+            if ok:
+                print(f"User {user_data['username']} created successfully with password: {user_data['password']}")
+                succeeded.append(user_data)
+            else:
+                print(f"Failed to provision user {user_data['username']}: {reason}")
+                failed.append((user_data, reason))
+
+    # Keep the original class ordering for the report and the Dex update
+    order = {user_data['username']: i for i, user_data in enumerate(users_data)}
+    succeeded.sort(key=lambda u: order[u['username']])
+    failed.sort(key=lambda f: order[f[0]['username']])
+    register_users(succeeded, class_tag, journal)
+    return succeeded, failed
+
+def provision_users_batch(users_data, class_tag, journal, emit_dir=None):
+    pending = [user_data for user_data in users_data if not journal.completed('profile', user_data['username'])]
+    applied, failed = apply_users_batch(pending, emit_dir) if pending else ([], [])
+    for user_data in applied:
+        journal.record_step('profile', user_data['username'])
+
+    failed_names = set(user_data['username'] for user_data, _ in failed)
+    succeeded = [user_data for user_data in users_data if user_data['username'] not in failed_names]
+
+    # Only users the API server actually accepted are recorded
+    register_users(succeeded, class_tag, journal)
+    for user_data in succeeded:
+        print(f"User {user_data['username']} created successfully with password: {user_data['password']}")
+    for user_data, reason in failed:
+        print(f"Failed to provision user {user_data['username']}: {reason}")
+
+    return succeeded, failed
+
+def start_run(class_data):
+    journal = RunJournal.create(new_run_id(class_data['class_tag'], class_data.get('context')), class_data)
+    print(f"Run ID: {journal.run_id} (resume with --resume {journal.run_id})")
+    return journal
+
+def resume_run(run_id):
+    try:
+        journal = RunJournal.resume(run_id)
+    except (OSError, ValueError) as e:
+        print(f"Error: cannot resume run {run_id}: {e}")
+        return None
+    done = sum(1 for username in journal.users if journal.completed('dex', username))
+    print(f"Resuming run {journal.run_id}: {done} of {len(journal.users)} user(s) already finished")
+    return journal
+
+def report_results(succeeded, failed):
+    print(f"\nProvisioned {len(succeeded)} user(s), {len(failed)} failed.")
+    for user_data in succeeded:
+        print(f"  OK      {user_data['username']}  password: {user_data['password']}")
+    for user_data, reason in failed:
+        print(f"  FAILED  {user_data['username']}  ({reason})")
+
+def register_class(class_data, journal):
+    # Add class information to the registry
+    add_class(
+        class_data['class_name'],
+        class_data['class_tag'],
+        class_data['num_users'],
+        class_data['cpu_limit'],
+        class_data['memory_limit'],
+        class_data['gpu_mem'],
+        class_data['gpu_count'],
+        class_data['storage_limit']
+    )
+    journal.record_step('class')
+
+def use_run_context(class_data):
+    # A resumed run goes back to the cluster it was started against
+    context = class_data.get('context')
+    if context == current_context():
+        return True
+    if current_context() is not None:
+        print(f"Error: run was started against context {context or '(current)'}, not {current_context()}")
+        return False
+    set_context(context)
+    print(f"Resuming against context {context}")
+    return True
+
+def create_class(args, report):
+    if load_template(args.strict_template) is None:
+        return
+
+    if args.resume:
+        journal = resume_run(args.resume)
+        if journal is None:
+            return
+    else:
+        class_data = class_data_from_args(args) if args.class_tag else get_class_input()
+        # Journaled so a resumed run writes the rest of the logins to the same place
+        class_data['dex_backend'] = args.dex_backend
+        class_data['store_passwords'] = args.store_passwords
+        class_data['context'] = current_context()
+
+        if args.dry_run:
+            rejected = []
+            try:
+                users_data = list(class_users(class_data, rejected))
+            except (OSError, ValueError) as e:
+                print(f"Error reading roster: {e}")
+                return
+            for user_data, reason in rejected:
+                print(f"Skipping {user_data['username']}: {reason}")
+            users_data = preflight(users_data, args.dex_backend, args.snapshot_ttl, [])
+            print(f"Dry run: would create {len(users_data)} profile(s): {', '.join(u['username'] for u in users_data)}")
+            if args.dex_backend == 'crd':
+                upsert_passwords(users_data, args.bcrypt_rounds, dry_run=True)
+            else:
+                snapshot = get_snapshot(args.dex_backend, args.snapshot_ttl)
+                update_dex_config(snapshot.dex_state if snapshot else get_dex_config(), users_data, dry_run=True)
+            report['ok'] = True
+            return
+        journal = start_run(class_data)
+
+    with journal:
+        if args.resume and not use_run_context(journal.class_data):
+            return
+        provision_class(args, report, journal)
+
+def provision_class(args, report, journal):
+    class_data = journal.class_data
+    rejected = []
+    timing.set_attributes(class_tag=class_data['class_tag'], run_id=journal.run_id)
+    report['run_id'] = journal.run_id
+
+    # A roster's size is only known once it has been read
+    if not class_data.get('roster') and not journal.completed('class'):
+        register_class(class_data, journal)
+
+    # Users are read, journaled and provisioned a chunk at a time, so a large
+    # roster is never loaded as a whole
+    succeeded = []
+    failed = []
+    dex_backend = class_data.get('dex_backend', 'configmap')
+    # Users the interrupted run already got to; empty for a new run
+    resumed = set(journal.users)
+    try:
+        for chunk in chunked(class_users(class_data, rejected), args.chunk_size):
+            # Users that fail preflight are never journaled, so a resume cannot pick them up
+            chunk = list(journaled(preflight(chunk, dex_backend, args.snapshot_ttl, failed, resumed), journal))
+            # Credentials must be on disk before anything is applied so a resume reuses them
+            journal.sync()
+            if args.batch:
+                chunk_succeeded, chunk_failed = provision_users_batch(chunk, class_data['class_tag'], journal, args.emit_manifests)
+            else:
+                chunk_succeeded, chunk_failed = provision_users(chunk, class_data['class_tag'], args.concurrency, journal, args.emit_manifests)
+            succeeded.extend(chunk_succeeded)
+            failed.extend(chunk_failed)
+    except (OSError, ValueError) as e:
+        print(f"Error reading roster: {e}")
+        return
+    failed.extend(rejected)
+    journal.sync()
+
+    if class_data.get('roster') and not journal.completed('class'):
+        register_class(dict(class_data, num_users=len(succeeded)), journal)
+    report_results(succeeded, failed)
+    report['created'] = len(succeeded)
+    report['failed'] = [[user_data['username'], reason] for user_data, reason in failed]
+
+    # Dex is updated once, after every worker has finished
+    dex_pending = [user_data for user_data in succeeded if not journal.completed('dex', user_data['username'])]
+    if not succeeded:
+        print("No users were provisioned; skipping Dex update.")
+        return
+
+    # A resumed run still owes a restart if the config was applied before the interruption
+    needs_restart = journal.completed('dex_config') and not journal.completed('restart')
+    if dex_pending and dex_backend == 'crd':
+        # Dex reads Password objects on every login, so there is nothing to restart
+        index = upsert_passwords(dex_pending, args.bcrypt_rounds)
+        if index is None:
+            return
+        record_dex_logins([index.get(username=user_data['username']) for user_data in dex_pending], 'crd', cluster_name())
+        for user_data in dex_pending:
+            journal.record_step('dex', user_data['username'])
+        journal.sync()
+    elif dex_pending:
+        dex_config = get_dex_config()
+        if dex_config is None:
+            return
+
+        updated_config = update_dex_config(dex_config, dex_pending, args.bcrypt_rounds)
+        if updated_config is None:
+            return
+
+        if dex_config_changed(dex_config, updated_config):
+            result = apply_dex_config(updated_config)
+            if result is None:
+                return
+            journal.record_step('dex_config')
+            needs_restart = True
+        else:
+            print("Dex configuration unchanged; skipping apply and restart.")
+        # The hashes and userIDs as written, so Dex can be rebuilt without rehashing
+        entries = {entry.get('username'): entry for entry in static_passwords(updated_config)}
+        record_dex_logins([entries.get(user_data['username']) for user_data in dex_pending], 'configmap', cluster_name())
+        for user_data in dex_pending:
+            journal.record_step('dex', user_data['username'])
+        journal.sync()
+
+    if needs_restart:
+        result = restart_dex(utc_now(), args.restart_window, args.rollout_timeout)
+        if result is None:
+            return
+        journal.record_step('restart')
+    report['ok'] = not failed
+
+    print(f"Bulk user creation process for class {class_data['class_name']} completed successfully.")
+
+def write_shared_roster(class_data, users):
+    # Resolved usernames, emails, passwords and quotas for every cluster; kept
+    # private next to the run journals so one cluster's run can be resumed
+    os.makedirs(paths.runs_dir(), exist_ok=True)
+    path = os.path.join(paths.runs_dir(), f"{new_run_id(class_data['class_tag'])}-roster.csv")
+    count = 0
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=ROSTER_FIELDS)
+        writer.writeheader()
+        for user_data in users:
+            writer.writerow(dict({field: user_data[field] for field in QUOTA_FIELDS},
+                                 username=user_data['username'], email=user_data['user_email'],
+                                 password=user_data['password']))
+            count += 1
+    return path, count
+
+def describe_report(report):
+    summary = f"{report.get('created', 0)} created, {len(report.get('failed', []))} failed"
+    return f"{summary}, run {report['run_id']}" if report.get('run_id') else summary
+
+def create_on_clusters(args, argv):
+    # The class is read and its credentials generated once, so each cluster
+    # gets the same users with the same passwords
+    class_data = class_data_from_args(args) if args.class_tag else get_class_input()
+    rejected = []
+    try:
+        roster, count = write_shared_roster(class_data, class_users(class_data, rejected))
+    except (OSError, ValueError) as e:
+        print(f"Error reading roster: {e}")
+        sys.exit(1)
+    for user_data, reason in rejected:
+        print(f"Skipping {user_data['username']}: {reason}")
+    print(f"Credentials for {count} user(s) written to {roster}")
+
+    class_options = ['--roster', '--class-name', '--class-tag', '--num-users'] + [f"--{field.replace('_', '-')}" for field in QUOTA_FIELDS]
+    child_args = fanout.strip_options(argv, class_options)
+    child_args += ['--class-tag', class_data['class_tag'], '--class-name', class_data['class_name'], '--roster', roster]
+    for field in QUOTA_FIELDS:
+        if class_data.get(field) is not None:
+            child_args += [f"--{field.replace('_', '-')}", class_data[field]]
+
+    results = fanout.run_on_contexts('bulk', child_args, args.contexts, args.report)
+    if not fanout.print_summary(results, describe_report):
+        sys.exit(1)
+
+def main(argv=None, prog=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv, prog)
+    if args.contexts:
+        create_on_clusters(args, argv)
+        return
+    set_context(args.context)
+    timing.configure(args.metrics_log)
+    throttle.configure(args.api_qps, args.api_burst, args.api_retries)
+    report = {'cluster': current_context(), 'ok': False}
+    try:
+        create_class(args, report)
+    finally:
+        timing.finish(args, 'bulk-user')
+        fanout.write_report(args.report, report)
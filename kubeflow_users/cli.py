@@ -0,0 +1,36 @@
+import argparse
+import importlib
+import sys
+from kubeflow_users import paths
+
+# Subcommand modules are imported only once chosen, so `delete` never loads
+# Jinja2 or bcrypt and `--help` loads none of the heavy dependencies
+COMMANDS = {
+    'create': ('kubeflow_users.create', "create a single user interactively"),
+    'bulk': ('kubeflow_users.bulk', "create every user of a class"),
+    'delete': ('kubeflow_users.delete', "delete users, or every active user of a class"),
+    'reconcile': ('kubeflow_users.reconcile', "bring a class in line with a desired-state spec"),
+    'update-quota': ('kubeflow_users.update_quota', "change the quotas of every active user of a class in place"),
+    'registry': ('kubeflow_users.registry_db', "migrate the user registry to SQLite, compact and search its archives"),
+    'dex': ('kubeflow_users.dex', "manage where Dex logins are stored"),
+}
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m kubeflow_users',
+                                     description="Manage Kubeflow user profiles and their Dex logins.")
+    parser.add_argument('--data-dir', metavar='DIR',
+                        help="directory holding manifests/, users/ and runs/ "
+                             "(default: $KUBEFLOW_USERS_DATA, else the current directory)")
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        # Each command parses its own options once its module is loaded
+        subparsers.add_parser(name, help=help_text, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+    return parser, args, rest
+
+def main(argv=None):
+    parser, args, rest = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.data_dir:
+        paths.set_data_dir(args.data_dir)
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.main(rest, f"{parser.prog} {args.command}")
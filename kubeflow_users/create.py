@@ -0,0 +1,132 @@
+import argparse
+from kubeflow_users import dex_rollout, paths, throttle, timing
+from kubeflow_users.dex import (add_backend_argument, apply_dex_config, get_dex_config, restart_dex, static_passwords,
+                                update_dex_config)
+from kubeflow_users.dex_passwords import DEFAULT_BCRYPT_ROUNDS, bcrypt_rounds
+from kubeflow_users.dex_rollout import dex_config_changed, utc_now
+from kubeflow_users.dex_storage import upsert_passwords
+from kubeflow_users.kube_client import cluster_name
+from kubeflow_users.profiles import apply_user_manifest, render_user_yaml
+from kubeflow_users.registry import add_user
+from kubeflow_users.roster import QUOTA_FIELDS
+from kubeflow_users.snapshot import take_snapshot
+
+def get_user_input():
+    profile_name = input("Enter profile name: ")
+    user_email = input("Enter user email: ")
+    username = input("Enter username: ")
+    password = input("Enter password: ")
+    cpu_limit = input("Enter CPU limit (e.g., '5'): ")
+    memory_limit = input("Enter memory limit (available options:2-128): ")
+    gpu_mem = input("Enter GPU memory limit (available options:1,2): ")
+    gpu_count = input("Enter GPU count (available options: 1-2): ")
+    storage_limit = input("Enter storage limit (available options: 1Gi-1000Gi): ")
+    
+    return {
+        'profile_name': profile_name,
+        'user_email': user_email,
+        'username': username,
+        'password': password,
+        'cpu_limit': cpu_limit,
+        'memory_limit': f"{memory_limit}Gi" if not memory_limit.endswith('Gi') else memory_limit,
+        'gpu_mem': gpu_mem,
+        'gpu_count': gpu_count,
+        'storage_limit': storage_limit if storage_limit.endswith('Gi') else f"{storage_limit}Gi"
+    }
+
+def create_user_yaml(user_data):
+    with timing.span('render') as span:
+        rendered = render_user_yaml(user_data)
+        span.ok = rendered is not None
+    if rendered is None:
+        return None
+
+    with open(paths.manifest('create-user.yaml'), 'w') as file:
+        file.write(rendered)
+
+    print("Content written to create-user.yaml:")
+    print(rendered)
+
+    return rendered
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Create a single Kubeflow user profile.")
+    parser.add_argument('--bcrypt-rounds', type=bcrypt_rounds, default=DEFAULT_BCRYPT_ROUNDS,
+                        help=f"bcrypt cost for the Dex password hash (default: {DEFAULT_BCRYPT_ROUNDS})")
+    dex_rollout.add_arguments(parser)
+    add_backend_argument(parser)
+    throttle.add_arguments(parser)
+    timing.add_arguments(parser)
+    args = parser.parse_args(argv)
+    return args
+
+def update_dex_login(user_data, args):
+    # Returns the user's Dex entry as written, or None on failure
+    dex_config = get_dex_config()
+    if dex_config is None:
+        return None
+
+    updated_config = update_dex_config(dex_config, [user_data], args.bcrypt_rounds)
+    if updated_config is None:
+        return None
+
+    entry = next((entry for entry in static_passwords(updated_config) if entry.get('username') == user_data['username']), None)
+    if not dex_config_changed(dex_config, updated_config):
+        print("Dex configuration unchanged; skipping apply and restart.")
+        return entry
+    if apply_dex_config(updated_config) is None:
+        return None
+    if restart_dex(utc_now(), args.restart_window, args.rollout_timeout) is None:
+        return None
+    return entry
+
+def create_user(args):
+    user_data = get_user_input()
+    timing.set_attributes(user=user_data['username'])
+
+    snapshot = take_snapshot(args.dex_backend)
+    if snapshot is None:
+        print("Warning: could not read the cluster state; skipping preflight checks.")
+    else:
+        conflict = snapshot.create_conflict(user_data)
+        if conflict is not None:
+            print(f"Error: cannot create {user_data['username']}: {conflict}")
+            return
+
+    rendered = create_user_yaml(user_data)
+    if rendered is None:
+        return
+
+    with timing.span('apply') as span:
+        result = apply_user_manifest(user_data['username'], rendered)
+        span.ok = result is not None
+    if result is None:
+        return
+
+    if args.dex_backend == 'crd':
+        # The new Password object is picked up by Dex without a restart
+        index = upsert_passwords([user_data], args.bcrypt_rounds)
+        if index is None:
+            return
+        dex_login = index.get(username=user_data['username'])
+    else:
+        dex_login = update_dex_login(user_data, args)
+        if dex_login is None:
+            return
+    
+    # Add user to the registry
+    with timing.span('registry'):
+        add_user(user_data['username'], user_data['user_email'],
+                 quota={field: user_data[field] for field in QUOTA_FIELDS}, dex_login=dex_login, dex_backend=args.dex_backend,
+                 cluster=cluster_name())
+    
+    print("User creation process completed successfully.")
+
+def main(argv=None, prog=None):
+    args = parse_args(argv, prog)
+    timing.configure(args.metrics_log)
+    throttle.configure(args.api_qps, args.api_burst, args.api_retries)
+    try:
+        create_user(args)
+    finally:
+        timing.finish(args, 'create-user')
@@ -0,0 +1,523 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from kubeflow_users import dex_rollout, fanout, registry, throttle, timing
+from kubeflow_users.dex import add_backend_argument, remove_dex_users
+from kubeflow_users.kube_client import ApiError, cluster_name, current_context, get_client, set_context
+from kubeflow_users.registry import batch, mark_user_deleted
+from kubeflow_users.shell import run_command
+from kubeflow_users.snapshot import take_snapshot
+
+# kubectl calls made while deleting are bounded so one hung call cannot stall a class
+KUBECTL_TIMEOUT = 30
+
+# Kinds whose finalizers keep a namespace Terminating; each is deleted and
+# waited for before the namespace itself
+DRAIN_KINDS = [('Notebook', 'notebooks.kubeflow.org'), ('StatefulSet', 'statefulsets.apps'),
+               ('Pod', 'pods'), ('PersistentVolumeClaim', 'persistentvolumeclaims')]
+DEFAULT_DRAIN_TIMEOUT = 120
+
+def command_output(command, timeout=KUBECTL_TIMEOUT, retry=True):
+    return run_command(command, timeout=timeout, retry=retry)
+
+def wait_for_deletion(client, kind, name, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            client.get(kind, name)
+        except ApiError as e:
+            if e.status == 404:
+                return True
+            raise
+        time.sleep(1)
+    print(f"Timed out waiting for {kind} {name} to be deleted")
+    return False
+
+def delete_resource(kind, name, kubectl_resource, force=False):
+    client = get_client()
+    if client is None:
+        # A retried delete may find the object already gone
+        if force:
+            return command_output(f"kubectl delete {kubectl_resource} {name} --force --grace-period=0 --ignore-not-found") is not None
+        return command_output(f"kubectl delete {kubectl_resource} {name} --ignore-not-found") is not None
+
+    print(f"Deleting {kind} {name}")
+    try:
+        client.delete(kind, name, grace_period=0 if force else None)
+        return wait_for_deletion(client, kind, name)
+    except ApiError as e:
+        if e.status == 404:
+            return True
+        print(f"Error deleting {kind} {name}: {e}")
+        return False
+    except OSError as e:
+        print(f"Error deleting {kind} {name}: {e}")
+        return False
+
+def remove_finalizers(kind, name, kubectl_resource):
+    client = get_client()
+    if client is None:
+        return command_output(f"kubectl patch {kubectl_resource} {name} -p '{{\"metadata\":{{\"finalizers\":null}}}}' --type=merge") is not None
+
+    try:
+        client.remove_finalizers(kind, name)
+        return True
+    except (ApiError, OSError) as e:
+        print(f"Error removing finalizers from {kind} {name}: {e}")
+        return False
+
+def force_delete_profile(username):
+    # Remove finalizers from the profile
+    remove_finalizers('Profile', username, 'profiles.kubeflow.org')
+    # Force delete the profile
+    return delete_resource('Profile', username, 'profiles.kubeflow.org', force=True)
+
+def force_delete_namespace(username):
+    # Remove finalizers from the namespace
+    remove_finalizers('Namespace', username, 'namespace')
+    # Force delete the namespace
+    return delete_resource('Namespace', username, 'namespace', force=True)
+
+def request_deletion(username):
+    # Issue the profile and namespace deletes without waiting for them to finish
+    client = get_client()
+    if client is None:
+        return (command_output(f"kubectl delete profiles.kubeflow.org {username} --wait=false --ignore-not-found") is not None
+                and command_output(f"kubectl delete ns {username} --wait=false --ignore-not-found") is not None)
+
+    for kind in ('Profile', 'Namespace'):
+        try:
+            client.delete(kind, username)
+        except ApiError as e:
+            if e.status != 404:
+                print(f"Error deleting {kind} {username}: {e}")
+                return False
+        except OSError as e:
+            print(f"Error deleting {kind} {username}: {e}")
+            return False
+    return True
+
+def existing_names(kind, names):
+    # Returns the names that still exist, or None if that cannot be told;
+    # callers must not force delete anything on a None
+    if not names:
+        return set()
+    client = get_client()
+    if client is None:
+        resource = 'profiles.kubeflow.org' if kind == 'Profile' else 'namespace'
+        output = command_output(f"kubectl get {resource} {' '.join(names)} --ignore-not-found -o name")
+        if output is None:
+            return None
+        return set(line.split('/', 1)[1] for line in output.split() if '/' in line)
+
+    try:
+        items = client.list(kind).get('items', [])
+    except (ApiError, OSError) as e:
+        print(f"Error listing {kind} objects: {e}")
+        return None
+    return set(item['metadata']['name'] for item in items) & set(names)
+
+def wait_for_namespaces(names, timeout, requested_at=None):
+    # Returns the namespaces that are still present when the timeout expires,
+    # or None if that cannot be told
+    requested_at = requested_at or {}
+    start = time.monotonic()
+    client = get_client()
+    if client is None:
+        if names:
+            # Waiting again after a timeout would only double the wait
+            command_output(f"kubectl wait --for=delete {' '.join('namespace/' + name for name in names)} --timeout={timeout}s",
+                           timeout=timeout + 30, retry=False)
+        remaining = existing_names('Namespace', names)
+        if remaining is None:
+            return None
+        # kubectl waits for all of them at once, so this is an upper bound per namespace
+        for name in names:
+            if name not in remaining:
+                timing.record('namespace_delete', time.monotonic() - requested_at.get(name, start), user=name)
+        return remaining
+
+    def deleted(name):
+        print(f"Namespace {name} terminated after {time.monotonic() - start:.1f}s")
+        timing.record('namespace_delete', time.monotonic() - requested_at.get(name, start), user=name)
+
+    # One watch on the namespace collection covers every user in the class
+    return watch_deletions(client, 'Namespace', timeout, names=names, on_deleted=deleted)
+
+def watch_deletions(client, kind, timeout, names=None, namespace=None, on_deleted=None):
+    # Watches `kind` until every named object, or without names every object
+    # in `namespace`, is deleted; returns the names still present at the timeout
+    deadline = time.monotonic() + timeout
+    listing = client.list(kind, namespace)
+    present = set(item['metadata']['name'] for item in listing.get('items', []))
+    pending = present & set(names) if names is not None else present
+    resource_version = listing.get('metadata', {}).get('resourceVersion')
+    for name in names or []:
+        if name not in pending and on_deleted:
+            # Already gone by the time we started watching
+            on_deleted(name)
+
+    attempt = 0
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            for event_type, obj in client.watch(kind, namespace=namespace, resource_version=resource_version, timeout=remaining):
+                resource_version = obj['metadata'].get('resourceVersion', resource_version)
+                name = obj['metadata']['name']
+                if event_type == 'DELETED' and name in pending:
+                    pending.discard(name)
+                    if on_deleted:
+                        on_deleted(name)
+                    if not pending:
+                        break
+                elif event_type == 'ADDED' and names is None:
+                    # Recreated by its controller before that was deleted too
+                    pending.add(name)
+        except (ApiError, OSError) as e:
+            if getattr(e, 'status', None) != 410:
+                # A dropped or throttled watch is resumed from a fresh list
+                if not throttle.is_retryable(e) or not throttle.wait(attempt, f"{kind} watch: {e}"):
+                    raise
+                attempt += 1
+            # Our resourceVersion expired; re-list and keep watching
+            listing = client.list(kind, namespace)
+            present = set(item['metadata']['name'] for item in listing.get('items', []))
+            pending = pending & present if names is not None else present
+            resource_version = listing.get('metadata', {}).get('resourceVersion')
+    return pending
+
+def drain_kind(client, kind, namespace, timeout):
+    # Returns the objects of `kind` left in the namespace, or None on an error
+    try:
+        if not client.list(kind, namespace).get('items'):
+            return set()
+        print(f"Deleting every {kind} in namespace {namespace}")
+        client.delete_collection(kind, namespace)
+        return watch_deletions(client, kind, timeout, namespace=namespace)
+    except ApiError as e:
+        if e.status == 404:
+            # The kind is not installed (e.g. no notebook controller)
+            return set()
+        print(f"Error draining {kind} objects from namespace {namespace}: {e}")
+        return None
+    except OSError as e:
+        print(f"Error draining {kind} objects from namespace {namespace}: {e}")
+        return None
+
+def drain_namespace(namespace, timeout):
+    # Deletes the objects whose finalizers keep a namespace Terminating, all
+    # kinds at once, and waits for them to go; True once none are left
+    client = get_client()
+    if client is None:
+        resources = ','.join(resource for _, resource in DRAIN_KINDS)
+        output = command_output(f"kubectl get {resources} -n {namespace} --ignore-not-found -o name")
+        if output is None:
+            return False
+        if not output.strip():
+            return True
+        if command_output(f"kubectl delete {resources} --all -n {namespace} --wait=false --ignore-not-found") is None:
+            return False
+        # Fails at once with "no matching resources" when everything is already gone
+        command_output(f"kubectl wait --for=delete {resources} --all -n {namespace} --timeout={timeout}s",
+                       timeout=timeout + 30, retry=False)
+        output = command_output(f"kubectl get {resources} -n {namespace} --ignore-not-found -o name")
+        return output is not None and not output.strip()
+
+    with ThreadPoolExecutor(max_workers=len(DRAIN_KINDS)) as executor:
+        left = list(executor.map(lambda kind: drain_kind(client, kind, namespace, timeout), [kind for kind, _ in DRAIN_KINDS]))
+    return all(remaining is not None and not remaining for remaining in left)
+
+def namespace_leftovers(namespace):
+    # What a forced namespace deletion leaves behind, with the volume bound to
+    # every claim; None if it cannot be listed
+    client = get_client()
+    items = []
+    if client is None:
+        output = command_output(f"kubectl get {','.join(resource for _, resource in DRAIN_KINDS)} -n {namespace} --ignore-not-found -o json")
+        if output is None:
+            return None
+        items = json.loads(output).get('items', []) if output.strip() else []
+    else:
+        for kind, _ in DRAIN_KINDS:
+            try:
+                items += [dict(item, kind=kind) for item in client.list(kind, namespace).get('items', [])]
+            except ApiError as e:
+                if e.status != 404:
+                    return None
+            except OSError:
+                return None
+
+    leftovers = []
+    for item in items:
+        entry = f"{item.get('kind')}/{item['metadata']['name']}"
+        volume = (item.get('spec') or {}).get('volumeName')
+        if item.get('kind') == 'PersistentVolumeClaim' and volume:
+            entry += f" (volume {volume})"
+        leftovers.append(entry)
+    return leftovers
+
+def delete_users(usernames, parallel=8, stuck_timeout=180, snapshot=None, drain_timeout=DEFAULT_DRAIN_TIMEOUT):
+    results = {}
+    requested_at = {}
+
+    if snapshot is not None:
+        # Users with neither a profile nor a namespace need no API calls. If
+        # they have no Dex login or registry record either, they are reported
+        # as not found (None) rather than deleted.
+        absent = [username for username in usernames if not snapshot.exists(username)]
+        if absent:
+            with timing.span('registry', users=len(absent)), batch():
+                for username in absent:
+                    marked = mark_user_deleted(username, cluster_name())
+                    in_dex = snapshot.dex_index.get(username=username) is not None
+                    results[username] = True if marked or in_dex else None
+        for username in absent:
+            if results[username]:
+                print(f"User {username} has no profile or namespace in the cluster; updated the registry only")
+        usernames = [username for username in usernames if username not in results]
+
+    def request(username):
+        # Each worker drains one namespace and then requests its deletion, so
+        # one user's drain overlaps the next user's
+        if drain_timeout:
+            with timing.span('drain', user=username) as span:
+                span.ok = drain_namespace(username, drain_timeout)
+            if not span.ok:
+                print(f"Namespace {username} was not fully drained; deleting it anyway")
+        with timing.span('delete_request', user=username) as span:
+            span.ok = request_deletion(username)
+        requested_at[username] = time.monotonic()
+        return span.ok
+
+    # Step 1: Drain and request deletion of every profile and namespace, at most `parallel` at a time
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        for username, requested in zip(usernames, executor.map(request, usernames)):
+            if not requested:
+                results[username] = False
+    pending = [username for username in usernames if username not in results]
+
+    # Step 2: Watch namespace termination; teardown takes as long as the slowest namespace
+    try:
+        stuck_namespaces = wait_for_namespaces(pending, stuck_timeout, requested_at)
+    except (ApiError, OSError) as e:
+        print(f"Error watching namespace deletion: {e}")
+        stuck_namespaces = existing_names('Namespace', pending)
+    if stuck_namespaces is None:
+        # An API error says nothing about whether a namespace is stuck
+        print("Could not tell which namespaces are still terminating; nothing will be force deleted.")
+        for username in pending:
+            results[username] = False
+        stuck_namespaces = set()
+
+    # Step 3: Force delete only what is actually stuck, as a last resort
+    for username in sorted(stuck_namespaces):
+        print(f"Namespace {username} still terminating after {stuck_timeout}s, attempting force delete")
+        leftovers = namespace_leftovers(username)
+        forced = force_delete_namespace(username)
+        timing.record('namespace_delete', time.monotonic() - requested_at[username], ok=forced, user=username, forced=True)
+        if not forced:
+            print(f"Force delete of namespace for user {username} failed")
+            results[username] = False
+        elif leftovers is None:
+            print(f"Force deleted namespace {username}; could not list what it left behind")
+        elif leftovers:
+            print(f"Force deleted namespace {username}; left behind (check for orphaned volumes): {', '.join(leftovers)}")
+
+    leftover_profiles = existing_names('Profile', [username for username in pending if username not in results])
+    if leftover_profiles is None:
+        print("Could not tell which profiles are left; nothing will be force deleted.")
+        for username in pending:
+            results.setdefault(username, False)
+        leftover_profiles = set()
+    for username in sorted(leftover_profiles):
+        print(f"Kubeflow profile for user {username} still present, attempting force delete")
+        if not force_delete_profile(username):
+            print(f"Force delete of Kubeflow profile for user {username} failed")
+            results[username] = False
+
+    # Mark the deleted users in the registry with one write
+    deleted = [username for username in pending if username not in results]
+    if deleted:
+        with timing.span('registry', users=len(deleted)), batch():
+            for username in deleted:
+                mark_user_deleted(username, cluster_name())
+                results[username] = True
+
+    return results
+
+def delete_user(username):
+    if delete_users([username], parallel=1).get(username):
+        print(f"Successfully deleted user {username} and associated resources")
+        return True
+    return False
+
+def report_results(results):
+    for username, deleted in results.items():
+        if deleted:
+            print(f"User {username} deleted successfully")
+        elif deleted is None:
+            print(f"User {username} not found: no profile, namespace, Dex login or registry record")
+        else:
+            print(f"Failed to delete user {username}")
+
+def recorded_dex_backends(usernames):
+    # The Dex store each user's login was recorded in, read before the users
+    # are marked deleted. Records without one are left out.
+    wanted = set(usernames)
+    try:
+        users = registry.get_all_active_users(cluster_name())
+    except (FileNotFoundError, json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error reading user registry: {e}")
+        return {}
+    return {user['username']: user['dex_backend'] for user in users
+            if user['username'] in wanted and user.get('dex_backend')}
+
+def finish_deletion(results, args, report, backends):
+    report_results(results)
+    # Revoke Dex logins for everything deleted in this run in a single update
+    deleted = [username for username, ok in results.items() if ok]
+    report['deleted'] = len(deleted)
+    report['failed'] = [username for username, ok in results.items() if ok is False]
+    report['not_found'] = [username for username, ok in results.items() if ok is None]
+    if report['not_found']:
+        print(f"{len(report['not_found'])} user(s) not found: {', '.join(report['not_found'])}")
+    # Each login is removed from the store it was recorded in; --dex-backend
+    # only covers users with no recorded store
+    by_backend = {}
+    for username in deleted:
+        by_backend.setdefault(backends.get(username, args.dex_backend), []).append(username)
+    report['dex_not_removed'] = [username for backend, usernames in sorted(by_backend.items())
+                                 if not remove_dex_users(usernames, args.restart_window, args.rollout_timeout, backend)
+                                 for username in usernames]
+    if report['dex_not_removed']:
+        print(f"Error: failed to remove {len(report['dex_not_removed'])} deleted user(s) from Dex; they may still be able "
+              f"to log in: {', '.join(report['dex_not_removed'])}")
+        sys.exit(1)
+    report['ok'] = not report['failed'] and not report['not_found']
+
+def get_users_by_class(class_name, cluster=None):
+    try:
+        return registry.get_users_by_class(class_name, cluster)
+    except (FileNotFoundError, json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error reading user registry: {e}")
+        return []
+
+def preflight(args):
+    snapshot = take_snapshot(args.dex_backend)
+    if snapshot is None:
+        print("Warning: could not read the cluster state; skipping preflight checks.")
+    return snapshot
+
+def report_orphans(class_name, users, snapshot):
+    # Namespaces of the class that lost their profile and are not in the
+    # registry are only reported; nothing here knows who they belong to
+    orphaned = [name for name in snapshot.orphaned_namespaces(f"{class_name}-") if name not in users]
+    if orphaned:
+        print(f"Orphaned namespaces for class {class_name} not in the registry (not deleted): {', '.join(orphaned)}")
+
+def confirm_deletion(class_name, users):
+    print(f"The following users will be deleted from class {class_name}:")
+    for user in users:
+        print(user)
+    
+    confirm = input("Are you sure you want to delete these users? (yes/no): ")
+    if confirm.lower() != 'yes':
+        print("Deletion cancelled.")
+        return False
+    return True
+
+def delete_class_users(class_name, args, report):
+    # A user is deleted once even if the registry lists it twice
+    users = list(dict.fromkeys(get_users_by_class(class_name, cluster_name())))
+    snapshot = preflight(args)
+    if snapshot is not None:
+        report_orphans(class_name, users, snapshot)
+    if not users:
+        print(f"No active users found for class {class_name}")
+        report['ok'] = True
+        return
+
+    if not args.yes and not confirm_deletion(class_name, users):
+        return
+
+    backends = recorded_dex_backends(users)
+    finish_deletion(delete_users(users, args.parallel, args.stuck_timeout, snapshot, args.drain_timeout), args, report,
+                    backends)
+
+def describe_report(report):
+    return (f"{report.get('deleted', 0)} deleted, {len(report.get('failed', []))} failed, "
+            f"{len(report.get('not_found', []))} not found")
+
+def delete_on_clusters(args, argv):
+    # Confirmed once here; each cluster's process then deletes the class
+    # members the registry records on that cluster
+    if args.class_name and not args.yes:
+        # A user on several clusters is listed once
+        users = list(dict.fromkeys(username for context in args.contexts
+                                   for username in get_users_by_class(args.class_name, context)))
+        if not users:
+            print(f"No active users found for class {args.class_name}")
+            return
+        if not confirm_deletion(args.class_name, users):
+            return
+
+    results = fanout.run_on_contexts('delete', argv if args.yes else argv + ['--yes'], args.contexts,
+                                      args.report)
+    if not fanout.print_summary(results, describe_report):
+        sys.exit(1)
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Delete Kubeflow users and their namespaces.",
+        usage="%(prog)s [options] <username1> [username2] ...\n"
+              "   or: %(prog)s [options] --class <class_name>")
+    parser.add_argument('usernames', nargs='*', help="users to delete")
+    parser.add_argument('--class', dest='class_name', help="delete every active user of this class")
+    parser.add_argument('--yes', action='store_true', help="delete the class without asking for confirmation")
+    parser.add_argument('--parallel', type=int, default=8,
+                        help="maximum number of users whose deletion is requested at once (default: 8)")
+    parser.add_argument('--stuck-timeout', type=int, default=180,
+                        help="seconds a namespace may stay Terminating before it is force deleted (default: 180)")
+    parser.add_argument('--drain-timeout', type=int, default=DEFAULT_DRAIN_TIMEOUT,
+                        help="seconds to wait for notebooks, statefulsets, pods and volume claims to be deleted before "
+                             f"the namespace, 0 to skip draining (default: {DEFAULT_DRAIN_TIMEOUT})")
+    dex_rollout.add_arguments(parser)
+    add_backend_argument(parser)
+    fanout.add_arguments(parser)
+    throttle.add_arguments(parser)
+    timing.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if bool(args.usernames) == bool(args.class_name):
+        parser.error("give either usernames or --class <class_name>")
+    if args.parallel < 1:
+        parser.error("--parallel must be at least 1")
+    return args
+
+def main(argv=None, prog=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv, prog)
+    if args.contexts:
+        delete_on_clusters(args, argv)
+        return
+    set_context(args.context)
+    timing.configure(args.metrics_log)
+    throttle.configure(args.api_qps, args.api_burst, args.api_retries)
+    report = {'cluster': current_context(), 'ok': False}
+    try:
+        if args.class_name:
+            timing.set_attributes(class_tag=args.class_name)
+            delete_class_users(args.class_name, args, report)
+        else:
+            backends = recorded_dex_backends(args.usernames)
+            finish_deletion(delete_users(args.usernames, args.parallel, args.stuck_timeout, preflight(args), args.drain_timeout),
+                            args, report, backends)
+    finally:
+        timing.finish(args, 'delete-user')
+        fanout.write_report(args.report, report)
+
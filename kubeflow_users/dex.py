@@ -0,0 +1,415 @@
+import argparse
+import os
+import shlex
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from kubeflow_users import dex_rollout, fanout, paths, throttle, timing
+from kubeflow_users.dex_passwords import DEFAULT_BCRYPT_ROUNDS, StaticPasswordIndex, dump_yaml, load_yaml
+from kubeflow_users.dex_rollout import DEFAULT_RESTART_WINDOW, DEFAULT_ROLLOUT_TIMEOUT, restart_dex_coalesced, utc_now
+from kubeflow_users.dex_storage import load_password_index, remove_passwords, write_password_changes
+from kubeflow_users.kube_client import ApiError, cluster_name, current_context, get_client, set_context
+from kubeflow_users.shell import run_command
+
+# Where Dex logins are written: staticPasswords in the `dex` ConfigMap, which
+# needs a Dex restart per change, or Password objects in Dex's Kubernetes
+# storage, which Dex picks up immediately (see dex_storage.py)
+DEX_BACKENDS = ('configmap', 'crd')
+
+def add_backend_argument(parser):
+    parser.add_argument('--dex-backend', choices=DEX_BACKENDS, default='configmap',
+                        help="store Dex logins as staticPasswords in the dex ConfigMap (default), "
+                             "or as Password objects that need no Dex restart (crd)")
+
+@timing.timed('dex_fetch')
+def get_dex_config():
+    client = get_client()
+    if client is not None:
+        try:
+            configmap = client.get_configmap('auth', 'dex')
+        except (ApiError, OSError) as e:
+            print(f"Error: Failed to retrieve Dex configuration: {e}")
+            return None
+        dex_config = dump_yaml(configmap)
+    else:
+        dex_config = run_command('kubectl get configmap dex -n auth -o yaml')
+        if dex_config is None:
+            print("Error: Failed to retrieve Dex configuration.")
+            return None
+
+    # Keep a copy of what was read next to the updated config, for auditing
+    try:
+        with open(paths.manifest('config.yaml'), 'w') as file:
+            file.write(dex_config)
+    except IOError as e:
+        print(f"Error writing config.yaml: {e}")
+        return None
+    return dex_config
+
+def static_passwords(dex_config):
+    # The staticPasswords entries of a dex ConfigMap given as YAML text
+    config = load_yaml(dex_config)
+    return load_yaml(config['data']['config.yaml']).get('staticPasswords') or []
+
+def hash_password(password, rounds=DEFAULT_BCRYPT_ROUNDS):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+@timing.timed('dex_hash')
+def hash_passwords(passwords, rounds=DEFAULT_BCRYPT_ROUNDS):
+    # bcrypt is CPU bound, so hash in a process pool sized to the available cores
+    workers = min(len(passwords), os.cpu_count() or 1)
+    start = time.monotonic()
+    if workers <= 1:
+        hashes = [hash_password(password, rounds) for password in passwords]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            hashes = list(executor.map(hash_password, passwords, [rounds] * len(passwords)))
+    elapsed = time.monotonic() - start
+    print(f"Hashed {len(passwords)} password(s) at cost {rounds} in {elapsed:.2f}s using {max(workers, 1)} worker(s)")
+    return hashes
+
+def update_dex_config(dex_config, users_data, bcrypt_rounds=DEFAULT_BCRYPT_ROUNDS, dry_run=False):
+    import yaml
+    if dex_config is None:
+        print("Error: Dex configuration is None.")
+        return None
+
+    try:
+        config = load_yaml(dex_config)
+    except yaml.YAMLError as e:
+        print(f"Error parsing Dex configuration: {e}")
+        return None
+
+    if 'data' not in config or 'config.yaml' not in config['data']:
+        print("Error: Unexpected Dex configuration structure.")
+        return None
+
+    try:
+        dex_config_yaml = load_yaml(config['data']['config.yaml'])
+    except yaml.YAMLError as e:
+        print(f"Error parsing Dex config.yaml: {e}")
+        return None
+
+    index = StaticPasswordIndex(dex_config_yaml.get('staticPasswords'))
+
+    if dry_run:
+        hashed_passwords = ['<bcrypt hash>'] * len(users_data)
+    else:
+        hashed_passwords = hash_passwords([user_data['password'] for user_data in users_data], bcrypt_rounds)
+
+    for user_data, hashed_password in zip(users_data, hashed_passwords):
+        new_user = {
+            'email': user_data['user_email'],
+            'hash': hashed_password,
+            'username': user_data['username']
+        }
+        try:
+            index.upsert(new_user)
+        except ValueError as e:
+            print(f"Skipping Dex entry for {user_data['username']}: {e}")
+
+    print(f"Dex staticPasswords: {index.summary()}")
+    if dry_run:
+        print(index.format_changes())
+
+    dex_config_yaml['staticPasswords'] = index.entries
+    config['data']['config.yaml'] = dump_yaml(dex_config_yaml)
+
+    return dump_yaml(config)
+
+@timing.timed('dex_apply')
+def apply_dex_config(config):
+    if config is None:
+        print("Error: Dex configuration is None. Cannot apply.")
+        return None
+
+    updated_path = paths.manifest('updated-dex-config.yaml')
+    with open(updated_path, 'w') as file:
+        file.write(config)
+
+    client = get_client()
+    if client is None:
+        return run_command(f'kubectl apply -f {shlex.quote(updated_path)}')
+
+    try:
+        client.replace_configmap(load_yaml(config))
+    except (ApiError, OSError) as e:
+        print(f"Error applying Dex configuration: {e}")
+        return None
+    return "configmap/dex replaced"
+
+def restart_dex(config_applied_at, window=DEFAULT_RESTART_WINDOW, timeout=DEFAULT_ROLLOUT_TIMEOUT):
+    return restart_dex_coalesced(get_client(), run_command, config_applied_at, window, timeout)
+
+def remove_dex_users(usernames, window=DEFAULT_RESTART_WINDOW, timeout=DEFAULT_ROLLOUT_TIMEOUT, backend='configmap'):
+    # One ConfigMap read, one write and at most one restart for the whole run
+    if not usernames:
+        return True
+    if backend == 'crd':
+        return remove_passwords(usernames)
+    import yaml
+
+    dex_config = get_dex_config()
+    if dex_config is None:
+        return False
+
+    try:
+        config = load_yaml(dex_config)
+        dex_config_yaml = load_yaml(config['data']['config.yaml'])
+    except (yaml.YAMLError, KeyError, TypeError) as e:
+        print(f"Error parsing Dex configuration: {e}")
+        return False
+
+    index = StaticPasswordIndex(dex_config_yaml.get('staticPasswords'))
+    removed = [username for username in usernames if index.remove(username) is not None]
+    if not removed:
+        print("No Dex staticPasswords entries to remove.")
+        return True
+
+    print(f"Removing {len(removed)} user(s) from Dex staticPasswords:")
+    print(index.format_changes())
+    dex_config_yaml['staticPasswords'] = index.entries
+    config['data']['config.yaml'] = dump_yaml(dex_config_yaml)
+
+    if apply_dex_config(dump_yaml(config)) is None:
+        return False
+    return restart_dex(utc_now(), window, timeout) is not None
+
+def migrate_static_passwords(keep_static=False, dry_run=False, window=DEFAULT_RESTART_WINDOW,
+                             timeout=DEFAULT_ROLLOUT_TIMEOUT):
+    import yaml
+    dex_config = get_dex_config()
+    if dex_config is None:
+        return False
+
+    try:
+        config = load_yaml(dex_config)
+        dex_config_yaml = load_yaml(config['data']['config.yaml'])
+    except (yaml.YAMLError, KeyError, TypeError) as e:
+        print(f"Error parsing Dex configuration: {e}")
+        return False
+
+    # Dex only consults Password objects with Kubernetes storage and the password DB enabled
+    if (dex_config_yaml.get('storage') or {}).get('type') != 'kubernetes' or not dex_config_yaml.get('enablePasswordDB'):
+        print("Error: Dex needs `storage: type: kubernetes` and `enablePasswordDB: true` to use Password objects.")
+        return False
+
+    static_entries = StaticPasswordIndex(dex_config_yaml.get('staticPasswords')).entries
+    if not static_entries:
+        print("No staticPasswords entries to migrate.")
+        return True
+
+    loaded = load_password_index()
+    if loaded is None:
+        return False
+    index, existing = loaded
+
+    # Entries keep their hash and userID, so nobody has to reset a password
+    skipped = []
+    for entry in static_entries:
+        try:
+            index.upsert(entry)
+        except ValueError as e:
+            print(f"Not migrating {entry.get('username')}: {e}")
+            skipped.append(entry)
+
+    print(f"Migrating {len(static_entries) - len(skipped)} staticPasswords entries to Dex Password objects: {index.summary()}")
+    print(index.format_changes())
+    if dry_run:
+        return True
+    if not write_password_changes(index, existing):
+        return False
+    from kubeflow_users.registry import record_dex_logins
+    record_dex_logins([index.get(username=entry.get('username')) for entry in static_entries if entry not in skipped], 'crd',
+                      cluster_name())
+    if keep_static:
+        return True
+
+    # Static entries take precedence over stored ones, so drop the migrated ones
+    dex_config_yaml['staticPasswords'] = skipped
+    config['data']['config.yaml'] = dump_yaml(dex_config_yaml)
+    if apply_dex_config(dump_yaml(config)) is None:
+        return False
+    return restart_dex(utc_now(), window, timeout) is not None
+
+# Keys the API server sets, which must not be sent back with a saved copy
+SERVER_METADATA = ('resourceVersion', 'uid', 'creationTimestamp', 'managedFields', 'generation', 'selfLink')
+
+def registry_logins(live_entries, prune=False):
+    # The staticPasswords list the registry describes: one entry per active
+    # user from the recorded hash and userID, in the order of the live list
+    # so an unchanged config rebuilds to the same bytes. Active users with no
+    # recorded hash keep their live entry; entries for users the registry
+    # does not know (such as a hand-added admin) are kept unless `prune`.
+    from kubeflow_users.registry import get_all_active_users
+    live = {entry.get('username'): entry for entry in live_entries}
+    rebuilt = {}
+    unrecorded = []
+    stored = 0
+    for user in get_all_active_users(cluster_name()):
+        if user.get('dex_backend') == 'crd':
+            # Logs in through a Dex Password object instead
+            stored += 1
+        elif user.get('dex_hash') and user.get('dex_user_id'):
+            rebuilt[user['username']] = {'email': user['email'], 'hash': user['dex_hash'],
+                                         'username': user['username'], 'userID': user['dex_user_id']}
+        elif user['username'] in live:
+            rebuilt[user['username']] = live[user['username']]
+            unrecorded.append(user['username'])
+        else:
+            print(f"Active user {user['username']} has no recorded Dex hash and no Dex entry; skipping")
+    if stored:
+        print(f"Leaving out {stored} user(s) whose logins are Dex Password objects")
+    if unrecorded:
+        print(f"Kept the live Dex entries of {len(unrecorded)} user(s) with no recorded hash: {', '.join(unrecorded)}")
+
+    unknown = [username for username in live if username not in rebuilt]
+    if unknown:
+        print(f"{'Removing' if prune else 'Keeping'} {len(unknown)} Dex entr{'y' if len(unknown) == 1 else 'ies'} "
+              f"not in the registry: {', '.join(map(str, unknown))}")
+    if not prune:
+        rebuilt.update((username, live[username]) for username in unknown)
+
+    position = {username: i for i, username in enumerate(live)}
+    order = sorted(rebuilt, key=lambda username: position.get(username, len(position)))
+    return StaticPasswordIndex([rebuilt[username] for username in order])
+
+def describe_login_changes(live_entries, rebuilt_entries):
+    live = {entry.get('username'): entry for entry in live_entries}
+    rebuilt = {entry.get('username'): entry for entry in rebuilt_entries}
+    for username, entry in rebuilt.items():
+        if username not in live:
+            print(f"  + {username} <{entry.get('email')}>")
+        elif live[username] != entry:
+            fields = [field for field in ('email', 'hash', 'userID') if live[username].get(field) != entry.get(field)]
+            print(f"  ~ {username} ({', '.join(fields)})")
+    for username in live:
+        if username not in rebuilt:
+            print(f"  - {username}")
+    if live == rebuilt:
+        print("  (same entries; only their order or formatting differs)")
+
+def rebuild_static_passwords(base=None, check=False, prune=False, window=DEFAULT_RESTART_WINDOW,
+                             timeout=DEFAULT_ROLLOUT_TIMEOUT):
+    # Regenerates staticPasswords from the registry's recorded hashes; nothing is hashed
+    import yaml
+    if base:
+        try:
+            with open(base, 'r') as file:
+                dex_config = file.read()
+        except OSError as e:
+            print(f"Error reading {base}: {e}")
+            return False
+    else:
+        dex_config = get_dex_config()
+        if dex_config is None:
+            print(f"Pass --base {paths.manifest('config.yaml')} to rebuild on the last copy that was read.")
+            return False
+
+    try:
+        config = load_yaml(dex_config)
+        live_text = config['data']['config.yaml']
+        dex_config_yaml = load_yaml(live_text)
+    except (yaml.YAMLError, KeyError, TypeError) as e:
+        print(f"Error parsing Dex configuration: {e}")
+        return False
+
+    live_entries = dex_config_yaml.get('staticPasswords') or []
+    index = registry_logins(live_entries, prune)
+    dex_config_yaml['staticPasswords'] = index.entries
+    rebuilt_text = dump_yaml(dex_config_yaml)
+    if check and base:
+        # --check always compares with the config Dex is serving, even when
+        # the rebuild starts from a saved copy
+        live_config = get_dex_config()
+        if live_config is None:
+            return False
+        try:
+            live_text = load_yaml(live_config)['data']['config.yaml']
+            live_entries = (load_yaml(live_text) or {}).get('staticPasswords') or []
+        except (yaml.YAMLError, KeyError, TypeError) as e:
+            print(f"Error parsing Dex configuration: {e}")
+            return False
+    if rebuilt_text == live_text and (check or not base):
+        print(f"Dex staticPasswords ({len(index.entries)} entries) match the registry byte for byte; in sync.")
+        return True
+
+    compared = 'base' if base and not check else 'live'
+    print(f"Rebuilt Dex staticPasswords: {len(index.entries)} entries; changes against the {compared} config:")
+    describe_login_changes(live_entries, index.entries)
+    if check:
+        return False
+
+    config['data']['config.yaml'] = rebuilt_text
+    for key in SERVER_METADATA:
+        config['metadata'].pop(key, None)
+    if apply_dex_config(dump_yaml(config)) is None:
+        return False
+
+    # Read back what the API server stored and compare it with what was sent
+    applied = get_dex_config()
+    try:
+        applied_text = load_yaml(applied)['data']['config.yaml'] if applied is not None else None
+    except (yaml.YAMLError, KeyError, TypeError):
+        applied_text = None
+    if applied_text != rebuilt_text:
+        print("Error: the live Dex configuration does not match the rebuilt one after applying it.")
+        return False
+    print(f"Verified: the live Dex configuration matches the rebuilt one byte for byte ({len(rebuilt_text)} bytes).")
+    return restart_dex(utc_now(), window, timeout) is not None
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Manage where Dex logins are stored.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help="move staticPasswords entries from the dex ConfigMap to Password objects")
+    migrate.add_argument('--dry-run', action='store_true', help="show the entries that would move without changing anything")
+    migrate.add_argument('--keep-static', action='store_true',
+                         help="leave the staticPasswords entries in the ConfigMap (and skip the Dex restart)")
+    dex_rollout.add_arguments(migrate)
+    fanout.add_arguments(migrate)
+    throttle.add_arguments(migrate)
+    timing.add_arguments(migrate)
+
+    rebuild = subparsers.add_parser('rebuild', help="regenerate staticPasswords from the hashes recorded in the registry")
+    rebuild.add_argument('--check', action='store_true',
+                         help="only compare the rebuilt staticPasswords with the live config; exit 1 if they differ")
+    rebuild.add_argument('--base', metavar='FILE',
+                         help="rebuild on a saved dex ConfigMap (such as manifests/config.yaml) instead of the live one")
+    rebuild.add_argument('--prune', action='store_true', help="also remove entries for users the registry does not know")
+    dex_rollout.add_arguments(rebuild)
+    rebuild.add_argument('--context', help="kubeconfig context to run against (default: the current context)")
+    throttle.add_arguments(rebuild)
+    timing.add_arguments(rebuild)
+    return parser.parse_args(argv)
+
+def describe_report(report):
+    return "migration finished" if report.get('ok') else "migration failed"
+
+def main(argv=None, prog=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv, prog)
+    if args.command == 'migrate' and args.contexts:
+        results = fanout.run_on_contexts('dex', argv, args.contexts, args.report)
+        if not fanout.print_summary(results, describe_report):
+            sys.exit(1)
+        return
+    set_context(args.context)
+    timing.configure(args.metrics_log)
+    throttle.configure(args.api_qps, args.api_burst, args.api_retries)
+    report = {'cluster': current_context(), 'ok': False}
+    try:
+        if args.command == 'migrate':
+            report['ok'] = migrate_static_passwords(args.keep_static, args.dry_run, args.restart_window, args.rollout_timeout)
+            if not report['ok']:
+                print("Migration of Dex staticPasswords failed.")
+                sys.exit(1)
+        elif args.command == 'rebuild':
+            if not rebuild_static_passwords(args.base, args.check, args.prune, args.restart_window, args.rollout_timeout):
+                if not args.check:
+                    print("Rebuild of Dex staticPasswords failed.")
+                sys.exit(1)
+    finally:
+        timing.finish(args, 'dex')
+        if args.command == 'migrate':
+            fanout.write_report(args.report, report)
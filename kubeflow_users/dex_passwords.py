@@ -0,0 +1,157 @@
+import argparse
+import uuid
+
+# Dex rejects hashes cheaper than bcrypt.DefaultCost (10) and gets noticeably
+# slow at login above 16.
+DEX_MIN_BCRYPT_ROUNDS = 10
+DEX_MAX_BCRYPT_ROUNDS = 16
+DEFAULT_BCRYPT_ROUNDS = 12
+
+_loader = None
+_dumper = None
+
+def yaml_codecs():
+    # PyYAML is imported on first use. Prefer the libyaml bindings; the Dex
+    # ConfigMap is parsed and dumped twice (the ConfigMap and its embedded
+    # config.yaml) on every update.
+    global _loader, _dumper
+    if _loader is None:
+        try:
+            from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeDumper, SafeLoader
+        _loader, _dumper = SafeLoader, SafeDumper
+    return _loader, _dumper
+
+def load_yaml(text):
+    import yaml
+    return yaml.load(text, Loader=yaml_codecs()[0])
+
+def dump_yaml(data):
+    import yaml
+    return yaml.dump(data, Dumper=yaml_codecs()[1], default_flow_style=False)
+
+def bcrypt_rounds(value):
+    # argparse type for --bcrypt-rounds
+    rounds = int(value)
+    if not DEX_MIN_BCRYPT_ROUNDS <= rounds <= DEX_MAX_BCRYPT_ROUNDS:
+        raise argparse.ArgumentTypeError(f"must be between {DEX_MIN_BCRYPT_ROUNDS} and {DEX_MAX_BCRYPT_ROUNDS}: {value}")
+    return rounds
+
+def new_user_id():
+    return str(uuid.uuid4())
+
+class StaticPasswordIndex:
+    # Dex matches logins on email case-insensitively and needs unique usernames
+    # and userIDs, so every entry is indexed on all three.
+    def __init__(self, entries):
+        self._entries = {}
+        self._next_key = 0
+        self.by_email = {}
+        self.by_username = {}
+        self.by_user_id = {}
+        self.changes = []
+
+        for entry in entries or []:
+            # Later entries win, matching the order they were appended in
+            for key in self._matches(entry):
+                self.changes.append(('removed', self._entries[key], 'duplicate'))
+                self._remove(key)
+            entry = dict(entry)
+            user_id = entry.get('userID')
+            self._add(entry)
+            if entry['userID'] != user_id:
+                self.changes.append(('updated', entry, f"userID {user_id} collided"))
+
+    @property
+    def entries(self):
+        return list(self._entries.values())
+
+    def get(self, username=None, email=None):
+        key = self.by_username.get(username) if username is not None else self.by_email.get((email or '').lower())
+        return self._entries.get(key) if key is not None else None
+
+    def _matches(self, entry):
+        keys = []
+        for key in (self.by_email.get((entry.get('email') or '').lower()), self.by_username.get(entry.get('username'))):
+            if key is not None and key not in keys:
+                keys.append(key)
+        return keys
+
+    def _index(self, key, entry):
+        self.by_email[(entry.get('email') or '').lower()] = key
+        self.by_username[entry.get('username')] = key
+        self.by_user_id[entry.get('userID')] = key
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for index, value in ((self.by_email, (entry.get('email') or '').lower()),
+                             (self.by_username, entry.get('username')),
+                             (self.by_user_id, entry.get('userID'))):
+            if index.get(value) == key:
+                del index[value]
+        return entry
+
+    def _add(self, entry, key=None):
+        if key is None:
+            key = self._next_key
+            self._next_key += 1
+        # Guard against userID collisions (older entries used 5-character IDs)
+        owner = self.by_user_id.get(entry.get('userID'))
+        if not entry.get('userID') or (owner is not None and owner != key):
+            entry['userID'] = new_user_id()
+            while entry['userID'] in self.by_user_id:
+                entry['userID'] = new_user_id()
+        self._entries[key] = entry
+        self._index(key, entry)
+        return key
+
+    def upsert(self, entry):
+        entry = dict(entry)
+        matches = self._matches(entry)
+        if len(matches) > 1:
+            raise ValueError(f"email {entry.get('email')} and username {entry.get('username')} belong to different Dex users")
+
+        if matches:
+            key = matches[0]
+            # Only the same user is updated; a matching email or username
+            # alone must not take over someone else's login
+            current = self._entries[key]
+            if ((current.get('email') or '').lower() != (entry.get('email') or '').lower()
+                    or current.get('username') != entry.get('username')):
+                raise ValueError(f"Dex user {current.get('username')} <{current.get('email')}> has the same "
+                                 f"{'email' if current.get('username') != entry.get('username') else 'username'}")
+            previous = self._remove(key)
+            # Keep the existing userID so the user's identity does not change
+            entry['userID'] = previous.get('userID')
+            self._add(entry, key)
+            self.changes.append(('updated', entry, None))
+            return 'updated'
+
+        self._add(entry)
+        self.changes.append(('added', entry, None))
+        return 'added'
+
+    def remove(self, username):
+        key = self.by_username.get(username)
+        if key is None:
+            return None
+        entry = self._remove(key)
+        self.changes.append(('removed', entry, None))
+        return entry
+
+    def format_changes(self):
+        symbols = {'added': '+', 'updated': '~', 'removed': '-'}
+        lines = []
+        for action, entry, note in self.changes:
+            line = f"  {symbols[action]} {entry.get('username')} <{entry.get('email')}> userID={entry.get('userID')}"
+            if note:
+                line += f" ({note})"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def summary(self):
+        counts = {}
+        for action, _, _ in self.changes:
+            counts[action] = counts.get(action, 0) + 1
+        return ', '.join(f"{counts[action]} {action}" for action in ('added', 'updated', 'removed') if action in counts) or "no changes"
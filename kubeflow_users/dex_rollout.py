@@ -0,0 +1,151 @@
+import time
+from datetime import datetime, timezone
+from kubeflow_users import timing
+from kubeflow_users.dex_passwords import load_yaml
+from kubeflow_users.kube_client import ApiError
+from kubeflow_users.throttle import non_negative
+
+DEX_NAMESPACE = 'auth'
+DEX_DEPLOYMENT = 'dex'
+RESTARTED_AT_ANNOTATION = 'kubectl.kubernetes.io/restartedAt'
+
+DEFAULT_RESTART_WINDOW = 10
+DEFAULT_ROLLOUT_TIMEOUT = 300
+
+def add_arguments(parser):
+    parser.add_argument('--restart-window', type=non_negative(int), default=DEFAULT_RESTART_WINDOW,
+                        help=f"seconds to wait so concurrent Dex restarts are merged into one (default: {DEFAULT_RESTART_WINDOW})")
+    parser.add_argument('--rollout-timeout', type=non_negative(int), default=DEFAULT_ROLLOUT_TIMEOUT,
+                        help=f"seconds to wait for the restarted Dex pods to become Ready (default: {DEFAULT_ROLLOUT_TIMEOUT})")
+
+def dex_config_changed(old_config, new_config):
+    # Compare the parsed config.yaml so formatting differences do not count;
+    # a config that cannot be parsed counts as changed
+    import yaml
+    try:
+        old_data = load_yaml(load_yaml(old_config)['data']['config.yaml'])
+        new_data = load_yaml(load_yaml(new_config)['data']['config.yaml'])
+    except (KeyError, TypeError, ValueError, yaml.YAMLError):
+        return True
+    return old_data != new_data
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+def parse_timestamp(value):
+    # RFC3339 in UTC from the API path, or with the local offset (e.g.
+    # +05:00) as `kubectl rollout restart` writes it; returned in UTC
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def rollout_complete(deployment):
+    metadata = deployment.get('metadata', {})
+    spec = deployment.get('spec', {})
+    status = deployment.get('status', {})
+    replicas = spec.get('replicas', 1)
+    # Same conditions `kubectl rollout status` waits for
+    return (status.get('observedGeneration', 0) >= metadata.get('generation', 0)
+            and status.get('updatedReplicas', 0) == replicas
+            and status.get('replicas', 0) == replicas
+            and status.get('availableReplicas', 0) == replicas)
+
+def wait_for_rollout(client, timeout=DEFAULT_ROLLOUT_TIMEOUT):
+    start = time.monotonic()
+    deadline = start + timeout
+    outage_started = None
+    outage = 0.0
+
+    def track(deployment):
+        nonlocal outage_started, outage
+        available = deployment.get('status', {}).get('availableReplicas', 0)
+        now = time.monotonic()
+        if not available and outage_started is None:
+            outage_started = now
+        elif available and outage_started is not None:
+            outage += now - outage_started
+            outage_started = None
+
+    deployment = client.get('Deployment', DEX_DEPLOYMENT, DEX_NAMESPACE)
+    track(deployment)
+    while not rollout_complete(deployment):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Timed out after {timeout}s waiting for the Dex rollout to become Ready")
+            return None
+        resource_version = deployment['metadata'].get('resourceVersion')
+        try:
+            for event_type, obj in client.watch('Deployment', DEX_NAMESPACE, DEX_DEPLOYMENT,
+                                                resource_version=resource_version, timeout=remaining):
+                if event_type in ('ADDED', 'MODIFIED'):
+                    deployment = obj
+                    track(deployment)
+                    if rollout_complete(deployment):
+                        break
+            else:
+                # The watch expired or was closed; re-read to pick up a fresh resourceVersion
+                deployment = client.get('Deployment', DEX_DEPLOYMENT, DEX_NAMESPACE)
+                track(deployment)
+        except ApiError as e:
+            if e.status != 410:
+                raise
+            deployment = client.get('Deployment', DEX_DEPLOYMENT, DEX_NAMESPACE)
+            track(deployment)
+
+    if outage_started is not None:
+        outage += time.monotonic() - outage_started
+    return time.monotonic() - start, outage
+
+@timing.timed('dex_restart')
+def restart_dex_coalesced(client, run_command, config_applied_at, window=DEFAULT_RESTART_WINDOW,
+                          timeout=DEFAULT_ROLLOUT_TIMEOUT):
+    # Give other admins' restarts a chance to land, then only restart if no
+    # rollout has started since our ConfigMap change
+    if window > 0:
+        print(f"Waiting {window}s to coalesce Dex restarts")
+        time.sleep(window)
+
+    if client is None:
+        return restart_dex_kubectl(run_command, config_applied_at, timeout)
+
+    try:
+        deployment = client.get('Deployment', DEX_DEPLOYMENT, DEX_NAMESPACE)
+        annotations = deployment.get('spec', {}).get('template', {}).get('metadata', {}).get('annotations') or {}
+        restarted_at = parse_timestamp(annotations.get(RESTARTED_AT_ANNOTATION))
+        if restarted_at is not None and restarted_at > config_applied_at:
+            print(f"Dex was already restarted at {restarted_at.isoformat()} after the config change; joining that rollout")
+        else:
+            client.restart_deployment(DEX_NAMESPACE, DEX_DEPLOYMENT)
+            print("Dex restart triggered")
+        result = wait_for_rollout(client, timeout)
+    except (ApiError, OSError) as e:
+        print(f"Error restarting Dex: {e}")
+        return None
+
+    if result is None:
+        return None
+    elapsed, outage = result
+    print(f"Dex rollout Ready after {elapsed:.1f}s; logins were unavailable for {outage:.1f}s")
+    return "deployment.apps/dex restarted"
+
+def restart_dex_kubectl(run_command, config_applied_at, timeout=DEFAULT_ROLLOUT_TIMEOUT):
+    output = run_command(f"kubectl get deployment {DEX_DEPLOYMENT} -n {DEX_NAMESPACE} "
+                         f"-o jsonpath='{{.spec.template.metadata.annotations.kubectl\\.kubernetes\\.io/restartedAt}}'")
+    restarted_at = parse_timestamp((output or '').strip())
+    if restarted_at is not None and restarted_at > config_applied_at:
+        print(f"Dex was already restarted at {restarted_at.isoformat()} after the config change; joining that rollout")
+    elif run_command(f'kubectl rollout restart deployment {DEX_DEPLOYMENT} -n {DEX_NAMESPACE}') is None:
+        return None
+
+    start = time.monotonic()
+    if run_command(f'kubectl rollout status deployment {DEX_DEPLOYMENT} -n {DEX_NAMESPACE} --timeout={timeout}s') is None:
+        print(f"Dex rollout did not become Ready within {timeout}s")
+        return None
+    print(f"Dex rollout Ready after {time.monotonic() - start:.1f}s")
+    return "deployment.apps/dex restarted"
@@ -0,0 +1,170 @@
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from kubeflow_users import timing
+from kubeflow_users.dex_passwords import StaticPasswordIndex
+from kubeflow_users.dex_rollout import DEX_NAMESPACE
+from kubeflow_users.kube_client import ApiError, get_client
+from kubeflow_users.shell import run_command
+
+# Dex with `storage: type: kubernetes` keeps its password database as
+# Password objects in its own namespace. Dex reads them on every login, so
+# creating or deleting one takes effect without restarting Dex, and each user
+# is a small object instead of a line in the one `dex` ConfigMap.
+PASSWORD_API_VERSION = 'dex.coreos.com/v1'
+PASSWORD_RESOURCE = 'passwords.dex.coreos.com'
+
+# FNV-64 of the empty string; Dex appends it to every name it derives
+FNV64_OFFSET_BASIS = bytes.fromhex('cbf29ce484222325')
+
+WRITE_WORKERS = 8
+
+def password_name(email):
+    # Same as Dex's idToName(): lowercase base32 of the email followed by an
+    # empty FNV-64 sum, without padding
+    data = email.lower().encode('utf-8') + FNV64_OFFSET_BASIS
+    return base64.b32encode(data).decode('ascii').lower().rstrip('=')
+
+def to_object(entry):
+    # Password.hash is a Go []byte, so the bcrypt string travels base64-encoded
+    email = entry['email'].lower()
+    return {
+        'apiVersion': PASSWORD_API_VERSION,
+        'kind': 'Password',
+        'metadata': {'name': password_name(email), 'namespace': DEX_NAMESPACE},
+        'email': email,
+        'hash': base64.b64encode(entry['hash'].encode('utf-8')).decode('ascii'),
+        'username': entry['username'],
+        'userID': entry['userID'],
+    }
+
+def to_entry(obj):
+    return {
+        'email': obj.get('email'),
+        'hash': base64.b64decode(obj.get('hash') or '').decode('utf-8'),
+        'username': obj.get('username'),
+        'userID': obj.get('userID'),
+    }
+
+@timing.timed('dex_fetch')
+def list_passwords():
+    client = get_client()
+    if client is None:
+        output = run_command(f'kubectl get {PASSWORD_RESOURCE} -n {DEX_NAMESPACE} -o json')
+        if output is None:
+            print("Error: Failed to list Dex Password objects.")
+            return None
+        return json.loads(output).get('items', [])
+
+    try:
+        return client.list('Password', DEX_NAMESPACE).get('items', [])
+    except (ApiError, OSError) as e:
+        print(f"Error: Failed to list Dex Password objects: {e}")
+        return None
+
+def load_password_index():
+    # Returns (index, objects by name) for the stored passwords, or None
+    items = list_passwords()
+    if items is None:
+        return None
+    existing = {}
+    for item in items:
+        obj = to_object(to_entry(item))
+        existing[item['metadata']['name']] = obj
+    return StaticPasswordIndex([to_entry(obj) for obj in existing.values()]), existing
+
+def apply_objects(client, objects):
+    if client is None:
+        manifest = json.dumps({'apiVersion': 'v1', 'kind': 'List', 'items': objects})
+        return [] if run_command('kubectl apply -f -', input_data=manifest) is not None else [obj['email'] for obj in objects]
+
+    def apply(obj):
+        try:
+            client.apply(obj)
+            return None
+        except (ApiError, OSError) as e:
+            print(f"Error writing Dex Password for {obj['email']}: {e}")
+            return obj['email']
+
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+        return [email for email in executor.map(apply, objects) if email is not None]
+
+def delete_objects(client, names):
+    if client is None:
+        result = run_command(f"kubectl delete {PASSWORD_RESOURCE} -n {DEX_NAMESPACE} {' '.join(names)} --ignore-not-found")
+        return [] if result is not None else list(names)
+
+    def delete(name):
+        try:
+            client.delete('Password', name, DEX_NAMESPACE)
+        except ApiError as e:
+            if e.status != 404:
+                print(f"Error deleting Dex Password {name}: {e}")
+                return name
+        except OSError as e:
+            print(f"Error deleting Dex Password {name}: {e}")
+            return name
+        return None
+
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+        return [name for name in executor.map(delete, names) if name is not None]
+
+@timing.timed('dex_apply')
+def write_password_changes(index, existing):
+    # Only objects whose content changed are written; an email change means
+    # a new object name, so the old object is deleted
+    desired = {}
+    for entry in index.entries:
+        obj = to_object(entry)
+        desired[obj['metadata']['name']] = obj
+    changed = [obj for name, obj in desired.items() if existing.get(name) != obj]
+    removed = [name for name in existing if name not in desired]
+    if not changed and not removed:
+        return True
+
+    client = get_client()
+    failed = apply_objects(client, changed) if changed else []
+    failed += delete_objects(client, removed) if removed else []
+    print(f"Dex Password objects: {len(changed)} written, {len(removed)} deleted, {len(failed)} failed")
+    return not failed
+
+def upsert_passwords(users_data, bcrypt_rounds, dry_run=False):
+    from kubeflow_users.dex import hash_passwords
+    loaded = load_password_index()
+    if loaded is None:
+        return None
+    index, existing = loaded
+
+    if dry_run:
+        hashed_passwords = ['<bcrypt hash>'] * len(users_data)
+    else:
+        hashed_passwords = hash_passwords([user_data['password'] for user_data in users_data], bcrypt_rounds)
+
+    for user_data, hashed_password in zip(users_data, hashed_passwords):
+        try:
+            index.upsert({'email': user_data['user_email'], 'hash': hashed_password, 'username': user_data['username']})
+        except ValueError as e:
+            print(f"Skipping Dex entry for {user_data['username']}: {e}")
+
+    print(f"Dex Password objects: {index.summary()}")
+    # The index holds the entries as written, hash and userID included
+    if dry_run:
+        print(index.format_changes())
+        return index
+    return index if write_password_changes(index, existing) else None
+
+def remove_passwords(usernames):
+    if not usernames:
+        return True
+    loaded = load_password_index()
+    if loaded is None:
+        return False
+    index, existing = loaded
+
+    removed = [username for username in usernames if index.remove(username) is not None]
+    if not removed:
+        print("No Dex Password objects to remove.")
+        return True
+    print(f"Removing {len(removed)} user(s) from Dex Password objects:")
+    print(index.format_changes())
+    return write_password_changes(index, existing)
@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from kubeflow_users import paths
+
+# `--contexts a,b,c` runs a command once per kubeconfig context, each in its
+# own `python -m kubeflow_users ... --context X` process so clients, throttles,
+# snapshots and Dex updates stay per cluster. Children share the data
+# directory, write a JSON report, and their output is prefixed with the context.
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_contexts(value):
+    contexts = [context.strip() for context in value.split(',') if context.strip()]
+    if not contexts:
+        raise argparse.ArgumentTypeError("no contexts given")
+    if len(set(contexts)) != len(contexts):
+        raise argparse.ArgumentTypeError(f"contexts listed more than once: {value}")
+    return contexts
+
+def add_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--context', help="kubeconfig context to run against (default: the current context)")
+    group.add_argument('--contexts', type=parse_contexts, metavar='A,B,...',
+                       help="run against each of these kubeconfig contexts at once and report per cluster")
+    parser.add_argument('--report', metavar='FILE', help="write a JSON summary of the results to FILE")
+
+def strip_options(argv, options):
+    # argv without the given options and their values, in either
+    # `--option value` or `--option=value` form
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in options:
+            skip = True
+        elif arg.split('=', 1)[0] not in options:
+            result.append(arg)
+    return result
+
+def child_argv(argv, context, report):
+    argv = strip_options(argv, ['--contexts', '--context', '--report'])
+    # One textfile per cluster, or the children would overwrite each other's
+    if '--metrics-textfile' in argv:
+        index = argv.index('--metrics-textfile') + 1
+        root, ext = os.path.splitext(argv[index])
+        argv[index] = f"{root}-{context}{ext}"
+    return argv + ['--context', context, '--report', report]
+
+def stream(context, process):
+    for line in process.stdout:
+        print(f"[{context}] {line}", end='', flush=True)
+
+def merge_reports(results):
+    # One report for the whole run: each cluster's report under its context
+    clusters = {context: dict(report or {'ok': False}, exit_code=returncode)
+                for context, (returncode, report) in results.items()}
+    return {'ok': all(report['ok'] and report['exit_code'] == 0 for report in clusters.values()), 'clusters': clusters}
+
+def run_on_contexts(command, argv, contexts, report_path=None):
+    # Returns {context: (exit code, report or None)}. The children's reports
+    # are merged into `report_path` (the parent's --report), if given.
+    reports_dir = tempfile.mkdtemp(prefix='kubeflow-users-')
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get('PYTHONPATH')]))
+    processes = {}
+    try:
+        for index, context in enumerate(contexts):
+            report = os.path.join(reports_dir, f'{index}.json')
+            command_line = ([sys.executable, '-m', 'kubeflow_users', '--data-dir', os.path.abspath(paths.data_dir()), command]
+                            + child_argv(argv, context, report))
+            process = subprocess.Popen(command_line, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True, env=env)
+            processes[context] = (process, report)
+
+        threads = [threading.Thread(target=stream, args=(context, process)) for context, (process, _) in processes.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results = {}
+        for context, (process, report) in processes.items():
+            returncode = process.wait()
+            try:
+                with open(report, 'r') as file:
+                    results[context] = (returncode, json.load(file))
+            except (OSError, ValueError):
+                results[context] = (returncode, None)
+        write_report(report_path, merge_reports(results))
+        return results
+    finally:
+        shutil.rmtree(reports_dir, ignore_errors=True)
+
+def write_report(path, report):
+    if not path:
+        return
+    try:
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+    except OSError as e:
+        print(f"Error writing report {path}: {e}")
+
+def print_summary(results, describe):
+    # `describe` turns a child's report into one line; returns True if every
+    # cluster finished cleanly
+    width = max(len(context) for context in results)
+    all_ok = True
+    print("\nResults per cluster:")
+    for context, (returncode, report) in results.items():
+        ok = returncode == 0 and report is not None and report.get('ok')
+        all_ok = all_ok and ok
+        detail = describe(report) if report is not None else "no report"
+        if returncode != 0:
+            detail += f" (exit code {returncode})"
+        print(f"  {context:<{width}}  {'OK' if ok else 'FAILED':<6}  {detail}")
+    return all_ok
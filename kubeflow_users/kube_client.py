@@ -0,0 +1,416 @@
+import base64
+import http.client
+import json
+import os
+import queue
+import ssl
+import tempfile
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+from kubeflow_users import throttle
+
+SERVICE_ACCOUNT_DIR = '/var/run/secrets/kubernetes.io/serviceaccount'
+
+# kind -> (API prefix, plural, namespaced)
+RESOURCES = {
+    'Profile': ('/apis/kubeflow.org/v1beta1', 'profiles', False),
+    'Namespace': ('/api/v1', 'namespaces', False),
+    'ConfigMap': ('/api/v1', 'configmaps', True),
+    'Deployment': ('/apis/apps/v1', 'deployments', True),
+    'Password': ('/apis/dex.coreos.com/v1', 'passwords', True),
+    'Notebook': ('/apis/kubeflow.org/v1', 'notebooks', True),
+    'StatefulSet': ('/apis/apps/v1', 'statefulsets', True),
+    'Pod': ('/api/v1', 'pods', True),
+    'PersistentVolumeClaim': ('/api/v1', 'persistentvolumeclaims', True),
+}
+
+MERGE_PATCH = 'application/merge-patch+json'
+STRATEGIC_MERGE_PATCH = 'application/strategic-merge-patch+json'
+
+class ApiError(Exception):
+    def __init__(self, status, reason, message, retry_after=None):
+        super().__init__(f"{status} {reason}: {message}")
+        self.status = status
+        self.reason = reason
+        self.message = message
+        # Seconds the API server asked us to wait (429 and 503 responses)
+        self.retry_after = retry_after
+
+class KubeClient:
+    def __init__(self, server, token=None, ssl_context=None, pool_size=16, timeout=30):
+        parts = urlsplit(server)
+        self.server = server
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == 'https' else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.token = token
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # Idle keep-alive connections; LIFO so the warmest connection is reused first
+        self._idle = queue.LifoQueue()
+
+    def _new_connection(self, timeout=None):
+        timeout = timeout or self.timeout
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _headers(self):
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        return headers
+
+    @staticmethod
+    def _raise_for_status(response, data):
+        # The status is checked first: a proxy or load balancer in front of
+        # the API server can answer with an HTML or plain-text body, which
+        # must still become an ApiError so it is classified and retried
+        try:
+            result = json.loads(data) if data else None
+        except ValueError:
+            result = None
+        if response.status >= 400:
+            message = result.get('message', '') if isinstance(result, dict) else data.decode('utf-8', 'replace').strip()
+            reason = result.get('reason', response.reason) if isinstance(result, dict) else response.reason
+            retry_after = response.getheader('Retry-After')
+            raise ApiError(response.status, reason, message,
+                           float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if data and result is None:
+            raise ApiError(response.status, response.reason,
+                           f"response is not JSON: {data.decode('utf-8', 'replace').strip()[:200]}")
+        return result
+
+    def request(self, method, path, body=None, content_type='application/json', params=None):
+        # Rate limited, and retried on throttling and transient failures
+        return throttle.call(lambda: self._request(method, path, body, content_type, params), f"{method} {path}")
+
+    def _request(self, method, path, body, content_type, params):
+        url = self.base_path + path
+        if params:
+            url += '?' + urlencode(params)
+        headers = self._headers()
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = content_type
+
+        conn, reused = self._acquire()
+        try:
+            conn.request(method, url, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            # The server dropped an idle keep-alive connection; retry once on a fresh one
+            conn = self._new_connection()
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        return self._raise_for_status(response, data)
+
+    def watch(self, kind, namespace=None, name=None, resource_version=None, timeout=60):
+        # Streams (event type, object) pairs on a dedicated connection, so the
+        # keep-alive pool is not tied up by a long-running request
+        params = {'watch': '1', 'timeoutSeconds': str(max(int(timeout), 1))}
+        if name is not None:
+            params['fieldSelector'] = f'metadata.name={name}'
+        if resource_version is not None:
+            params['resourceVersion'] = resource_version
+        url = self.base_path + self.resource_path(kind, namespace=namespace) + '?' + urlencode(params)
+
+        throttle.acquire()
+        conn = self._new_connection(timeout=timeout + self.timeout)
+        try:
+            conn.request('GET', url, headers=self._headers())
+            response = conn.getresponse()
+            if response.status >= 400:
+                self._raise_for_status(response, response.read())
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                if line.strip():
+                    event = json.loads(line)
+                    if event['type'] == 'ERROR':
+                        status = event['object']
+                        raise ApiError(status.get('code'), status.get('reason'), status.get('message', ''))
+                    yield event['type'], event['object']
+        finally:
+            conn.close()
+
+    @staticmethod
+    def resource_path(kind, name=None, namespace=None):
+        prefix, plural, namespaced = RESOURCES[kind]
+        path = prefix
+        if namespaced:
+            path += f'/namespaces/{namespace}'
+        path += f'/{plural}'
+        if name is not None:
+            path += f'/{name}'
+        return path
+
+    def get(self, kind, name, namespace=None):
+        return self.request('GET', self.resource_path(kind, name, namespace))
+
+    def list(self, kind, namespace=None, label_selector=None):
+        params = {'labelSelector': label_selector} if label_selector else None
+        return self.request('GET', self.resource_path(kind, namespace=namespace), params=params)
+
+    def create(self, obj):
+        namespace = obj.get('metadata', {}).get('namespace')
+        return self.request('POST', self.resource_path(obj['kind'], namespace=namespace), body=obj)
+
+    def replace(self, obj):
+        metadata = obj['metadata']
+        return self.request('PUT', self.resource_path(obj['kind'], metadata['name'], metadata.get('namespace')), body=obj)
+
+    def patch(self, kind, name, patch, namespace=None, patch_type=MERGE_PATCH):
+        return self.request('PATCH', self.resource_path(kind, name, namespace), body=patch, content_type=patch_type)
+
+    def delete(self, kind, name, namespace=None, grace_period=None):
+        body = None
+        if grace_period is not None:
+            body = {'kind': 'DeleteOptions', 'apiVersion': 'v1', 'gracePeriodSeconds': grace_period}
+        return self.request('DELETE', self.resource_path(kind, name, namespace), body=body)
+
+    def delete_collection(self, kind, namespace=None):
+        return self.request('DELETE', self.resource_path(kind, namespace=namespace))
+
+    def apply(self, obj):
+        # Create-or-update, the subset of `kubectl apply` these scripts rely on
+        try:
+            return self.create(obj)
+        except ApiError as e:
+            if e.status != 409:
+                raise
+        metadata = obj['metadata']
+        patch = {key: value for key, value in obj.items() if key not in ('apiVersion', 'kind', 'metadata')}
+        return self.patch(obj['kind'], metadata['name'], patch, metadata.get('namespace'))
+
+    # Typed helpers for the resources the scripts manage
+
+    def apply_profile(self, profile):
+        return self.apply(profile)
+
+    def delete_profile(self, name, grace_period=None):
+        return self.delete('Profile', name, grace_period=grace_period)
+
+    def get_namespace(self, name):
+        return self.get('Namespace', name)
+
+    def delete_namespace(self, name, grace_period=None):
+        return self.delete('Namespace', name, grace_period=grace_period)
+
+    def remove_finalizers(self, kind, name, namespace=None):
+        return self.patch(kind, name, {'metadata': {'finalizers': None}}, namespace)
+
+    def get_configmap(self, namespace, name):
+        return self.get('ConfigMap', name, namespace)
+
+    def replace_configmap(self, configmap):
+        return self.replace(configmap)
+
+    def restart_deployment(self, namespace, name):
+        # Same annotation `kubectl rollout restart` sets on the pod template
+        restarted_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        patch = {'spec': {'template': {'metadata': {'annotations': {'kubectl.kubernetes.io/restartedAt': restarted_at}}}}}
+        return self.patch('Deployment', name, patch, namespace, patch_type=STRATEGIC_MERGE_PATCH)
+
+def _write_temp(data):
+    handle = tempfile.NamedTemporaryFile(delete=False)
+    handle.write(data)
+    handle.close()
+    return handle.name
+
+def _build_ssl_context(cluster, user):
+    if cluster.get('insecure-skip-tls-verify'):
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif 'certificate-authority-data' in cluster:
+        context = ssl.create_default_context(cadata=base64.b64decode(cluster['certificate-authority-data']).decode('utf-8'))
+    elif 'certificate-authority' in cluster:
+        context = ssl.create_default_context(cafile=cluster['certificate-authority'])
+    else:
+        context = ssl.create_default_context()
+
+    if 'client-certificate-data' in user and 'client-key-data' in user:
+        # ssl only loads certificate chains from files
+        cert_file = _write_temp(base64.b64decode(user['client-certificate-data']))
+        key_file = _write_temp(base64.b64decode(user['client-key-data']))
+        try:
+            context.load_cert_chain(cert_file, key_file)
+        finally:
+            os.remove(cert_file)
+            os.remove(key_file)
+    elif 'client-certificate' in user and 'client-key' in user:
+        context.load_cert_chain(user['client-certificate'], user['client-key'])
+    return context
+
+def _named(items, name):
+    for item in items or []:
+        if item.get('name') == name:
+            return item
+    return None
+
+def load_kubeconfig_client(path, context_name=None):
+    # Only kubeconfig users need PyYAML; in-cluster and KUBE_API_SERVER clients do not
+    import yaml
+    with open(path, 'r') as file:
+        try:
+            kubeconfig = yaml.safe_load(file)
+        except yaml.YAMLError as e:
+            raise ValueError(f"{path}: {e}")
+
+    context_name = context_name or kubeconfig.get('current-context')
+    context = _named(kubeconfig.get('contexts'), context_name)
+    if context is None:
+        print(f"Error: kubeconfig context {context_name} not found in {path}.")
+        return None
+    cluster = (_named(kubeconfig.get('clusters'), context['context'].get('cluster')) or {}).get('cluster', {})
+    user = (_named(kubeconfig.get('users'), context['context'].get('user')) or {}).get('user', {})
+
+    if 'exec' in user or 'auth-provider' in user:
+        # Credential plugins are only understood by kubectl
+        return None
+
+    token = user.get('token')
+    if token is None and 'tokenFile' in user:
+        with open(user['tokenFile'], 'r') as file:
+            token = file.read().strip()
+
+    server = cluster.get('server')
+    if not server:
+        return None
+    ssl_context = _build_ssl_context(cluster, user) if server.startswith('https') else None
+    return KubeClient(server, token=token, ssl_context=ssl_context)
+
+def load_incluster_client():
+    host = os.environ.get('KUBERNETES_SERVICE_HOST')
+    token_path = os.path.join(SERVICE_ACCOUNT_DIR, 'token')
+    if not host or not os.path.exists(token_path):
+        return None
+    port = os.environ.get('KUBERNETES_SERVICE_PORT', '443')
+    with open(token_path, 'r') as file:
+        token = file.read().strip()
+    ssl_context = ssl.create_default_context(cafile=os.path.join(SERVICE_ACCOUNT_DIR, 'ca.crt'))
+    return KubeClient(f'https://{host}:{port}', token=token, ssl_context=ssl_context)
+
+def load_client(context_name=None):
+    # KUBE_CLIENT=kubectl forces the kubectl fallback; KUBE_API_SERVER points
+    # the client straight at an API server (e.g. a local fake one)
+    if os.environ.get('KUBE_CLIENT') == 'kubectl':
+        return None
+    if os.environ.get('KUBE_API_SERVER'):
+        return KubeClient(os.environ['KUBE_API_SERVER'], token=os.environ.get('KUBE_API_TOKEN'))
+
+    kubeconfig_path = os.environ.get('KUBECONFIG', '').split(os.pathsep)[0] or os.path.expanduser('~/.kube/config')
+    try:
+        if os.path.exists(kubeconfig_path):
+            return load_kubeconfig_client(kubeconfig_path, context_name)
+        return load_incluster_client()
+    except (OSError, ssl.SSLError, KeyError, ValueError) as e:
+        print(f"Could not configure the Kubernetes API client ({e}); falling back to kubectl.")
+        return None
+
+_client = None
+_client_loaded = False
+_client_lock = threading.Lock()
+# kubeconfig context chosen with --context; None is the current context
+_context = None
+_cluster_name = None
+_cluster_name_loaded = False
+
+def set_context(name):
+    global _context, _client_loaded, _cluster_name_loaded
+    with _client_lock:
+        _context = name
+        _client_loaded = False
+        _cluster_name_loaded = False
+
+def current_context():
+    return _context
+
+def kubeconfig_current_context():
+    # The context kubectl uses without --context: the first current-context
+    # set in the KUBECONFIG files
+    kubeconfig_paths = [path for path in os.environ.get('KUBECONFIG', '').split(os.pathsep) if path]
+    for path in kubeconfig_paths or [os.path.expanduser('~/.kube/config')]:
+        if not os.path.exists(path):
+            continue
+        import yaml
+        try:
+            with open(path, 'r') as file:
+                name = (yaml.safe_load(file) or {}).get('current-context')
+        except (OSError, AttributeError, yaml.YAMLError):
+            continue
+        if name:
+            return name
+    return None
+
+def resolve_cluster_name():
+    if _context:
+        return _context
+    if os.environ.get('KUBE_CLIENT') != 'kubectl' and os.environ.get('KUBE_API_SERVER'):
+        return os.environ['KUBE_API_SERVER']
+    name = kubeconfig_current_context()
+    if name is None and os.environ.get('KUBERNETES_SERVICE_HOST'):
+        return 'in-cluster'
+    return name
+
+def cluster_name():
+    # The cluster users are recorded under in the registry: the --context
+    # given, or else the one the kubeconfig points at, so runs with and
+    # without --context agree. None only if there is no way to tell.
+    global _cluster_name, _cluster_name_loaded
+    with _client_lock:
+        if not _cluster_name_loaded:
+            _cluster_name = resolve_cluster_name()
+            _cluster_name_loaded = True
+        return _cluster_name
+
+def get_client():
+    global _client, _client_loaded
+    with _client_lock:
+        if not _client_loaded:
+            _client = load_client(_context)
+            _client_loaded = True
+        return _client
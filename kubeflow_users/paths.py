@@ -0,0 +1,30 @@
+import os
+
+# Everything the commands read and write lives under one data directory:
+# manifests/ (the profile template and copies of the Dex config), users/ (the
+# registry and its archive/ of deleted users) and runs/ (bulk run journals).
+# Paths are resolved on each call so nothing touches the filesystem at import
+# time.
+_data_dir = None
+
+def set_data_dir(path):
+    global _data_dir
+    _data_dir = path
+
+def data_dir():
+    return _data_dir or os.environ.get('KUBEFLOW_USERS_DATA') or '.'
+
+def manifest(name):
+    return os.path.join(data_dir(), 'manifests', name)
+
+def registry_file():
+    return os.path.join(data_dir(), 'users', 'user_registry.json')
+
+def registry_db_file():
+    return os.path.join(data_dir(), 'users', 'user_registry.db')
+
+def archive_dir():
+    return os.path.join(data_dir(), 'users', 'archive')
+
+def runs_dir():
+    return os.path.join(data_dir(), 'runs')
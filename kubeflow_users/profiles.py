@@ -0,0 +1,154 @@
+import json
+import os
+import re
+from kubeflow_users import paths, timing
+from kubeflow_users.dex_passwords import load_yaml
+from kubeflow_users.kube_client import ApiError, get_client
+from kubeflow_users.shell import execute_command, run_command
+
+TEMPLATE_NAME = 'create-user-template.yaml'
+
+# Keys of the user_data dicts the commands build for each user
+USER_TEMPLATE_FIELDS = {'profile_name', 'user_email', 'username', 'password', 'cpu_limit',
+                        'memory_limit', 'gpu_mem', 'gpu_count', 'storage_limit'}
+
+# The template is read and compiled once per run
+_template = None
+
+def load_template(strict=False):
+    global _template
+    from jinja2 import Environment, StrictUndefined, Undefined, TemplateError, meta
+    template_path = paths.manifest(TEMPLATE_NAME)
+    if not os.path.exists(template_path):
+        print(f"Error: {template_path} not found.")
+        return None
+
+    with open(template_path, 'r') as file:
+        template_content = file.read()
+    if not template_content.strip():
+        print(f"Error: {template_path} is empty.")
+        return None
+
+    environment = Environment(undefined=StrictUndefined if strict else Undefined)
+    try:
+        if strict:
+            # Fail before anything is applied rather than on the first render
+            unknown = meta.find_undeclared_variables(environment.parse(template_content)) - USER_TEMPLATE_FIELDS
+            if unknown:
+                print(f"Error: {template_path} uses undefined variables: {', '.join(sorted(unknown))}")
+                return None
+        template = environment.from_string(template_content)
+    except TemplateError as e:
+        print(f"Error compiling {template_path}: {e}")
+        return None
+
+    _template = template
+    return template
+
+def render_user_yaml(user_data):
+    template = _template or load_template()
+    if template is None:
+        return None
+
+    from jinja2 import TemplateError
+    try:
+        return template.render(user_data)
+    except TemplateError as e:
+        print(f"Error rendering manifest for {user_data.get('username')}: {e}")
+        return None
+
+def desired_quota(user_data):
+    # The resourceQuotaSpec the template gives user_data
+    rendered = render_user_yaml(user_data)
+    if rendered is None:
+        return None
+    return load_yaml(rendered)['spec'].get('resourceQuotaSpec')
+
+def patch_profile_quota(username, quota_spec):
+    # A merge patch: keys left out of quota_spec keep their current values
+    client = get_client()
+    patch = {'spec': {'resourceQuotaSpec': quota_spec}}
+    if client is None:
+        return run_command(f"kubectl patch profiles.kubeflow.org {username} --type=merge -p '{json.dumps(patch)}'") is not None
+
+    try:
+        client.patch('Profile', username, patch)
+        return True
+    except (ApiError, OSError) as e:
+        print(f"Error updating quota for {username}: {e}")
+        return False
+
+def write_manifest(directory, username, rendered):
+    # Opt-in copy of what was applied, for auditing
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'create-user-{username}.yaml')
+    with open(path, 'w') as file:
+        file.write(rendered)
+    print(f"Content written to {path}")
+
+def apply_user_manifest(username, rendered):
+    client = get_client()
+    if client is None:
+        return run_command('kubectl apply -f -', input_data=rendered)
+
+    try:
+        client.apply_profile(load_yaml(rendered))
+    except (ApiError, OSError) as e:
+        print(f"Error applying profile {username}: {e}")
+        return None
+    return f"profile.kubeflow.org/{username} applied"
+
+# Matches the per-object lines printed by `kubectl apply`, e.g.
+# "profile.kubeflow.org/aif22-1 created"
+APPLY_RESULT_PATTERN = re.compile(r'^profile\.kubeflow\.org/(\S+) (created|configured|unchanged)$', re.MULTILINE)
+
+def apply_users_batch(users_data, emit_dir=None):
+    documents = []
+    for user_data in users_data:
+        with timing.span('render', user=user_data['username']) as span:
+            rendered = render_user_yaml(user_data)
+            span.ok = rendered is not None
+        if rendered is None:
+            return [], [(user_data, "failed to render YAML") for user_data in users_data]
+        if emit_dir:
+            write_manifest(emit_dir, user_data['username'], rendered)
+        documents.append(rendered.strip())
+
+    client = get_client()
+    if client is not None:
+        # Every create reuses the client's keep-alive connections
+        succeeded = []
+        failed = []
+        for user_data, document in zip(users_data, documents):
+            with timing.span('apply', user=user_data['username']) as span:
+                try:
+                    client.apply_profile(load_yaml(document))
+                    succeeded.append(user_data)
+                except (ApiError, OSError) as e:
+                    span.ok = False
+                    failed.append((user_data, str(e)))
+        return succeeded, failed
+
+    # One multi-document manifest, streamed on stdin to a single kubectl process
+    manifest = '\n---\n'.join(documents) + '\n'
+    with timing.span('apply', users=len(users_data)) as span:
+        returncode, output, error = execute_command('kubectl apply -f -', input_data=manifest)
+        span.ok = returncode == 0
+    if returncode != 0:
+        print(f"kubectl apply reported errors for part of the batch:\n{error}")
+
+    accepted = set(match.group(1) for match in APPLY_RESULT_PATTERN.finditer(output))
+    error_lines = error.splitlines()
+
+    succeeded = []
+    failed = []
+    for user_data in users_data:
+        username = user_data['username']
+        if username in accepted:
+            succeeded.append(user_data)
+            continue
+        name_pattern = re.compile(rf'(?<![\w-]){re.escape(username)}(?![\w-])')
+        reason = next((line for line in error_lines if name_pattern.search(line)), "not accepted by the API server")
+        failed.append((user_data, reason))
+
+    return succeeded, failed
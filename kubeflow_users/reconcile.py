@@ -0,0 +1,265 @@
+import argparse
+import re
+import sys
+from kubeflow_users import dex_rollout, throttle, timing
+from kubeflow_users.bulk import build_user_data
+from kubeflow_users.delete import DEFAULT_DRAIN_TIMEOUT, delete_users
+from kubeflow_users.dex import add_backend_argument, apply_dex_config, hash_passwords, restart_dex
+from kubeflow_users.dex_passwords import DEFAULT_BCRYPT_ROUNDS, bcrypt_rounds, dump_yaml, load_yaml
+from kubeflow_users.dex_rollout import dex_config_changed, utc_now
+from kubeflow_users.dex_storage import write_password_changes
+from kubeflow_users.kube_client import cluster_name, set_context
+from kubeflow_users.profiles import apply_users_batch, desired_quota, patch_profile_quota
+from kubeflow_users.registry import add_class, add_user, batch, get_active_users, get_class_info, record_dex_logins
+from kubeflow_users.snapshot import take_snapshot
+
+CLASS_SPEC_FIELDS = ['class_name', 'class_tag', 'num_users', 'cpu_limit', 'memory_limit',
+                     'gpu_mem', 'gpu_count', 'storage_limit']
+
+def load_class_spec(path):
+    with open(path, 'r') as file:
+        spec = load_yaml(file)
+
+    missing = [field for field in CLASS_SPEC_FIELDS if field not in (spec or {})]
+    if missing:
+        raise ValueError(f"class spec {path} is missing: {', '.join(missing)}")
+
+    spec = {field: spec[field] for field in CLASS_SPEC_FIELDS}
+    spec['num_users'] = int(spec['num_users'])
+    for field in ('cpu_limit', 'gpu_mem', 'gpu_count'):
+        spec[field] = str(spec[field])
+    memory_limit = str(spec['memory_limit'])
+    storage_limit = str(spec['storage_limit'])
+    spec['memory_limit'] = memory_limit if memory_limit.endswith('Gi') else f"{memory_limit}Gi"
+    spec['storage_limit'] = storage_limit if storage_limit.endswith('Gi') else f"{storage_limit}Gi"
+    return spec
+
+def compute_plan(spec, profiles, dex_index, registry_users):
+    tag = spec['class_tag']
+    member_pattern = re.compile(rf'^{re.escape(tag)}-(\d+)$')
+    profiles_by_name = {profile['metadata']['name']: profile for profile in profiles}
+    registry_by_name = {user['username']: user for user in registry_users}
+    desired = [f"{tag}-{i}" for i in range(1, spec['num_users'] + 1)]
+    desired_set = set(desired)
+
+    plan = {'create': [], 'update_quota': [], 'add_dex': [], 'adopt': [], 'delete': []}
+    for index, username in enumerate(desired, start=1):
+        registered = registry_by_name.get(username)
+        user_data = build_user_data(spec, index)
+        if registered and (registered.get('dex_hash') or registered.get('password')):
+            # Keep the credentials the user already has: the recorded Dex
+            # login, which needs no hashing, or a stored plaintext password
+            user_data['password'] = None if registered.get('dex_hash') else registered['password']
+            user_data['dex_hash'] = registered.get('dex_hash')
+            user_data['dex_user_id'] = registered.get('dex_user_id')
+            user_data['user_email'] = registered.get('email') or user_data['user_email']
+
+        profile = profiles_by_name.get(username)
+        if profile is None:
+            plan['create'].append(user_data)
+        else:
+            if profile.get('spec', {}).get('resourceQuotaSpec') != desired_quota(user_data):
+                plan['update_quota'].append(user_data)
+            if dex_index.get(username=username) is None:
+                plan['add_dex'].append(user_data)
+            if registered is None:
+                plan['adopt'].append(user_data)
+
+    # Numbered class members beyond the desired size, in the cluster or only in the registry
+    existing_members = set(name for name in list(profiles_by_name) + list(registry_by_name) if member_pattern.match(name))
+    plan['delete'] = sorted(existing_members - desired_set, key=lambda name: int(member_pattern.match(name).group(1)))
+    return plan
+
+def plan_conflicts(plan, snapshot):
+    # Users to create whose name or login is taken by something else are
+    # reported and dropped from the plan. Their own Dex entry is not a
+    # conflict: reconciling an existing class is what this command is for.
+    ready = []
+    for user_data in plan['create']:
+        conflict = snapshot.create_conflict(user_data, resuming=True)
+        if conflict is None:
+            ready.append(user_data)
+        else:
+            print(f"Preflight: not creating {user_data['username']}: {conflict}")
+    plan['create'] = ready
+
+def print_plan(spec, plan):
+    print(f"Plan for class {spec['class_tag']} ({spec['num_users']} users):")
+    print(f"  create:       {len(plan['create'])}")
+    print(f"  update quota: {len(plan['update_quota'])}")
+    print(f"  add to Dex:   {len(plan['add_dex'])}")
+    print(f"  register:     {len(plan['adopt'])}")
+    print(f"  delete:       {len(plan['delete'])}")
+    for user_data in plan['create']:
+        print(f"  + {user_data['username']}")
+    for user_data in plan['update_quota']:
+        print(f"  ~ {user_data['username']} (quota)")
+    for username in plan['delete']:
+        print(f"  - {username}")
+
+def plan_is_empty(plan, class_changed):
+    return not class_changed and not any(plan.values())
+
+def class_record_changed(spec):
+    current = get_class_info(spec['class_tag'])
+    if current is None:
+        return True
+    return any(str(current.get(field)) != str(spec[field]) for field in CLASS_SPEC_FIELDS)
+
+def save_dex_index(dex_index, dex_state, args):
+    if args.dex_backend == 'crd':
+        return write_password_changes(dex_index, dex_state)
+
+    config = load_yaml(dex_state)
+    dex_config_yaml = load_yaml(config['data']['config.yaml'])
+    dex_config_yaml['staticPasswords'] = dex_index.entries
+    config['data']['config.yaml'] = dump_yaml(dex_config_yaml)
+    updated_config = dump_yaml(config)
+
+    if not dex_config_changed(dex_state, updated_config):
+        return True
+    print(f"Dex staticPasswords: {dex_index.summary()}")
+    if apply_dex_config(updated_config) is None:
+        return False
+    return restart_dex(utc_now(), args.restart_window, args.rollout_timeout) is not None
+
+def stored_password(user_data, args):
+    # Plaintext passwords are only kept in the registry when asked for
+    return user_data['password'] if args.store_passwords else None
+
+def apply_plan(spec, plan, snapshot, args):
+    tag = spec['class_tag']
+    dex_index = snapshot.dex_index
+    ok = True
+
+    add_class(spec['class_name'], tag, spec['num_users'], spec['cpu_limit'], spec['memory_limit'],
+              spec['gpu_mem'], spec['gpu_count'], spec['storage_limit'])
+
+    created = []
+    if plan['create']:
+        created, failed = apply_users_batch(plan['create'])
+        with batch():
+            for user_data in created:
+                add_user(user_data['username'], user_data['user_email'], stored_password(user_data, args), tag,
+                         cluster=cluster_name())
+        for user_data, reason in failed:
+            print(f"Failed to create {user_data['username']}: {reason}")
+            ok = False
+
+    for user_data in plan['update_quota']:
+        if patch_profile_quota(user_data['username'], desired_quota(user_data)):
+            print(f"Updated quota for {user_data['username']}")
+        else:
+            ok = False
+
+    with batch():
+        for user_data in plan['adopt']:
+            add_user(user_data['username'], user_data['user_email'], stored_password(user_data, args), tag,
+                     cluster=cluster_name())
+
+    deleted = []
+    if plan['delete']:
+        results = delete_users(plan['delete'], args.parallel, args.stuck_timeout, snapshot, args.drain_timeout)
+        deleted = [username for username, removed in results.items() if removed]
+        ok = ok and len(deleted) == len(plan['delete'])
+
+    # One Dex update covering additions and removals
+    dex_users = created + plan['add_dex']
+    # Only users without a recorded hash are hashed; the others get their
+    # recorded login back, with its userID
+    unhashed = [user_data for user_data in dex_users if not user_data.get('dex_hash')]
+    hashes = hash_passwords([user_data['password'] for user_data in unhashed], args.bcrypt_rounds) if unhashed else []
+    new_hashes = {user_data['username']: hashed_password for user_data, hashed_password in zip(unhashed, hashes)}
+    for user_data in dex_users:
+        entry = {'email': user_data['user_email'], 'username': user_data['username'],
+                 'hash': user_data.get('dex_hash') or new_hashes[user_data['username']]}
+        if user_data.get('dex_hash') and user_data.get('dex_user_id'):
+            entry['userID'] = user_data['dex_user_id']
+        try:
+            dex_index.upsert(entry)
+        except ValueError as e:
+            print(f"Skipping Dex entry for {user_data['username']}: {e}")
+            ok = False
+    for username in deleted:
+        dex_index.remove(username)
+
+    if not save_dex_index(dex_index, snapshot.dex_state, args):
+        return False
+    record_dex_logins([dex_index.get(username=user_data['username']) for user_data in dex_users], args.dex_backend,
+                      cluster_name())
+
+    for user_data in created:
+        if user_data['password'] is None:
+            print(f"User {user_data['username']} created; it keeps its recorded Dex login")
+        else:
+            print(f"User {user_data['username']} created with password: {user_data['password']}")
+    return ok
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Reconcile a class against a desired-state spec.")
+    parser.add_argument('spec', help="class spec YAML (class_name, class_tag, num_users and quotas)")
+    parser.add_argument('--plan', action='store_true', help="only print the plan")
+    parser.add_argument('--yes', action='store_true', help="apply deletions without asking for confirmation")
+    parser.add_argument('--parallel', type=int, default=8, help="parallel deletions (default: 8)")
+    parser.add_argument('--stuck-timeout', type=int, default=180,
+                        help="seconds a namespace may stay Terminating before it is force deleted (default: 180)")
+    parser.add_argument('--drain-timeout', type=int, default=DEFAULT_DRAIN_TIMEOUT,
+                        help=f"seconds to wait for a deleted user's workloads to go before its namespace (default: {DEFAULT_DRAIN_TIMEOUT})")
+    parser.add_argument('--bcrypt-rounds', type=bcrypt_rounds, default=DEFAULT_BCRYPT_ROUNDS,
+                        help=f"bcrypt cost for Dex password hashes (default: {DEFAULT_BCRYPT_ROUNDS})")
+    dex_rollout.add_arguments(parser)
+    add_backend_argument(parser)
+    parser.add_argument('--context', help="kubeconfig context to run against (default: the current context)")
+    parser.add_argument('--store-passwords', action='store_true',
+                        help="also keep plaintext passwords in the registry (by default only the Dex hash is kept)")
+    throttle.add_arguments(parser)
+    timing.add_arguments(parser)
+    args = parser.parse_args(argv)
+    return args
+
+def reconcile(args):
+    import yaml
+    try:
+        spec = load_class_spec(args.spec)
+    except (OSError, yaml.YAMLError, ValueError) as e:
+        print(f"Error reading class spec: {e}")
+        sys.exit(1)
+
+    # One bulk read each of the cluster, Dex and the registry
+    snapshot = take_snapshot(args.dex_backend)
+    if snapshot is None:
+        sys.exit(1)
+    registry_users = get_active_users(spec['class_tag'], cluster_name())
+    timing.set_attributes(class_tag=spec['class_tag'])
+
+    plan = compute_plan(spec, list(snapshot.profiles.values()), snapshot.dex_index, registry_users)
+    plan_conflicts(plan, snapshot)
+    class_changed = class_record_changed(spec)
+    if plan_is_empty(plan, class_changed):
+        print(f"Class {spec['class_tag']} is up to date; nothing to do.")
+        return
+
+    print_plan(spec, plan)
+    if args.plan:
+        return
+
+    if plan['delete'] and not args.yes:
+        confirm = input(f"Delete {len(plan['delete'])} user(s) from class {spec['class_tag']}? (yes/no): ")
+        if confirm.lower() != 'yes':
+            print("Reconcile cancelled.")
+            return
+
+    if not apply_plan(spec, plan, snapshot, args):
+        print(f"Reconcile of class {spec['class_tag']} finished with errors.")
+        sys.exit(1)
+    print(f"Class {spec['class_tag']} reconciled.")
+
+def main(argv=None, prog=None):
+    args = parse_args(argv, prog)
+    set_context(args.context)
+    timing.configure(args.metrics_log)
+    throttle.configure(args.api_qps, args.api_burst, args.api_retries)
+    try:
+        reconcile(args)
+    finally:
+        timing.finish(args, 'reconcile')
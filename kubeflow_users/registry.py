@@ -0,0 +1,250 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from kubeflow_users import paths, registry_db
+
+# Once `registry migrate` has created the SQLite database it becomes the
+# registry, and the JSON file is left untouched.
+def use_sqlite():
+    return os.path.exists(paths.registry_db_file())
+
+def read_registry():
+    # A missing or empty file is an empty registry; it is only created on the
+    # first write. Single-user setups used to keep a flat list of users, which
+    # is read as a registry without classes and rewritten in the new layout.
+    try:
+        with open(paths.registry_file(), 'r') as file:
+            content = file.read()
+    except FileNotFoundError:
+        content = ''
+    if not content.strip():
+        return {"classes": {}, "users": []}
+
+    registry = json.loads(content)
+    if isinstance(registry, list):
+        return {"classes": {}, "users": registry}
+    registry.setdefault('classes', {})
+    registry.setdefault('users', [])
+    return registry
+
+def write_registry(registry):
+    # Written to a temporary file and renamed over the registry, so a crash or
+    # a full disk leaves the old registry rather than a truncated one. The
+    # new file keeps the old one's permissions.
+    path = paths.registry_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = None
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        if mode is not None:
+            os.fchmod(file.fileno(), mode)
+        json.dump(registry, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+# flock is held per open file, so threads of one process share it: the
+# RLock lets one thread at a time in, and again inside its own batch()
+_lock = threading.RLock()
+_lock_file = None
+_local = threading.local()
+
+@contextmanager
+def locked():
+    # Updates read and rewrite the whole file, and other processes, such as
+    # the per-cluster runs of `--contexts` or a delete next to a bulk run,
+    # update it too
+    global _lock_file
+    with _lock:
+        if _lock_file is not None:
+            yield
+            return
+        path = paths.registry_file() + '.lock'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            _lock_file = lock
+            try:
+                yield
+            finally:
+                _lock_file = None
+
+def current_registry():
+    # Reads inside a batch() see its updates before they are written
+    registry = getattr(_local, 'batch', None)
+    return registry if registry is not None else read_registry()
+
+@contextmanager
+def updating():
+    # The registry to change in place under the lock; it is written when the
+    # block ends, or once at the end of the enclosing batch()
+    with locked():
+        registry = getattr(_local, 'batch', None)
+        if registry is not None:
+            _local.changed = True
+            yield registry
+            return
+        registry = read_registry()
+        yield registry
+        write_registry(registry)
+
+@contextmanager
+def batch():
+    # Groups many updates, such as every add_user of a bulk run, into one
+    # locked read and one write (one transaction with SQLite). Other
+    # processes and threads wait for the whole batch. Updates made before an
+    # error are still written, since they record changes to the cluster.
+    if use_sqlite():
+        with registry_db.batch():
+            yield
+        return
+    with locked():
+        if getattr(_local, 'batch', None) is not None:
+            yield
+            return
+        _local.batch = read_registry()
+        _local.changed = False
+        try:
+            yield
+        finally:
+            registry, _local.batch = _local.batch, None
+            if _local.changed:
+                write_registry(registry)
+
+def own_records(users, cluster):
+    # Each user's active record on the cluster. Records made before clusters
+    # were recorded only stand in for users that never had a record of their
+    # own there.
+    owned = {user['username'] for user in users if user.get('cluster') == cluster}
+    return [user for user in users if user['deletion_time'] is None and
+            (user.get('cluster') == cluster or user.get('cluster') is None and user['username'] not in owned)]
+
+def add_class(class_name, class_tag, num_users, cpu_limit, memory_limit, gpu_mem, gpu_count, storage_limit):
+    new_class = {
+        'class_name': class_name,
+        'class_tag': class_tag,
+        'num_users': num_users,
+        'cpu_limit': cpu_limit,
+        'memory_limit': memory_limit,
+        'gpu_mem': gpu_mem,
+        'gpu_count': gpu_count,
+        'storage_limit': storage_limit,
+        'creation_time': datetime.now().isoformat()
+    }
+    if use_sqlite():
+        registry_db.insert_class(new_class)
+        return
+
+    with updating() as registry:
+        registry['classes'][class_tag] = new_class
+
+def update_class_quota(class_tag, quota):
+    # Changes the class's quota fields in place; False if there is no such class
+    if use_sqlite():
+        return registry_db.update_class(class_tag, quota)
+
+    with updating() as registry:
+        class_data = registry['classes'].get(class_tag)
+        if class_data is not None:
+            class_data.update(quota)
+    return class_data is not None
+
+def add_user(username, email, password=None, class_tag=None, quota=None, cluster=None, dex_login=None,
+             dex_backend=None):
+    # Class members carry a password and class tag; single users record their
+    # own quota instead, since there is no class entry to look it up in.
+    # `cluster` is the kubeconfig context the user was created on, and
+    # `dex_login` the user's Dex entry, if it was written first.
+    new_user = {
+        'username': username,
+        'email': email,
+        'password': password,
+        'class_tag': class_tag,
+        'cluster': cluster,
+        'dex_backend': dex_backend if dex_login else None,
+        'dex_hash': (dex_login or {}).get('hash'),
+        'dex_user_id': (dex_login or {}).get('userID'),
+    }
+    new_user.update(quota or {})
+    new_user['creation_time'] = datetime.now().isoformat()
+    new_user['deletion_time'] = None
+    if use_sqlite():
+        registry_db.insert_user(new_user)
+        return
+
+    with updating() as registry:
+        # Adding an active user again, e.g. in a rerun or a resume, updates
+        # its record instead of adding a second one
+        for user in registry['users']:
+            if user['username'] == username and user.get('cluster') == cluster and user['deletion_time'] is None:
+                if dex_login is None:
+                    for field in ('dex_backend', 'dex_hash', 'dex_user_id'):
+                        new_user[field] = user.get(field)
+                new_user['creation_time'] = user.get('creation_time')
+                user.update(new_user)
+                break
+        else:
+            registry['users'].append(new_user)
+
+def mark_user_deleted(username, cluster=None):
+    # False if the user has no active record
+    if use_sqlite():
+        return registry_db.mark_deleted(username, cluster)
+
+    marked = False
+    with updating() as registry:
+        for user in own_records(registry['users'], cluster):
+            if user['username'] == username:
+                user['deletion_time'] = datetime.now().isoformat()
+                marked = True
+    return marked
+
+def record_dex_logins(entries, backend, cluster=None):
+    # Keeps each active user's bcrypt hash and Dex userID, and where the
+    # login is stored, so the Dex logins can be rebuilt from the registry
+    # without hashing again
+    entries = [entry for entry in entries if entry is not None]
+    if not entries:
+        return
+    if use_sqlite():
+        registry_db.set_dex_logins(entries, backend, cluster)
+        return
+
+    by_username = {entry['username']: entry for entry in entries}
+    with updating() as registry:
+        for user in own_records(registry['users'], cluster):
+            entry = by_username.get(user['username'])
+            if entry is not None:
+                user['dex_backend'] = backend
+                user['dex_hash'] = entry['hash']
+                user['dex_user_id'] = entry['userID']
+
+def get_class_info(class_tag):
+    if use_sqlite():
+        return registry_db.get_class(class_tag)
+
+    return current_registry()['classes'].get(class_tag)
+
+def get_active_users(class_tag, cluster=None):
+    if use_sqlite():
+        return registry_db.get_active_users_by_class(class_tag, cluster)
+
+    return [user for user in own_records(current_registry()['users'], cluster) if user.get('class_tag') == class_tag]
+
+def get_all_active_users(cluster=None):
+    if use_sqlite():
+        return registry_db.get_all_active_users(cluster)
+
+    return own_records(current_registry()['users'], cluster)
+
+def get_users_by_class(class_tag, cluster=None):
+    if use_sqlite():
+        return registry_db.get_active_usernames_by_class(class_tag, cluster)
+
+    return [user['username'] for user in get_active_users(class_tag, cluster)]
@@ -0,0 +1,152 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from kubeflow_users import paths, registry, registry_db
+
+# Compaction moves deleted users, and classes with no users left, out of the
+# registry into one gzip-compressed JSON-lines segment per semester
+# (users/archive/2026-fall.jsonl.gz). Each compaction appends a new gzip
+# member, so archived data is never rewritten. index.json lists what every
+# segment holds, so a search by class only opens the segments that have it.
+INDEX_NAME = 'index.json'
+
+def semester(timestamp):
+    # Spring is January to May, summer June to August, fall September to December
+    when = datetime.fromisoformat(timestamp)
+    term = 'spring' if when.month <= 5 else 'summer' if when.month <= 8 else 'fall'
+    return f"{when.year}-{term}"
+
+def segment_path(name):
+    return os.path.join(paths.archive_dir(), f'{name}.jsonl.gz')
+
+def read_index():
+    try:
+        with open(os.path.join(paths.archive_dir(), INDEX_NAME), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def write_index(index):
+    path = os.path.join(paths.archive_dir(), INDEX_NAME)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(index, file, indent=2, sort_keys=True)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+
+def plan_compaction(classes, users, cutoff):
+    # Returns the users and class tags to archive: users deleted before
+    # `cutoff`, and classes created before it that no kept user belongs to
+    archived = [user for user in users if user.get('deletion_time') and user['deletion_time'] <= cutoff]
+    archived_ids = set(id(user) for user in archived)
+    kept_tags = set(user.get('class_tag') for user in users if id(user) not in archived_ids)
+    finished = [tag for tag, class_data in classes.items()
+                if tag not in kept_tags and (class_data.get('creation_time') or '') <= cutoff]
+    return archived, finished
+
+def group_by_semester(classes, archived, finished):
+    # A class goes with its last member's deletion, or its creation if it never had members
+    segments = {}
+    last_deletion = {}
+    for user in archived:
+        segments.setdefault(semester(user['deletion_time']), []).append(dict(user, record='user'))
+        tag = user.get('class_tag')
+        last_deletion[tag] = max(last_deletion.get(tag, ''), user['deletion_time'])
+    for tag in finished:
+        when = last_deletion.get(tag) or classes[tag].get('creation_time') or datetime.now().isoformat()
+        segments.setdefault(semester(when), []).append(dict(classes[tag], class_tag=tag, record='class'))
+    return segments
+
+def append_segments(segments):
+    # The index goes first, so it never misses a segment or a class in one
+    os.makedirs(paths.archive_dir(), exist_ok=True)
+    index = read_index()
+    for name, records in segments.items():
+        entry = index.setdefault(name, {'users': 0, 'classes': 0, 'class_tags': []})
+        entry['users'] += sum(1 for record in records if record['record'] == 'user')
+        entry['classes'] += sum(1 for record in records if record['record'] == 'class')
+        tags = set(entry['class_tags']) | set(record['class_tag'] for record in records if record.get('class_tag'))
+        entry['class_tags'] = sorted(tags)
+    write_index(index)
+
+    for name, records in sorted(segments.items()):
+        with open(segment_path(name), 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as file:
+                for record in records:
+                    file.write((json.dumps(record) + '\n').encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+def compact_json(cutoff, dry_run):
+    with registry.locked():
+        data = registry.read_registry()
+        archived, finished = plan_compaction(data['classes'], data['users'], cutoff)
+        if dry_run or not (archived or finished):
+            return archived, finished
+        # Archived first: a crash before the registry is rewritten leaves
+        # duplicates in the archive, which searches skip, but loses nothing
+        append_segments(group_by_semester(data['classes'], archived, finished))
+        archived_ids = set(id(user) for user in archived)
+        data['users'] = [user for user in data['users'] if id(user) not in archived_ids]
+        for tag in finished:
+            del data['classes'][tag]
+        registry.write_registry(data)
+    return archived, finished
+
+def compact_sqlite(cutoff, dry_run):
+    conn = registry_db.connect()
+    with conn:
+        # Holds the write lock from the first read, so no user is added to a
+        # class between deciding it is finished and deleting it
+        conn.execute('BEGIN IMMEDIATE')
+        users = [dict(row) for row in conn.execute("SELECT * FROM users ORDER BY id")]
+        classes = {row['class_tag']: dict(row) for row in conn.execute("SELECT * FROM classes")}
+        archived, finished = plan_compaction(classes, users, cutoff)
+        if dry_run or not (archived or finished):
+            return archived, finished
+        # Rows are deleted in the same transaction, which rolls back if the archive cannot be written
+        append_segments(group_by_semester(classes, [{field: user[field] for field in registry_db.USER_FIELDS}
+                                                    for user in archived], finished))
+        conn.executemany("DELETE FROM users WHERE id = ?", [(user['id'],) for user in archived])
+        conn.executemany("DELETE FROM classes WHERE class_tag = ?", [(tag,) for tag in finished])
+    return archived, finished
+
+def compact(older_than_days=0, dry_run=False):
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    if registry.use_sqlite():
+        return compact_sqlite(cutoff, dry_run)
+    return compact_json(cutoff, dry_run)
+
+def list_segments():
+    # {segment name: {'users': n, 'classes': n, 'class_tags': [...]}}, oldest first
+    index = read_index()
+    return {name: index[name] for name in sorted(index, key=segment_order)}
+
+def segment_order(name):
+    year, term = name.split('-', 1)
+    return int(year), ['spring', 'summer', 'fall'].index(term) if term in ('spring', 'summer', 'fall') else 3
+
+def search_archive(username=None, email=None, class_tag=None, semester_name=None, record=None):
+    # Yields archived records matching every given filter, oldest segment first
+    seen = set()
+    for name, entry in list_segments().items():
+        if semester_name is not None and name != semester_name:
+            continue
+        if class_tag is not None and class_tag not in entry.get('class_tags', []):
+            continue
+        if not os.path.exists(segment_path(name)):
+            continue
+        with gzip.open(segment_path(name), 'rt', encoding='utf-8') as file:
+            for line in file:
+                item = json.loads(line)
+                if ((record is not None and item['record'] != record)
+                        or (username is not None and item.get('username') != username)
+                        or (email is not None and (item.get('email') or '').lower() != email.lower())
+                        or (class_tag is not None and item.get('class_tag') != class_tag)):
+                    continue
+                key = line.strip()
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield dict(item, semester=name)
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from kubeflow_users import paths
+
+CLASS_FIELDS = ['class_tag', 'class_name', 'num_users', 'cpu_limit', 'memory_limit',
+                'gpu_mem', 'gpu_count', 'storage_limit', 'creation_time']
+USER_FIELDS = ['username', 'email', 'password', 'class_tag', 'cpu_limit', 'memory_limit',
+               'gpu_mem', 'gpu_count', 'storage_limit', 'creation_time', 'deletion_time', 'cluster',
+               'dex_backend', 'dex_hash', 'dex_user_id']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classes (
+    class_tag TEXT PRIMARY KEY,
+    class_name TEXT,
+    num_users INTEGER,
+    cpu_limit TEXT,
+    memory_limit TEXT,
+    gpu_mem TEXT,
+    gpu_count TEXT,
+    storage_limit TEXT,
+    creation_time TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    email TEXT,
+    password TEXT,
+    class_tag TEXT,
+    cpu_limit TEXT,
+    memory_limit TEXT,
+    gpu_mem TEXT,
+    gpu_count TEXT,
+    storage_limit TEXT,
+    creation_time TEXT,
+    deletion_time TEXT,
+    cluster TEXT,
+    dex_backend TEXT,
+    dex_hash TEXT,
+    dex_user_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+CREATE INDEX IF NOT EXISTS idx_users_class_tag ON users (class_tag);
+CREATE INDEX IF NOT EXISTS idx_users_deletion_time ON users (deletion_time);
+"""
+
+# Columns added after the first release, for databases created before them
+ADDED_USER_COLUMNS = {'cluster': 'TEXT', 'dex_backend': 'TEXT', 'dex_hash': 'TEXT', 'dex_user_id': 'TEXT'}
+
+# At most one active row per user and cluster. Created once the added
+# columns exist, after older duplicates are retired.
+ACTIVE_USER_INDEX = ("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_active ON users (username, IFNULL(cluster, '')) "
+                     "WHERE deletion_time IS NULL")
+
+# INSERT ... ON CONFLICT DO UPDATE, which UPSERT_USER relies on, needs SQLite 3.24
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+# Adding an active user again updates its row. The creation time stays, and
+# so does a recorded Dex login unless a new one is given.
+UPSERT_USER = (
+    f"INSERT INTO users ({', '.join(USER_FIELDS)}) VALUES ({', '.join('?' * len(USER_FIELDS))}) "
+    "ON CONFLICT (username, IFNULL(cluster, '')) WHERE deletion_time IS NULL DO UPDATE SET "
+    + ', '.join(f"{field} = COALESCE(excluded.{field}, {field})" if field.startswith('dex_') else f"{field} = excluded.{field}"
+                for field in USER_FIELDS if field not in ('username', 'cluster', 'creation_time', 'deletion_time'))
+)
+
+# A user's rows on a cluster. Rows without a cluster were created before
+# clusters were recorded and only stand in for users that never had a row
+# of their own on the cluster.
+CLUSTER_FILTER = ("(cluster IS ? OR cluster IS NULL AND NOT EXISTS (SELECT 1 FROM users AS own "
+                  "WHERE own.username = users.username AND own.cluster IS ?))")
+
+# sqlite3 connections cannot be shared between threads, so keep one per thread
+_local = threading.local()
+
+def connect(db_path=None):
+    db_path = db_path or paths.registry_db_file()
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        columns = set(row['name'] for row in conn.execute('PRAGMA table_info(users)'))
+        with conn:
+            for column, column_type in ADDED_USER_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE users ADD COLUMN {column} {column_type}')
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_users_active'").fetchone() is None:
+                retire_duplicates(conn)
+                conn.execute(ACTIVE_USER_INDEX)
+        connections[db_path] = conn
+    return conn
+
+@contextmanager
+def transaction(conn):
+    # Commits at the end of the block, unless batch() commits it later
+    if getattr(_local, 'batch', False):
+        yield
+        return
+    with conn:
+        yield
+
+@contextmanager
+def batch(db_path=None):
+    # Every update this thread makes in the block goes into one transaction,
+    # committed even if the block fails part way, like the JSON registry's batch
+    conn = connect(db_path)
+    if getattr(_local, 'batch', False):
+        yield
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    _local.batch = True
+    try:
+        yield
+    finally:
+        _local.batch = False
+        conn.commit()
+
+def retire_duplicates(conn):
+    # Databases from before the unique index can hold several active rows for
+    # one user and cluster; the newest stays active
+    cursor = conn.execute(
+        "UPDATE users SET deletion_time = ? WHERE deletion_time IS NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM users WHERE deletion_time IS NULL GROUP BY username, IFNULL(cluster, ''))",
+        (datetime.now().isoformat(),)
+    )
+    if cursor.rowcount:
+        print(f"Marked {cursor.rowcount} duplicate active user row(s) as deleted")
+
+def insert_class(class_data, db_path=None):
+    conn = connect(db_path)
+    with transaction(conn):
+        conn.execute(
+            f"INSERT OR REPLACE INTO classes ({', '.join(CLASS_FIELDS)}) VALUES ({', '.join('?' * len(CLASS_FIELDS))})",
+            [class_data.get(field) for field in CLASS_FIELDS]
+        )
+
+def update_class(class_tag, changes, db_path=None):
+    fields = [field for field in CLASS_FIELDS if field in changes]
+    conn = connect(db_path)
+    with transaction(conn):
+        cursor = conn.execute(
+            f"UPDATE classes SET {', '.join(f'{field} = ?' for field in fields)} WHERE class_tag = ?",
+            [changes[field] for field in fields] + [class_tag]
+        )
+    return cursor.rowcount > 0
+
+def insert_user(user_data, db_path=None):
+    conn = connect(db_path)
+    with transaction(conn):
+        conn.execute(UPSERT_USER, [user_data.get(field) for field in USER_FIELDS])
+
+def mark_deleted(username, cluster=None, db_path=None):
+    conn = connect(db_path)
+    with transaction(conn):
+        cursor = conn.execute(
+            f"UPDATE users SET deletion_time = ? WHERE username = ? AND deletion_time IS NULL AND {CLUSTER_FILTER}",
+            (datetime.now().isoformat(), username, cluster, cluster)
+        )
+    return cursor.rowcount > 0
+
+def set_dex_logins(entries, backend, cluster=None, db_path=None):
+    conn = connect(db_path)
+    with transaction(conn):
+        conn.executemany(
+            "UPDATE users SET dex_backend = ?, dex_hash = ?, dex_user_id = ? "
+            f"WHERE username = ? AND deletion_time IS NULL AND {CLUSTER_FILTER}",
+            [(backend, entry['hash'], entry['userID'], entry['username'], cluster, cluster) for entry in entries]
+        )
+
+def get_class(class_tag, db_path=None):
+    row = connect(db_path).execute("SELECT * FROM classes WHERE class_tag = ?", (class_tag,)).fetchone()
+    return dict(row) if row is not None else None
+
+def get_active_users_by_class(class_tag, cluster=None, db_path=None):
+    rows = connect(db_path).execute(
+        f"SELECT * FROM users WHERE class_tag = ? AND deletion_time IS NULL AND {CLUSTER_FILTER} ORDER BY id",
+        (class_tag, cluster, cluster)
+    ).fetchall()
+    return [{field: row[field] for field in USER_FIELDS} for row in rows]
+
+def get_all_active_users(cluster=None, db_path=None):
+    rows = connect(db_path).execute(
+        f"SELECT * FROM users WHERE deletion_time IS NULL AND {CLUSTER_FILTER} ORDER BY id",
+        (cluster, cluster)
+    ).fetchall()
+    return [{field: row[field] for field in USER_FIELDS} for row in rows]
+
+def get_active_usernames_by_class(class_tag, cluster=None, db_path=None):
+    rows = connect(db_path).execute(
+        f"SELECT username FROM users WHERE class_tag = ? AND deletion_time IS NULL AND {CLUSTER_FILTER} ORDER BY id",
+        (class_tag, cluster, cluster)
+    ).fetchall()
+    return [row['username'] for row in rows]
+
+def import_json_registry(json_path, db_path=None):
+    with open(json_path, 'r') as file:
+        registry = json.load(file)
+
+    # Single-user mode keeps a flat list of users; bulk mode keeps
+    # {"classes": {tag: class}, "users": [user, ...]}
+    if isinstance(registry, list):
+        classes, users = {}, registry
+    elif isinstance(registry, dict) and 'users' in registry:
+        classes, users = registry.get('classes', {}), registry['users']
+    else:
+        raise ValueError(f"{json_path} is not a recognised user registry layout")
+
+    conn = connect(db_path)
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO classes ({', '.join(CLASS_FIELDS)}) VALUES ({', '.join('?' * len(CLASS_FIELDS))})",
+            [[dict(class_data, class_tag=class_data.get('class_tag', tag)).get(field) for field in CLASS_FIELDS]
+             for tag, class_data in classes.items()]
+        )
+        # A user listed twice as active in the JSON file becomes one row
+        conn.executemany(UPSERT_USER, [[user.get(field) for field in USER_FIELDS] for user in users])
+    return len(classes), len(users)
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Manage the user registry: SQLite import and archives.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help="one-shot import of user_registry.json into SQLite")
+    migrate.add_argument('--json', help="JSON registry to import (default: users/user_registry.json)")
+    compact = subparsers.add_parser('compact', help="move deleted users and finished classes into per-semester archives")
+    compact.add_argument('--older-than', type=int, default=0, metavar='DAYS',
+                         help="only archive users deleted, and classes created, at least DAYS days ago (default: 0)")
+    compact.add_argument('--dry-run', action='store_true', help="show what would be archived")
+    subparsers.add_parser('archives', help="list the archive segments")
+    search = subparsers.add_parser('search', help="search the archives; prints one JSON record per line")
+    search.add_argument('--username')
+    search.add_argument('--email')
+    search.add_argument('--class', dest='class_tag')
+    search.add_argument('--semester', help="only this segment, e.g. 2026-fall")
+    search.add_argument('--classes', action='store_true', help="only class records")
+    args = parser.parse_args(argv)
+    if args.command == 'migrate':
+        args.json = args.json or paths.registry_file()
+    return args
+
+def main(argv=None, prog=None):
+    args = parse_args(argv, prog)
+
+    if args.command == 'migrate':
+        # Always the database the registry looks for; --data-dir chooses where it lives
+        db_path = paths.registry_db_file()
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            print(f"Error: the SQLite registry needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer, "
+                  f"but this Python uses SQLite {sqlite3.sqlite_version}; keep the JSON registry or upgrade Python.")
+            sys.exit(1)
+        if os.path.exists(db_path):
+            print(f"Error: {db_path} already exists; refusing to import twice.")
+            sys.exit(1)
+        try:
+            num_classes, num_users = import_json_registry(args.json, db_path)
+        except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+            print(f"Error importing {args.json}: {e}")
+            sys.exit(1)
+        print(f"Imported {num_classes} class(es) and {num_users} user(s) from {args.json} into {db_path}")
+        print(f"The registry now uses {db_path}; {args.json} is no longer updated.")
+        return
+
+    # Imported here: the archive module uses the registry, which imports this one
+    from kubeflow_users import registry_archive
+    if args.command == 'compact':
+        try:
+            archived, finished = registry_archive.compact(args.older_than, args.dry_run)
+        except (OSError, ValueError, json.JSONDecodeError, sqlite3.Error) as e:
+            print(f"Error compacting the registry: {e}")
+            sys.exit(1)
+        action = "Would archive" if args.dry_run else "Archived"
+        print(f"{action} {len(archived)} deleted user(s) and {len(finished)} finished class(es)"
+              + (f": {', '.join(finished)}" if finished else ""))
+    elif args.command == 'archives':
+        segments = registry_archive.list_segments()
+        if not segments:
+            print("No archive segments.")
+        for name, entry in segments.items():
+            print(f"{name}: {entry['users']} user(s), {entry['classes']} class(es), "
+                  f"{os.path.getsize(registry_archive.segment_path(name))} bytes")
+    elif args.command == 'search':
+        for record in registry_archive.search_archive(args.username, args.email, args.class_tag, args.semester,
+                                                       'class' if args.classes else None):
+            print(json.dumps(record))
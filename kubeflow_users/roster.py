@@ -0,0 +1,104 @@
+import csv
+import re
+
+# Columns a roster row may set; anything left blank falls back to the class
+# defaults (or, for username, email and password, to generated values)
+ROSTER_FIELDS = ['username', 'email', 'password', 'cpu_limit', 'memory_limit',
+                 'gpu_mem', 'gpu_count', 'storage_limit']
+QUOTA_FIELDS = ['cpu_limit', 'memory_limit', 'gpu_mem', 'gpu_count', 'storage_limit']
+
+# Usernames become profile and namespace names, so they must be DNS-1123 labels
+USERNAME_PATTERN = re.compile(r'^[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+$')
+CPU_PATTERN = re.compile(r'^\d+(\.\d+)?m?$')
+
+def normalize_quota(field, value):
+    # Same normalisation as the interactive prompts, plus a sanity check
+    value = str(value).strip()
+    if field in ('memory_limit', 'storage_limit'):
+        number = value[:-2] if value.endswith('Gi') else value
+        if not number.isdigit() or int(number) < 1:
+            raise ValueError(f"{field} must be a whole number of Gi, got {value!r}")
+        return f"{number}Gi"
+    if field == 'cpu_limit':
+        if not CPU_PATTERN.match(value):
+            raise ValueError(f"cpu_limit must be a number of cores, got {value!r}")
+        return value
+    if not value.isdigit():
+        raise ValueError(f"{field} must be a whole number, got {value!r}")
+    return value
+
+def check_fields(fields, source):
+    unknown = [field for field in fields if field not in ROSTER_FIELDS]
+    if unknown:
+        raise ValueError(f"{source}: unknown roster column(s): {', '.join(unknown)} "
+                         f"(expected some of: {', '.join(ROSTER_FIELDS)})")
+
+def read_csv_rows(path):
+    with open(path, 'r', newline='') as file:
+        reader = csv.DictReader(file)
+        check_fields([field.strip() for field in reader.fieldnames or []], path)
+        for row in reader:
+            yield reader.line_num, {key.strip(): value for key, value in row.items() if key is not None}
+
+def read_yaml_rows(path):
+    # Either a top-level list of rows or one row per YAML document. Rows are
+    # composed one node at a time, so a long list is never held in memory.
+    # (The libyaml loader cannot compose single nodes, hence the pure-Python one.)
+    import yaml
+    with open(path, 'r') as file:
+        loader = yaml.SafeLoader(file)
+        try:
+            loader.get_event()  # StreamStart
+            while not loader.check_event(yaml.StreamEndEvent):
+                loader.get_event()  # DocumentStart
+                if loader.check_event(yaml.SequenceStartEvent):
+                    loader.get_event()
+                    while not loader.check_event(yaml.SequenceEndEvent):
+                        line = loader.peek_event().start_mark.line + 1
+                        yield line, loader.construct_document(loader.compose_node(None, None))
+                    loader.get_event()
+                else:
+                    line = loader.peek_event().start_mark.line + 1
+                    yield line, loader.construct_document(loader.compose_node(None, None))
+                loader.get_event()  # DocumentEnd
+        except yaml.YAMLError as e:
+            raise ValueError(f"{path}: {e}")
+        finally:
+            loader.dispose()
+
+def read_roster(path):
+    if path.endswith(('.yaml', '.yml')):
+        rows = read_yaml_rows(path)
+    elif path.endswith('.csv'):
+        rows = read_csv_rows(path)
+    else:
+        raise ValueError(f"{path}: roster must be a .csv, .yaml or .yml file")
+
+    for line, row in rows:
+        if row is None:
+            continue
+        if not isinstance(row, dict):
+            raise ValueError(f"{path}:{line}: expected a mapping of roster columns, got {type(row).__name__}")
+        check_fields(row, f"{path}:{line}")
+        values = {field: row[field] for field in ROSTER_FIELDS if row.get(field) not in (None, '')}
+        if values:
+            yield line, values
+
+def validate_row(row, defaults):
+    # Returns the row with every quota filled in; raises ValueError if it is unusable
+    username = str(row['username']).strip() if 'username' in row else None
+    if username is not None and not USERNAME_PATTERN.match(username):
+        raise ValueError(f"username {username!r} is not a valid namespace name")
+    email = str(row['email']).strip() if 'email' in row else None
+    if email is not None and not EMAIL_PATTERN.match(email):
+        raise ValueError(f"email {email!r} is not a valid address")
+
+    validated = {'username': username, 'email': email,
+                 'password': str(row['password']) if 'password' in row else None}
+    for field in QUOTA_FIELDS:
+        value = row.get(field, defaults.get(field))
+        if value in (None, ''):
+            raise ValueError(f"no {field} in the row and no class default")
+        validated[field] = normalize_quota(field, value)
+    return validated
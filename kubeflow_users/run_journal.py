@@ -0,0 +1,116 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from kubeflow_users import paths
+
+# Steps recorded per user, in the order a bulk run completes them
+USER_STEPS = ('profile', 'registry', 'dex')
+# Steps recorded once per run
+RUN_STEPS = ('class', 'dex_config', 'restart')
+
+def new_run_id(class_tag, context=None):
+    # Runs of one class against several clusters start in the same second
+    run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{class_tag}"
+    return f"{run_id}-{re.sub(r'[^A-Za-z0-9_.-]', '_', context)}" if context else run_id
+
+def journal_path(run_id):
+    return os.path.join(paths.runs_dir(), f'{run_id}.jsonl')
+
+class RunJournal:
+    # Append-only JSON-lines log of a bulk run. Records are buffered and
+    # fsynced in batches; sync() forces a flush at important boundaries.
+    def __init__(self, run_id, file, sync_every=50, sync_interval=1.0):
+        self.run_id = run_id
+        self.class_data = None
+        self.users = {}
+        self.steps = {}
+        self._file = file
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+    @classmethod
+    def create(cls, run_id, class_data):
+        os.makedirs(paths.runs_dir(), exist_ok=True)
+        # The journal holds generated passwords, so keep it private
+        fd = os.open(journal_path(run_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+        journal = cls(run_id, os.fdopen(fd, 'a'))
+        journal.class_data = class_data
+        journal._append({'type': 'run', 'run_id': run_id, 'class_data': class_data,
+                         'time': datetime.now().isoformat()})
+        journal.sync()
+        return journal
+
+    @classmethod
+    def resume(cls, run_id):
+        path = journal_path(run_id)
+        records = []
+        good_size = 0
+        with open(path, 'rb') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A crash can leave a partially written last line
+                    break
+                good_size += len(line)
+
+        if not records or records[0].get('type') != 'run':
+            raise ValueError(f"{path} is not a bulk run journal")
+
+        # Drop the torn tail so new records start on a fresh line
+        os.truncate(path, good_size)
+        journal = cls(run_id, open(path, 'a'))
+        journal.class_data = records[0]['class_data']
+        for record in records[1:]:
+            if record['type'] == 'user':
+                journal.users[record['user_data']['username']] = record['user_data']
+            elif record['type'] == 'step':
+                journal.steps.setdefault(record.get('username'), set()).add(record['step'])
+        return journal
+
+    def _append(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._pending += 1
+            if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            if self._pending:
+                self._sync_locked()
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Whichever way the run ends, buffered records are written out
+        self.close()
+
+    def record_user(self, user_data):
+        self.users[user_data['username']] = user_data
+        self._append({'type': 'user', 'user_data': user_data})
+
+    def record_step(self, step, username=None):
+        with self._lock:
+            self.steps.setdefault(username, set()).add(step)
+        self._append({'type': 'step', 'step': step, 'username': username, 'time': datetime.now().isoformat()})
+
+    def completed(self, step, username=None):
+        return step in self.steps.get(username, ())
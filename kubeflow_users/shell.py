@@ -0,0 +1,55 @@
+import shlex
+import subprocess
+from kubeflow_users import throttle, timing
+from kubeflow_users.kube_client import current_context
+
+def with_context(command):
+    # kubectl talks to the cluster chosen with --context, like the client does
+    context = current_context()
+    if context and command.startswith('kubectl '):
+        return f"kubectl --context={shlex.quote(context)} {command[len('kubectl '):]}"
+    return command
+
+def execute_once(command, input_data=None, timeout=None):
+    print(f"Executing command: {command}")
+    with timing.span('command', command=' '.join(command.split()[:3])) as span:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE if input_data is not None else None,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+        try:
+            output, error = process.communicate(input_data.encode('utf-8') if input_data is not None else None,
+                                                timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            span.ok = False
+            return None, '', f"timed out after {timeout}s"
+        span.ok = process.returncode == 0
+    return process.returncode, output.decode('utf-8'), error.decode('utf-8')
+
+def execute_command(command, input_data=None, timeout=None, retry=True):
+    # Throttled, timed out and unreachable-server failures are retried with
+    # backoff; commands that must not be repeated pass retry=False
+    command = with_context(command)
+    attempt = 0
+    while True:
+        with throttle.slot():
+            returncode, output, error = execute_once(command, input_data, timeout)
+        if returncode == 0:
+            throttle.succeeded()
+            return returncode, output, error
+        if not retry or not throttle.is_retryable_output(returncode, error):
+            return returncode, output, error
+        last_line = error.strip().splitlines()[-1] if error.strip() else 'failed'
+        if not throttle.wait(attempt, f"{' '.join(command.split()[:3])}: {last_line}"):
+            return returncode, output, error
+        attempt += 1
+
+def run_command(command, input_data=None, timeout=None, retry=True):
+    # Returns the command's output, or None on failure; an empty output is
+    # still a success, so callers compare against None
+    returncode, output, error = execute_command(command, input_data, timeout, retry)
+    if returncode != 0:
+        print(f"Error executing command: {command}")
+        print(f"Error message: {error}")
+        return None
+    return output
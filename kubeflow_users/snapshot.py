@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from kubeflow_users import timing
+from kubeflow_users.dex import get_dex_config
+from kubeflow_users.dex_passwords import StaticPasswordIndex, load_yaml
+from kubeflow_users.dex_storage import load_password_index
+from kubeflow_users.kube_client import ApiError, get_client
+from kubeflow_users.shell import run_command
+
+# Preflight checks read the cluster once: every Profile, every Namespace and
+# the Dex logins, kept for DEFAULT_TTL seconds. Conflicts are then found in
+# memory instead of by one failed API call per user.
+DEFAULT_TTL = 60
+
+class ClusterSnapshot:
+    def __init__(self, profiles, namespaces, dex_index, dex_state, dex_backend):
+        self.profiles = profiles
+        self.namespaces = namespaces
+        self.dex_index = dex_index
+        # What the Dex backend diffs against when saving: the ConfigMap
+        # text, or the stored Password objects
+        self.dex_state = dex_state
+        self.dex_backend = dex_backend
+        self.taken_at = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.taken_at
+
+    def exists(self, name):
+        return name in self.profiles or name in self.namespaces
+
+    def profile_owner(self, name):
+        return ((self.profiles.get(name) or {}).get('spec', {}).get('owner') or {}).get('name')
+
+    def namespace_phase(self, name):
+        namespace = self.namespaces.get(name)
+        return (namespace.get('status') or {}).get('phase', 'Active') if namespace is not None else None
+
+    def create_conflict(self, user_data, resuming=False):
+        # Returns why user_data cannot be created as-is, or None. With
+        # `resuming`, for a user already in the resumed run's journal, a
+        # profile or Dex entry that belongs to the same email is how the
+        # interrupted run left it and is applied again. Otherwise anything
+        # already there is a collision: creating over it would give an
+        # existing user a new password.
+        name = user_data.get('profile_name') or user_data['username']
+        username = user_data['username']
+        email = user_data['user_email'].lower()
+        owner = self.profile_owner(name)
+        if name in self.profiles and (owner or '').lower() != email:
+            return f"profile {name} already exists and belongs to {owner}"
+        if name in self.profiles and not resuming:
+            return f"profile {name} already exists; use reconcile to change an existing class"
+        phase = self.namespace_phase(name)
+        if phase == 'Terminating':
+            return f"namespace {name} is still terminating"
+        if phase is not None and name not in self.profiles:
+            return f"namespace {name} already exists without a profile"
+
+        by_email = self.dex_index.get(email=email)
+        if by_email is not None and by_email.get('username') != username:
+            return f"Dex login {email} already belongs to {by_email.get('username')}"
+        by_username = self.dex_index.get(username=username)
+        if by_username is not None and (by_username.get('email') or '').lower() != email:
+            return f"Dex username {username} already belongs to {by_username.get('email')}"
+        if by_email is not None and not resuming:
+            return f"Dex login {email} already exists; use reconcile to change an existing class"
+        return None
+
+    def orphaned_namespaces(self, prefix=''):
+        # Namespaces left behind by a deleted profile
+        return sorted(name for name in self.namespaces if name.startswith(prefix) and name not in self.profiles)
+
+def list_items(kind, kubectl_resource):
+    client = get_client()
+    if client is None:
+        output = run_command(f'kubectl get {kubectl_resource} -o json')
+        if output is None:
+            return None
+        return json.loads(output).get('items', [])
+
+    try:
+        return client.list(kind).get('items', [])
+    except (ApiError, OSError) as e:
+        print(f"Error listing {kind} objects: {e}")
+        return None
+
+def load_dex(dex_backend):
+    if dex_backend == 'crd':
+        return load_password_index()
+    import yaml
+    dex_config = get_dex_config()
+    if dex_config is None:
+        return None
+    try:
+        entries = load_yaml(load_yaml(dex_config)['data']['config.yaml']).get('staticPasswords')
+    except (yaml.YAMLError, KeyError, TypeError) as e:
+        print(f"Error parsing Dex configuration: {e}")
+        return None
+    return StaticPasswordIndex(entries), dex_config
+
+def take_snapshot(dex_backend='configmap'):
+    with timing.span('preflight') as span:
+        profiles = list_items('Profile', 'profiles.kubeflow.org')
+        namespaces = list_items('Namespace', 'namespaces') if profiles is not None else None
+        dex = load_dex(dex_backend) if namespaces is not None else None
+        span.ok = dex is not None
+    if dex is None:
+        return None
+
+    snapshot = ClusterSnapshot({item['metadata']['name']: item for item in profiles},
+                               {item['metadata']['name']: item for item in namespaces},
+                               dex[0], dex[1], dex_backend)
+    print(f"Cluster snapshot: {len(snapshot.profiles)} profile(s), {len(snapshot.namespaces)} namespace(s), "
+          f"{len(snapshot.dex_index.entries)} Dex login(s)")
+    return snapshot
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def get_snapshot(dex_backend='configmap', ttl=DEFAULT_TTL):
+    # Reuses the last snapshot while it is younger than `ttl` seconds
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.dex_backend != dex_backend or _snapshot.age() > ttl:
+            _snapshot = take_snapshot(dex_backend)
+        return _snapshot
+
+def invalidate():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+def add_arguments(parser):
+    parser.add_argument('--snapshot-ttl', type=int, default=DEFAULT_TTL,
+                        help=f"seconds a preflight snapshot of profiles, namespaces and Dex logins is reused (default: {DEFAULT_TTL})")
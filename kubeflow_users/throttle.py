@@ -0,0 +1,175 @@
+import argparse
+import http.client
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from kubeflow_users import timing
+
+# Every API call, through the client or a kubectl process, takes a token from
+# one bucket and a slot from one in-flight limit shared by all worker threads.
+# Throttling and transient failures are retried with exponential backoff and
+# full jitter, and each one halves the in-flight limit; it grows back by one
+# after as many successes in a row as the current limit.
+DEFAULT_QPS = 50
+DEFAULT_BURST = 100
+DEFAULT_RETRIES = 5
+MAX_IN_FLIGHT = 32
+BASE_DELAY = 0.5
+MAX_DELAY = 30
+
+# Throttling, API server overload and gateway errors; anything else (403, 404,
+# 409, 422, ...) will not change on a retry
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# The same conditions as kubectl reports them on stderr
+RETRYABLE_OUTPUT = re.compile(
+    r'TooManyRequests|Too Many Requests|\((?:429|500|502|503|504)\)|ServiceUnavailable|'
+    r'the server is currently unable to handle the request|the server has received too many requests|'
+    r'the server was unable to return a response in the time allotted|etcdserver: request timed out|'
+    r'i/o timeout|TLS handshake timeout|connection refused|connection reset by peer|unexpected EOF|'
+    r'Client\.Timeout exceeded|http2: client connection lost', re.IGNORECASE)
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Taking the token before sleeping keeps concurrent callers in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class AdaptiveLimit:
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = maximum
+        self._in_flight = 0
+        self._successes = 0
+        self._decreased_at = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify()
+
+    def succeeded(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify()
+
+    def throttled(self):
+        with self._condition:
+            self._successes = 0
+            # Calls that were already in flight fail together; count them once
+            if time.monotonic() - self._decreased_at < 1 or self.limit == 1:
+                return
+            self.limit = max(1, self.limit // 2)
+            self._decreased_at = time.monotonic()
+            print(f"API server is throttling or failing; reducing concurrent calls to {self.limit}")
+
+_bucket = TokenBucket(DEFAULT_QPS, DEFAULT_BURST)
+_limit = AdaptiveLimit(MAX_IN_FLIGHT)
+_retries = DEFAULT_RETRIES
+
+def configure(qps=DEFAULT_QPS, burst=DEFAULT_BURST, retries=DEFAULT_RETRIES):
+    global _bucket, _limit, _retries
+    _bucket = TokenBucket(qps, burst)
+    _limit = AdaptiveLimit(MAX_IN_FLIGHT)
+    _retries = retries
+
+def is_retryable(error):
+    status = getattr(error, 'status', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError, http.client.IncompleteRead))
+
+def is_retryable_output(returncode, error):
+    # execute_command() reports a kubectl process it had to kill as None
+    return returncode is None or bool(RETRYABLE_OUTPUT.search(error or ''))
+
+def backoff(attempt, retry_after=None):
+    # Seconds to wait before retry number `attempt` (0-based), or None once
+    # the retries are used up
+    if attempt >= _retries:
+        return None
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+    return max(delay, min(retry_after or 0, MAX_DELAY))
+
+def wait(attempt, reason, retry_after=None):
+    # Sleeps before the next retry; False means give up
+    delay = backoff(attempt, retry_after)
+    if delay is None:
+        return False
+    _limit.throttled()
+    print(f"{reason}; retrying in {delay:.1f}s (attempt {attempt + 2} of {_retries + 1})")
+    timing.record('backoff', delay, reason=reason[:80])
+    time.sleep(delay)
+    return True
+
+@contextmanager
+def slot():
+    _bucket.acquire()
+    with _limit.slot():
+        yield
+
+def acquire():
+    # For long-running calls such as watches, which must not hold a slot
+    _bucket.acquire()
+
+def succeeded():
+    _limit.succeeded()
+
+def call(function, description):
+    attempt = 0
+    while True:
+        try:
+            with slot():
+                result = function()
+        except Exception as e:
+            if not is_retryable(e) or not wait(attempt, f"{description}: {e}", getattr(e, 'retry_after', None)):
+                raise
+            attempt += 1
+            continue
+        succeeded()
+        return result
+
+def non_negative(convert):
+    def parse(value):
+        number = convert(value)
+        if number < 0:
+            raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+        return number
+    return parse
+
+def add_arguments(parser):
+    parser.add_argument('--api-qps', type=non_negative(float), default=DEFAULT_QPS,
+                        help=f"maximum API calls per second, 0 for no limit (default: {DEFAULT_QPS})")
+    parser.add_argument('--api-burst', type=non_negative(int), default=DEFAULT_BURST,
+                        help=f"API calls allowed in a burst above --api-qps (default: {DEFAULT_BURST})")
+    parser.add_argument('--api-retries', type=non_negative(int), default=DEFAULT_RETRIES,
+                        help=f"retries for throttled, timed out or unavailable API calls (default: {DEFAULT_RETRIES})")
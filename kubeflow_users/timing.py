@@ -0,0 +1,144 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+# Stages the scripts time, in the order they are reported
+STAGES = ['preflight', 'render', 'apply', 'quota_patch', 'registry', 'dex_fetch', 'dex_hash', 'dex_apply', 'dex_restart',
+          'drain', 'delete_request', 'namespace_delete', 'command', 'backoff']
+
+_spans = []
+_lock = threading.Lock()
+_log_path = None
+# Attributes added to every span, e.g. the class being provisioned
+_attributes = {}
+
+class Span:
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+        self.ok = True
+
+def configure(log_path=None):
+    # Spans are kept in memory for the summary and, with a log path, also
+    # appended to it as JSON lines while the run progresses
+    global _log_path
+    _log_path = log_path
+
+def set_attributes(**attributes):
+    _attributes.update(attributes)
+
+def record(stage, seconds, ok=True, started=None, **attributes):
+    entry = {
+        'stage': stage,
+        'start': (started or datetime.now(timezone.utc)).isoformat(),
+        'seconds': round(seconds, 6),
+        'ok': ok,
+    }
+    entry.update({key: value for key, value in dict(_attributes, **attributes).items() if value is not None})
+    with _lock:
+        _spans.append(entry)
+        if _log_path:
+            with open(_log_path, 'a') as file:
+                file.write(json.dumps(entry) + '\n')
+
+@contextmanager
+def span(stage, **attributes):
+    current = Span(stage, attributes)
+    started = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.ok = False
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, current.ok, started, **current.attributes)
+
+def succeeded(result):
+    # The scripts' helpers return None (or False) on failure
+    return result is not None and result is not False
+
+def timed(stage):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage) as current:
+                result = function(*args, **kwargs)
+                current.ok = succeeded(result)
+                return result
+        return wrapper
+    return decorator
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+def stage_stats():
+    with _lock:
+        durations = {}
+        for entry in _spans:
+            durations.setdefault(entry['stage'], []).append(entry['seconds'])
+
+    order = STAGES + sorted(stage for stage in durations if stage not in STAGES)
+    stats = []
+    for stage in order:
+        values = sorted(durations.get(stage, []))
+        if values:
+            stats.append({'stage': stage, 'count': len(values), 'sum': sum(values),
+                          'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95), 'max': values[-1]})
+    return stats
+
+def print_summary():
+    stats = stage_stats()
+    if not stats:
+        return
+    print("\nTime per stage (seconds):")
+    print(f"  {'stage':<18}{'count':>7}{'p50':>10}{'p95':>10}{'max':>10}{'total':>10}")
+    for s in stats:
+        print(f"  {s['stage']:<18}{s['count']:>7}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['max']:>10.3f}{s['sum']:>10.3f}")
+
+def write_textfile(path, job):
+    # Prometheus node_exporter textfile format; written to a temporary file and
+    # renamed so the collector never reads a partial file
+    stats = stage_stats()
+    lines = [
+        '# HELP kubeflow_users_stage_duration_seconds Time spent in each provisioning stage.',
+        '# TYPE kubeflow_users_stage_duration_seconds summary',
+    ]
+    for s in stats:
+        labels = f'job="{job}",stage="{s["stage"]}"'
+        lines.append(f'kubeflow_users_stage_duration_seconds{{{labels},quantile="0.5"}} {s["p50"]}')
+        lines.append(f'kubeflow_users_stage_duration_seconds{{{labels},quantile="0.95"}} {s["p95"]}')
+        lines.append(f'kubeflow_users_stage_duration_seconds_sum{{{labels}}} {s["sum"]}')
+        lines.append(f'kubeflow_users_stage_duration_seconds_count{{{labels}}} {s["count"]}')
+    lines.append('# HELP kubeflow_users_stage_duration_seconds_max Longest single span of each stage.')
+    lines.append('# TYPE kubeflow_users_stage_duration_seconds_max gauge')
+    for s in stats:
+        lines.append(f'kubeflow_users_stage_duration_seconds_max{{job="{job}",stage="{s["stage"]}"}} {s["max"]}')
+    lines.append('# HELP kubeflow_users_last_run_timestamp_seconds When the last run finished.')
+    lines.append('# TYPE kubeflow_users_last_run_timestamp_seconds gauge')
+    lines.append(f'kubeflow_users_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}')
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, path)
+
+def add_arguments(parser):
+    parser.add_argument('--metrics-log', metavar='FILE',
+                        help="append a JSON line per timed stage (render, apply, Dex, restart, ...) to FILE")
+    parser.add_argument('--metrics-textfile', metavar='FILE',
+                        help="write per-stage timings to FILE in the Prometheus textfile format")
+
+def finish(args, job):
+    print_summary()
+    if args.metrics_textfile:
+        try:
+            write_textfile(args.metrics_textfile, job)
+        except OSError as e:
+            print(f"Error writing metrics to {args.metrics_textfile}: {e}")
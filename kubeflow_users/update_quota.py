@@ -0,0 +1,145 @@
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from kubeflow_users import fanout, throttle, timing
+from kubeflow_users.kube_client import cluster_name, current_context, set_context
+from kubeflow_users.profiles import desired_quota, load_template, patch_profile_quota
+from kubeflow_users.registry import get_active_users, get_class_info, update_class_quota
+from kubeflow_users.roster import QUOTA_FIELDS, normalize_quota
+from kubeflow_users.snapshot import list_items
+
+def changed_leaves(new, marked):
+    if isinstance(new, dict) and isinstance(marked, dict):
+        patch = {key: changed_leaves(value, marked.get(key)) for key, value in new.items()}
+        return {key: value for key, value in patch.items() if value is not None} or None
+    return new if new != marked else None
+
+def quota_patch(class_data, changes):
+    # The parts of the template's resourceQuotaSpec that the changed fields
+    # feed, found by rendering once with the new values and once with
+    # markers. Everything else, including per-user roster overrides of the
+    # other fields, is left alone by the merge patch.
+    user_data = dict(class_data, profile_name=class_data['class_tag'], username=class_data['class_tag'],
+                     user_email=f"{class_data['class_tag']}@paf-iast", password='')
+    new = desired_quota(dict(user_data, **changes))
+    marked = desired_quota(dict(user_data, **{field: f"changed-{field}" for field in changes}))
+    if new is None or marked is None:
+        return None
+    return changed_leaves(new, marked)
+
+def already_applied(current, patch):
+    if isinstance(patch, dict):
+        return isinstance(current, dict) and all(already_applied(current.get(key), value) for key, value in patch.items())
+    return str(current) == str(patch)
+
+def patch_users(usernames, patch, parallel):
+    def patch_user(username):
+        with timing.span('quota_patch', user=username) as span:
+            span.ok = patch_profile_quota(username, patch)
+        return span.ok
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        return dict(zip(usernames, executor.map(patch_user, usernames)))
+
+def update_quotas(args, report):
+    class_tag = args.class_tag
+    class_data = get_class_info(class_tag)
+    if class_data is None:
+        print(f"Error: class {class_tag} is not in the registry.")
+        return
+    changes = {field: getattr(args, field) for field in QUOTA_FIELDS if getattr(args, field) is not None}
+
+    if load_template() is None:
+        return
+    patch = quota_patch(class_data, changes)
+    if patch is None:
+        print(f"The profile template's resourceQuotaSpec does not use {', '.join(changes)}; nothing to update.")
+        return
+    print(f"Quota patch for class {class_tag}: {json.dumps(patch)}")
+
+    usernames = [user['username'] for user in get_active_users(class_tag, cluster_name())]
+    # One list of profiles finds the missing ones and the ones already patched
+    profiles = list_items('Profile', 'profiles.kubeflow.org')
+    if profiles is None:
+        print("Warning: could not list profiles; patching every active user.")
+        pending, missing, unchanged = usernames, [], []
+    else:
+        quotas = {item['metadata']['name']: item.get('spec', {}).get('resourceQuotaSpec') for item in profiles}
+        missing = [username for username in usernames if username not in quotas]
+        unchanged = [username for username in usernames if username in quotas and already_applied(quotas[username], patch)]
+        pending = [username for username in usernames if username in quotas and username not in unchanged]
+    for username in missing:
+        print(f"User {username} has no profile in the cluster; skipping")
+
+    print(f"{len(pending)} profile(s) to update, {len(unchanged)} already up to date, {len(missing)} missing.")
+    if args.dry_run:
+        for username in pending:
+            print(f"  ~ {username}")
+        report['ok'] = True
+        return
+
+    results = patch_users(pending, patch, args.parallel) if pending else {}
+    failed = [username for username, ok in results.items() if not ok]
+    report['updated'] = len(results) - len(failed)
+    report['unchanged'] = len(unchanged)
+    report['failed'] = failed + missing
+    for username in failed:
+        print(f"Failed to update quota for {username}")
+    if failed:
+        # The class record keeps the old values until every profile has the
+        # new ones; running the command again only patches what is left
+        print(f"Quota update for class {class_tag} finished with {len(failed)} failure(s); class record not changed.")
+        return
+
+    update_class_quota(class_tag, changes)
+    report['ok'] = not missing
+    print(f"Quota update for class {class_tag} completed: {report['updated']} profile(s) updated.")
+
+def describe_report(report):
+    return (f"{report.get('updated', 0)} updated, {report.get('unchanged', 0)} unchanged, "
+            f"{len(report.get('failed', []))} failed")
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Change the quotas of every active user of a class in place.")
+    parser.add_argument('--class', dest='class_tag', required=True, help="class whose active users are updated")
+    for field in QUOTA_FIELDS:
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, help=f"new {field.replace('_', ' ')}")
+    parser.add_argument('--parallel', type=int, default=8, help="profiles patched at once (default: 8)")
+    parser.add_argument('--dry-run', action='store_true', help="show the patch and the users it applies to")
+    fanout.add_arguments(parser)
+    throttle.add_arguments(parser)
+    timing.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if all(getattr(args, field) is None for field in QUOTA_FIELDS):
+        parser.error(f"give at least one of {', '.join('--' + field.replace('_', '-') for field in QUOTA_FIELDS)}")
+    for field in QUOTA_FIELDS:
+        if getattr(args, field) is not None:
+            try:
+                setattr(args, field, normalize_quota(field, getattr(args, field)))
+            except ValueError as e:
+                parser.error(str(e))
+    if args.parallel < 1:
+        parser.error("--parallel must be at least 1")
+    return args
+
+def main(argv=None, prog=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv, prog)
+    if args.contexts:
+        results = fanout.run_on_contexts('update-quota', argv, args.contexts, args.report)
+        if not fanout.print_summary(results, describe_report):
+            sys.exit(1)
+        return
+    set_context(args.context)
+    timing.configure(args.metrics_log)
+    throttle.configure(args.api_qps, args.api_burst, args.api_retries)
+    timing.set_attributes(class_tag=args.class_tag)
+    report = {'cluster': current_context(), 'ok': False}
+    try:
+        update_quotas(args, report)
+    finally:
+        timing.finish(args, 'update-quota')
+        fanout.write_report(args.report, report)
+    if not report['ok']:
+        sys.exit(1)
@@ -0,0 +1,32 @@
+import os
+import shutil
+import pytest
+from kubeflow_users import kube_client, paths, registry_db
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(REPO_DIR, 'Bulk-user-creation-deletion', 'manifests', 'create-user-template.yaml')
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # A private data directory with the profile template. No kubeconfig or
+    # API server is reachable, so users are recorded without a cluster
+    # unless a test sets a context.
+    for name in ('KUBE_API_SERVER', 'KUBE_CLIENT', 'KUBERNETES_SERVICE_HOST'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('KUBECONFIG', str(tmp_path / 'no-kubeconfig'))
+    os.makedirs(tmp_path / 'manifests')
+    os.makedirs(tmp_path / 'users')
+    shutil.copy(TEMPLATE, tmp_path / 'manifests')
+    paths.set_data_dir(str(tmp_path))
+    kube_client.set_context(None)
+    yield str(tmp_path)
+    paths.set_data_dir(None)
+    kube_client.set_context(None)
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, data_dir):
+    # Registry tests run against both layouts; creating the database is what
+    # switches the registry to SQLite
+    if request.param == 'sqlite':
+        registry_db.connect()
+    return request.param
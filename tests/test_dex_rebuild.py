@@ -0,0 +1,97 @@
+import pytest
+from kubeflow_users import dex, registry
+from kubeflow_users.dex_passwords import dump_yaml, load_yaml
+
+def login(username):
+    return {'email': f'{username}@paf-iast', 'hash': f'$2b$10$hash-{username}', 'username': username,
+            'userID': f'id-{username}'}
+
+def configmap(entries):
+    config_yaml = dump_yaml({'issuer': 'http://dex.auth.svc.cluster.local:5556/dex', 'staticPasswords': entries})
+    return dump_yaml({'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': {'name': 'dex', 'namespace': 'auth'},
+                      'data': {'config.yaml': config_yaml}})
+
+def static_entries(config):
+    return load_yaml(load_yaml(config)['data']['config.yaml'])['staticPasswords']
+
+class FakeDex:
+    # The live dex ConfigMap, with what was applied and restarted
+    def __init__(self, entries):
+        self.config = configmap(entries)
+        self.applied = []
+        self.restarts = 0
+
+    def get(self):
+        return self.config
+
+    def apply(self, config):
+        self.applied.append(config)
+        self.config = config
+        return 'configured'
+
+    def restart(self, *args):
+        self.restarts += 1
+        return 0.0
+
+@pytest.fixture
+def live(data_dir, monkeypatch):
+    # u1 and u2 are in the registry with their recorded Dex logins
+    for username in ('u1', 'u2'):
+        entry = login(username)
+        registry.add_user(username, entry['email'], None, 'c', dex_login=entry, dex_backend='configmap')
+    fake = FakeDex([login('u1'), login('u2')])
+    monkeypatch.setattr(dex, 'get_dex_config', fake.get)
+    monkeypatch.setattr(dex, 'apply_dex_config', fake.apply)
+    monkeypatch.setattr(dex, 'restart_dex', fake.restart)
+    return fake
+
+def write_base(data_dir, entries):
+    path = f'{data_dir}/base.yaml'
+    with open(path, 'w') as file:
+        file.write(configmap(entries))
+    return path
+
+def test_check_in_sync(live):
+    assert dex.rebuild_static_passwords(check=True)
+    assert live.applied == []
+
+def test_check_reports_drift_without_changing_anything(live):
+    live.config = configmap([login('u1')])
+    assert not dex.rebuild_static_passwords(check=True)
+    assert live.applied == []
+    assert live.restarts == 0
+
+def test_check_with_base_compares_with_the_live_config(live, data_dir):
+    # The saved copy is stale, but the live config matches the registry
+    base = write_base(data_dir, [login('u1')])
+    assert dex.rebuild_static_passwords(base=base, check=True)
+
+    live.config = configmap([login('u2')])
+    base = write_base(data_dir, [login('u1'), login('u2')])
+    assert not dex.rebuild_static_passwords(base=base, check=True)
+    assert live.applied == []
+
+def test_rebuild_restores_missing_logins(live):
+    live.config = configmap([login('u2')])
+    assert dex.rebuild_static_passwords()
+    assert live.restarts == 1
+    # Restored from the recorded hash and userID, nothing hashed again
+    assert sorted(static_entries(live.config), key=lambda entry: entry['username']) == [login('u1'), login('u2')]
+
+def test_rebuild_in_sync_changes_nothing(live):
+    assert dex.rebuild_static_passwords()
+    assert live.applied == []
+    assert live.restarts == 0
+
+def test_unknown_entries_are_kept_unless_pruned(live):
+    admin = login('admin')
+    live.config = configmap([login('u1'), admin, login('u2')])
+    assert dex.rebuild_static_passwords(check=True)
+
+    assert dex.rebuild_static_passwords(prune=True)
+    assert static_entries(live.config) == [login('u1'), login('u2')]
+
+def test_deleted_users_are_left_out(live):
+    registry.mark_user_deleted('u2')
+    assert dex.rebuild_static_passwords(prune=True)
+    assert static_entries(live.config) == [login('u1')]
@@ -0,0 +1,90 @@
+import pytest
+from kubeflow_users.bulk import build_user_data
+from kubeflow_users.dex_passwords import StaticPasswordIndex
+from kubeflow_users.profiles import desired_quota
+from kubeflow_users.reconcile import compute_plan, plan_is_empty
+
+SPEC = {'class_name': 'Class', 'class_tag': 'c', 'num_users': 3, 'cpu_limit': '1', 'memory_limit': '2Gi',
+        'gpu_mem': '0', 'gpu_count': '0', 'storage_limit': '5Gi'}
+
+def profile(username, spec=SPEC):
+    index = int(username.rsplit('-', 1)[1])
+    return {'metadata': {'name': username}, 'spec': {'resourceQuotaSpec': desired_quota(build_user_data(spec, index))}}
+
+def dex_entry(username):
+    return {'email': f'{username}@paf-iast', 'hash': f'hash-{username}', 'username': username, 'userID': f'id-{username}'}
+
+def registered(username, **fields):
+    return dict({'username': username, 'email': f'{username}@paf-iast', 'password': None,
+                 'dex_hash': f'hash-{username}', 'dex_user_id': f'id-{username}'}, **fields)
+
+def in_sync(spec=SPEC):
+    names = [f"c-{i}" for i in range(1, spec['num_users'] + 1)]
+    return ([profile(name) for name in names], StaticPasswordIndex([dex_entry(name) for name in names]),
+            [registered(name) for name in names])
+
+@pytest.fixture(autouse=True)
+def template(data_dir):
+    # desired_quota() renders the profile template from the data directory
+    return data_dir
+
+def names(users):
+    return [user_data['username'] for user_data in users]
+
+def test_new_class_creates_every_user():
+    plan = compute_plan(SPEC, [], StaticPasswordIndex([]), [])
+    assert names(plan['create']) == ['c-1', 'c-2', 'c-3']
+    assert all(user_data['password'] for user_data in plan['create'])
+    assert not any(plan[key] for key in ('update_quota', 'add_dex', 'adopt', 'delete'))
+
+def test_class_in_sync_has_an_empty_plan():
+    plan = compute_plan(SPEC, *in_sync())
+    assert plan_is_empty(plan, class_changed=False)
+    assert not plan_is_empty(plan, class_changed=True)
+
+def test_growing_the_class_only_creates_the_new_users():
+    plan = compute_plan(dict(SPEC, num_users=5), *in_sync())
+    assert names(plan['create']) == ['c-4', 'c-5']
+    assert not any(plan[key] for key in ('update_quota', 'add_dex', 'adopt', 'delete'))
+
+def test_shrinking_the_class_deletes_in_numeric_order():
+    profiles, dex_index, registry_users = in_sync(dict(SPEC, num_users=10))
+    registry_users.append(registered('c-11'))
+    plan = compute_plan(dict(SPEC, num_users=2), profiles, dex_index, registry_users)
+    assert plan['delete'] == ['c-3', 'c-4', 'c-5', 'c-6', 'c-7', 'c-8', 'c-9', 'c-10', 'c-11']
+    assert plan['create'] == []
+
+def test_other_classes_are_not_deleted():
+    profiles, dex_index, registry_users = in_sync()
+    profiles.append({'metadata': {'name': 'c-extra'}, 'spec': {}})
+    profiles.append({'metadata': {'name': 'cs101-1'}, 'spec': {}})
+    assert compute_plan(SPEC, profiles, dex_index, registry_users)['delete'] == []
+
+def test_changed_quota_is_updated():
+    profiles, dex_index, registry_users = in_sync()
+    plan = compute_plan(dict(SPEC, cpu_limit='2'), profiles, dex_index, registry_users)
+    assert names(plan['update_quota']) == ['c-1', 'c-2', 'c-3']
+    assert plan['create'] == []
+
+def test_missing_dex_entry_reuses_the_recorded_hash():
+    profiles, _, registry_users = in_sync()
+    dex_index = StaticPasswordIndex([dex_entry('c-1'), dex_entry('c-3')])
+    plan = compute_plan(SPEC, profiles, dex_index, registry_users)
+    assert names(plan['add_dex']) == ['c-2']
+    user_data = plan['add_dex'][0]
+    # Nothing to hash: the recorded login is restored as it was
+    assert user_data['password'] is None
+    assert (user_data['dex_hash'], user_data['dex_user_id']) == ('hash-c-2', 'id-c-2')
+
+def test_stored_password_is_kept_without_a_recorded_hash():
+    profiles, _, registry_users = in_sync()
+    registry_users[1] = registered('c-2', password='kept', dex_hash=None, dex_user_id=None)
+    plan = compute_plan(SPEC, profiles, StaticPasswordIndex([dex_entry('c-1'), dex_entry('c-3')]), registry_users)
+    assert names(plan['add_dex']) == ['c-2']
+    assert plan['add_dex'][0]['password'] == 'kept'
+
+def test_profile_missing_from_the_registry_is_adopted():
+    profiles, dex_index, registry_users = in_sync()
+    plan = compute_plan(SPEC, profiles, dex_index, registry_users[:2])
+    assert names(plan['adopt']) == ['c-3']
+    assert plan['create'] == []
@@ -0,0 +1,117 @@
+import os
+from kubeflow_users import paths, registry, registry_db
+
+LOGIN = {'hash': '$2b$10$hash', 'userID': 'id-1'}
+
+def usernames(class_tag='c', cluster=None):
+    return sorted(registry.get_users_by_class(class_tag, cluster))
+
+def test_backend_follows_the_database_file(backend):
+    assert registry.use_sqlite() == (backend == 'sqlite')
+
+def test_add_user_again_updates_its_record(backend):
+    registry.add_user('u1', 'u1@example.com', 'pw', 'c', cluster='a', dex_login=LOGIN, dex_backend='configmap')
+    created = registry.get_active_users('c', 'a')[0]['creation_time']
+
+    registry.add_user('u1', 'u1@example.org', None, 'c', cluster='a')
+    users = registry.get_active_users('c', 'a')
+    assert len(users) == 1
+    assert users[0]['email'] == 'u1@example.org'
+    assert users[0]['creation_time'] == created
+    # No new login was given, so the recorded one stays
+    assert (users[0]['dex_backend'], users[0]['dex_hash'], users[0]['dex_user_id']) == ('configmap', LOGIN['hash'], 'id-1')
+
+def test_mark_user_deleted(backend):
+    registry.add_user('u1', 'u1@example.com', None, 'c')
+    assert registry.mark_user_deleted('u1')
+    assert not registry.mark_user_deleted('u1')
+    assert not registry.mark_user_deleted('ghost')
+    assert usernames() == []
+
+def test_clusters_are_kept_apart(backend):
+    registry.add_user('u1', 'u1@example.com', None, 'c', cluster='a')
+    registry.add_user('u1', 'u1@example.com', None, 'c', cluster='b')
+
+    assert registry.mark_user_deleted('u1', 'a')
+    assert usernames(cluster='a') == []
+    assert usernames(cluster='b') == ['u1']
+
+def test_no_cluster_is_not_a_wildcard(backend):
+    registry.add_user('u1', 'u1@example.com', None, 'c', cluster='a')
+
+    assert usernames() == []
+    assert not registry.mark_user_deleted('u1')
+    assert usernames(cluster='a') == ['u1']
+
+def test_legacy_record_stands_in_until_the_cluster_has_its_own(backend):
+    registry.add_user('u1', 'u1@example.com', None, 'c')
+    registry.add_user('u2', 'u2@example.com', None, 'c')
+    registry.add_user('u1', 'u1@example.com', None, 'c', cluster='a')
+
+    # u1 is listed once, from its own record
+    assert usernames(cluster='a') == ['u1', 'u2']
+    assert [user['cluster'] for user in registry.get_active_users('c', 'a') if user['username'] == 'u1'] == ['a']
+
+    # Deleting u1 on the cluster leaves the legacy record alone, and it does
+    # not come back as the cluster's user
+    assert registry.mark_user_deleted('u1', 'a')
+    assert usernames(cluster='a') == ['u2']
+    assert usernames() == ['u1', 'u2']
+
+def test_record_dex_logins_only_updates_the_cluster(backend):
+    registry.add_user('u1', 'u1@example.com', None, 'c', cluster='a')
+    registry.add_user('u1', 'u1@example.com', None, 'c', cluster='b')
+
+    registry.record_dex_logins([dict(LOGIN, username='u1'), None], 'crd', 'a')
+    by_cluster = {user['cluster']: user for user in registry.get_all_active_users('a') + registry.get_all_active_users('b')}
+    assert (by_cluster['a']['dex_backend'], by_cluster['a']['dex_hash']) == ('crd', LOGIN['hash'])
+    assert (by_cluster['b']['dex_backend'], by_cluster['b']['dex_hash']) == (None, None)
+
+def test_update_class_quota(backend):
+    registry.add_class('Class', 'c', 2, '1', '2Gi', '0', '0', '5Gi')
+    assert registry.update_class_quota('c', {'cpu_limit': '4'})
+    assert not registry.update_class_quota('missing', {'cpu_limit': '4'})
+    assert registry.get_class_info('c')['cpu_limit'] == '4'
+
+def test_batch_reads_its_own_updates(backend):
+    with registry.batch():
+        for i in range(3):
+            registry.add_user(f'u{i}', f'u{i}@example.com', None, 'c')
+        registry.mark_user_deleted('u0')
+        assert usernames() == ['u1', 'u2']
+    assert usernames() == ['u1', 'u2']
+
+def test_json_batch_writes_once(data_dir, monkeypatch):
+    writes = []
+    write_registry = registry.write_registry
+    monkeypatch.setattr(registry, 'write_registry', lambda data: writes.append(1) or write_registry(data))
+    with registry.batch():
+        for i in range(5):
+            registry.add_user(f'u{i}', f'u{i}@example.com', None, 'c')
+    assert len(writes) == 1
+    assert not os.path.exists(paths.registry_file() + '.tmp')
+
+def test_json_and_sqlite_agree(tmp_path, data_dir):
+    def run():
+        registry.add_class('Class', 'c', 3, '1', '2Gi', '0', '0', '5Gi')
+        registry.add_user('legacy', 'legacy@example.com', None, 'c')
+        with registry.batch():
+            for i in range(3):
+                registry.add_user(f'u{i}', f'u{i}@example.com', None, 'c', cluster='a')
+            registry.add_user('u0', 'u0@example.com', None, 'c', cluster='b')
+        registry.record_dex_logins([dict(LOGIN, username='u1')], 'configmap', 'a')
+        registry.mark_user_deleted('u2', 'a')
+        registry.add_user('u1', 'new@example.com', None, 'c', cluster='a')
+        return {cluster: [{field: user.get(field) for field in registry_db.USER_FIELDS if not field.endswith('_time')}
+                          for user in sorted(registry.get_all_active_users(cluster), key=lambda user: user['username'])]
+                for cluster in (None, 'a', 'b')}
+
+    results = {}
+    for backend in ('json', 'sqlite'):
+        paths.set_data_dir(str(tmp_path / backend))
+        os.makedirs(tmp_path / backend / 'users')
+        if backend == 'sqlite':
+            registry_db.connect()
+        results[backend] = run()
+    assert results['json'] == results['sqlite']
+    assert [user['username'] for user in results['json']['a']] == ['legacy', 'u0', 'u1']
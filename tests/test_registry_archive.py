@@ -0,0 +1,53 @@
+from kubeflow_users import registry, registry_archive
+
+def setup_classes():
+    registry.add_class('Done', 'done', 2, '1', '2Gi', '0', '0', '5Gi')
+    registry.add_class('Running', 'running', 2, '1', '2Gi', '0', '0', '5Gi')
+    for username, class_tag in (('done-1', 'done'), ('done-2', 'done'), ('running-1', 'running'), ('running-2', 'running')):
+        registry.add_user(username, f'{username}@paf-iast', None, class_tag)
+    for username in ('done-1', 'done-2', 'running-2'):
+        registry.mark_user_deleted(username)
+
+def test_semesters():
+    assert registry_archive.semester('2026-01-15T10:00:00') == '2026-spring'
+    assert registry_archive.semester('2026-06-01T00:00:00') == '2026-summer'
+    assert registry_archive.semester('2026-12-31T23:59:59') == '2026-fall'
+
+def test_compact_moves_deleted_users_and_finished_classes(backend):
+    setup_classes()
+    archived, finished = registry_archive.compact()
+    assert sorted(user['username'] for user in archived) == ['done-1', 'done-2', 'running-2']
+    assert finished == ['done']
+
+    assert registry.get_class_info('done') is None
+    assert registry.get_class_info('running') is not None
+    assert registry.get_users_by_class('running') == ['running-1']
+
+    records = list(registry_archive.search_archive(class_tag='done'))
+    assert sorted((record['record'], record.get('username')) for record in records) == [
+        ('class', None), ('user', 'done-1'), ('user', 'done-2')]
+    assert [record['username'] for record in registry_archive.search_archive(username='running-2')] == ['running-2']
+
+def test_dry_run_changes_nothing(backend):
+    setup_classes()
+    archived, finished = registry_archive.compact(dry_run=True)
+    assert len(archived) == 3 and finished == ['done']
+    assert registry_archive.list_segments() == {}
+    assert registry.get_class_info('done') is not None
+
+def test_older_than_keeps_recent_deletions(backend):
+    setup_classes()
+    assert registry_archive.compact(older_than_days=30) == ([], [])
+
+def test_compactions_append_to_the_segment(backend):
+    setup_classes()
+    registry_archive.compact()
+    registry.mark_user_deleted('running-1')
+    registry_archive.compact()
+
+    segments = registry_archive.list_segments()
+    assert len(segments) == 1
+    entry = next(iter(segments.values()))
+    assert (entry['users'], entry['classes']) == (4, 2)
+    assert sorted(record['username'] for record in registry_archive.search_archive(record='user')) == [
+        'done-1', 'done-2', 'running-1', 'running-2']
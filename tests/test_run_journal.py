@@ -0,0 +1,52 @@
+import os
+import pytest
+from kubeflow_users.run_journal import RunJournal, journal_path, new_run_id
+
+CLASS_DATA = {'class_name': 'Class', 'class_tag': 'c', 'num_users': 2}
+
+def test_run_ids_include_the_context():
+    assert new_run_id('c').endswith('-c')
+    assert new_run_id('c', 'lab/a').endswith('-c-lab_a')
+
+def test_resume_restores_users_and_steps(data_dir):
+    with RunJournal.create('run-1', CLASS_DATA) as journal:
+        journal.record_user({'username': 'c-1', 'password': 'pw1'})
+        journal.record_user({'username': 'c-2', 'password': 'pw2'})
+        journal.record_step('class')
+        journal.record_step('profile', 'c-1')
+
+    journal = RunJournal.resume('run-1')
+    with journal:
+        assert journal.class_data == CLASS_DATA
+        assert journal.users['c-2']['password'] == 'pw2'
+        assert journal.completed('class')
+        assert journal.completed('profile', 'c-1')
+        assert not journal.completed('profile', 'c-2')
+    # The journal holds passwords
+    assert os.stat(journal_path('run-1')).st_mode & 0o777 == 0o600
+
+def test_resume_drops_a_torn_last_line(data_dir):
+    with RunJournal.create('run-1', CLASS_DATA) as journal:
+        journal.record_step('profile', 'c-1')
+    with open(journal_path('run-1'), 'a') as file:
+        file.write('{"type": "step", "step": "prof')
+
+    with RunJournal.resume('run-1') as journal:
+        assert journal.completed('profile', 'c-1')
+        journal.record_step('profile', 'c-2')
+
+    journal = RunJournal.resume('run-1')
+    journal.close()
+    assert journal.completed('profile', 'c-2')
+
+def test_run_cannot_be_created_twice(data_dir):
+    RunJournal.create('run-1', CLASS_DATA).close()
+    with pytest.raises(FileExistsError):
+        RunJournal.create('run-1', CLASS_DATA)
+
+def test_resume_rejects_other_files(data_dir):
+    os.makedirs(os.path.dirname(journal_path('run-1')), exist_ok=True)
+    with open(journal_path('run-1'), 'w') as file:
+        file.write('{"type": "user"}\n')
+    with pytest.raises(ValueError):
+        RunJournal.resume('run-1')
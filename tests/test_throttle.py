@@ -0,0 +1,83 @@
+import argparse
+import pytest
+from kubeflow_users import throttle
+
+class StatusError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(throttle.time, 'sleep', sleeps.append)
+    throttle.configure(retries=3)
+    yield sleeps
+    throttle.configure()
+
+def failing(errors, result='ok'):
+    # Raises the given errors in turn, then returns result
+    calls = []
+    def call():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return call, calls
+
+def test_retryable_errors():
+    assert throttle.is_retryable(StatusError(429))
+    assert throttle.is_retryable(StatusError(503))
+    assert throttle.is_retryable(ConnectionResetError())
+    assert not throttle.is_retryable(StatusError(404))
+    assert not throttle.is_retryable(ValueError())
+
+def test_retryable_kubectl_output():
+    assert throttle.is_retryable_output(1, 'Error from server (TooManyRequests): the server has received too many requests')
+    assert throttle.is_retryable_output(None, '')
+    assert not throttle.is_retryable_output(1, 'Error from server (NotFound): profiles "x" not found')
+
+def test_call_retries_until_it_succeeds(no_sleep):
+    call, calls = failing([StatusError(429), StatusError(503)])
+    assert throttle.call(call, 'get') == 'ok'
+    assert len(calls) == 3
+    assert len(no_sleep) == 2
+
+def test_call_gives_up_after_the_retries():
+    call, calls = failing([StatusError(429)] * 10)
+    with pytest.raises(StatusError):
+        throttle.call(call, 'get')
+    assert len(calls) == 4
+
+def test_other_errors_are_not_retried(no_sleep):
+    call, calls = failing([StatusError(404)])
+    with pytest.raises(StatusError):
+        throttle.call(call, 'get')
+    assert len(calls) == 1
+    assert no_sleep == []
+
+def test_backoff_honours_retry_after():
+    assert throttle.backoff(0, retry_after=7) >= 7
+    assert throttle.backoff(0, retry_after=3600) == throttle.MAX_DELAY
+    assert throttle.backoff(3) is None
+
+def test_token_bucket_waits_once_the_burst_is_used(no_sleep):
+    bucket = throttle.TokenBucket(10, 2)
+    for _ in range(3):
+        bucket.acquire()
+    assert len(no_sleep) == 1
+    assert 0 < no_sleep[0] <= 0.1
+
+def test_limit_halves_when_throttled_and_grows_back():
+    limit = throttle.AdaptiveLimit(8)
+    limit.throttled()
+    assert limit.limit == 4
+    for _ in range(4):
+        limit.succeeded()
+    assert limit.limit == 5
+
+def test_negative_arguments_are_rejected():
+    with pytest.raises(argparse.ArgumentTypeError):
+        throttle.non_negative(int)('-1')
+    assert throttle.non_negative(float)('0') == 0
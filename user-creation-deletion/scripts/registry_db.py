@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Kept so existing `python3 registry_db.py` invocations keep working; the code
+# lives in the kubeflow_users package at the top of the repository
+TREE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TREE_DIR))
+
+from kubeflow_users.cli import main
+
+if __name__ == "__main__":
+    main(['--data-dir', TREE_DIR, 'registry'] + sys.argv[1:])